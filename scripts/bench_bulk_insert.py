@@ -0,0 +1,111 @@
+"""
+批量写入基准测试
+
+比较 ORM 逐行 add/flush、bulk_insert、bulk_upsert 与 copy_insert（仅PostgreSQL）
+每秒写入的行数。
+
+用法: python scripts/bench_bulk_insert.py [--url URL] [--rows N]
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import Column, String  # noqa: E402
+from sqlalchemy.ext.asyncio import (  # noqa: E402
+    AsyncSession, async_sessionmaker, create_async_engine,
+)
+
+from src.core.config import settings  # noqa: E402
+from src.core.database import Base  # noqa: E402
+from src.models.base import BaseModelMixin  # noqa: E402
+
+
+class BenchItem(Base, BaseModelMixin):
+    """基准测试用表"""
+    
+    __tablename__ = "bench_item"
+    
+    name = Column(String(64), nullable=False)
+    payload = Column(String(256), nullable=True)
+
+
+def make_rows(count: int, offset: int = 0) -> list:
+    return [
+        {"name": f"item-{offset + i}", "payload": "x" * 128}
+        for i in range(count)
+    ]
+
+
+async def orm_add_flush(session: AsyncSession, rows: list) -> None:
+    """当前做法：逐个ORM对象 add 后 flush"""
+    for row in rows:
+        session.add(BenchItem(**row))
+        await session.flush()
+
+
+async def bulk_insert(session: AsyncSession, rows: list) -> None:
+    await BenchItem.bulk_insert(session, rows)
+
+
+async def bulk_insert_returning(session: AsyncSession, rows: list) -> None:
+    await BenchItem.bulk_insert(session, rows, return_ids=True)
+
+
+async def bulk_upsert(session: AsyncSession, rows: list) -> None:
+    await BenchItem.bulk_upsert(session, rows)
+
+
+async def copy_insert(session: AsyncSession, rows: list) -> None:
+    await BenchItem.copy_insert(session, rows)
+
+
+async def run(url: str, count: int) -> None:
+    engine = create_async_engine(url)
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(BenchItem.__table__.drop, checkfirst=True)
+        await conn.run_sync(BenchItem.__table__.create)
+    
+    cases = [
+        ("orm add/flush", orm_add_flush),
+        ("bulk_insert", bulk_insert),
+        ("bulk_insert+ids", bulk_insert_returning),
+        ("bulk_upsert", bulk_upsert),
+    ]
+    if engine.dialect.driver == "asyncpg":
+        cases.append(("copy_insert", copy_insert))
+    
+    print(f"{'method':<18}{'rows':>10}{'seconds':>10}{'rows/s':>12}")
+    for index, (name, func) in enumerate(cases):
+        rows = make_rows(count, offset=index * count)
+        async with session_factory() as session:
+            start = time.perf_counter()
+            await func(session, rows)
+            await session.commit()
+            elapsed = time.perf_counter() - start
+        print(f"{name:<18}{count:>10,}{elapsed:>10.3f}{count / elapsed:>12,.0f}")
+    
+    async with engine.begin() as conn:
+        await conn.run_sync(BenchItem.__table__.drop)
+    await engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--url",
+        default=settings.database.url.replace("postgresql://", "postgresql+asyncpg://"),
+        help="异步数据库URL，默认取 DATABASE_URL",
+    )
+    parser.add_argument("--rows", type=int, default=10000)
+    options = parser.parse_args()
+    asyncio.run(run(options.url, options.rows))
+
+
+if __name__ == "__main__":
+    main() 
\ No newline at end of file
@@ -0,0 +1,103 @@
+"""
+缓存编解码基准测试
+
+比较各编解码器和压缩算法的编码/解码吞吐量与存储字节数。
+
+用法: python scripts/bench_codecs.py [--iterations N]
+"""
+
+import argparse
+import json
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.core.codecs import CacheSerializer  # noqa: E402
+
+
+def build_payloads() -> dict:
+    """构造小、中、大三种典型缓存值"""
+    now = datetime(2024, 1, 1)
+    small = {"id": 42, "name": "alice", "active": True, "score": 98.5}
+    medium = {
+        "items": [
+            {
+                "id": i,
+                "title": f"document {i}",
+                "tags": ["llm", "cache", "redis"],
+                "created_at": (now + timedelta(minutes=i)).isoformat(),
+            }
+            for i in range(50)
+        ]
+    }
+    large = {
+        "messages": [
+            {
+                "role": "assistant" if i % 2 else "user",
+                "content": "这是一段用于测试压缩效果的对话内容。" * 20,
+                "tokens": i * 17,
+            }
+            for i in range(200)
+        ]
+    }
+    return {"small": small, "medium": medium, "large": large}
+
+
+def legacy_dumps(value: object) -> bytes:
+    """当前默认的JSON文本编码"""
+    return json.dumps(value, ensure_ascii=False).encode("utf-8")
+
+
+def bench(encode, decode, value: object, iterations: int) -> tuple:
+    """返回 (编码次数/秒, 解码次数/秒, 字节数)"""
+    data = encode(value)
+    
+    start = time.perf_counter()
+    for _ in range(iterations):
+        encode(value)
+    encode_rate = iterations / (time.perf_counter() - start)
+    
+    start = time.perf_counter()
+    for _ in range(iterations):
+        decode(data)
+    decode_rate = iterations / (time.perf_counter() - start)
+    
+    return encode_rate, decode_rate, len(data)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=2000)
+    options = parser.parse_args()
+    
+    candidates = [("json (legacy)", legacy_dumps, json.loads)]
+    for codec in ("orjson", "msgpack", "pickle"):
+        for compression in (None, "zlib", "zstd", "lz4"):
+            try:
+                serializer = CacheSerializer(
+                    codec=codec,
+                    compression=compression,
+                    allow_pickle=True,
+                    secret_key="benchmark",
+                )
+            except RuntimeError as e:
+                print(f"skip {codec}+{compression}: {e}")
+                continue
+            name = codec if compression is None else f"{codec}+{compression}"
+            candidates.append((name, serializer.dumps, serializer.loads))
+    
+    for payload_name, value in build_payloads().items():
+        print(f"\n[{payload_name}]")
+        print(f"{'codec':<18}{'encode/s':>12}{'decode/s':>12}{'bytes':>10}")
+        for name, encode, decode in candidates:
+            encode_rate, decode_rate, size = bench(
+                encode, decode, value, options.iterations
+            )
+            print(f"{name:<18}{encode_rate:>12,.0f}{decode_rate:>12,.0f}{size:>10,}")
+
+
+if __name__ == "__main__":
+    main() 
\ No newline at end of file
@@ -0,0 +1,83 @@
+"""
+令牌验证基准测试
+
+比较 HS256 与 RS256 令牌在关闭和开启已验证令牌缓存时 verify_token 的单次耗时。
+同一令牌重复验证，对应客户端在有效期内复用令牌的常见情况。
+
+用法: python scripts/bench_jwt.py [--iterations N]
+"""
+
+import argparse
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from cryptography.hazmat.primitives import serialization  # noqa: E402
+from cryptography.hazmat.primitives.asymmetric import rsa  # noqa: E402
+from jose import jwt  # noqa: E402
+
+from src.core import security  # noqa: E402
+from src.core.cache import LocalCache  # noqa: E402
+from src.core.config import settings  # noqa: E402
+
+
+def rsa_keys():
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private_pem = private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    ).decode()
+    public_pem = private_key.public_key().public_bytes(
+        serialization.Encoding.PEM,
+        serialization.PublicFormat.SubjectPublicKeyInfo,
+    ).decode()
+    return private_pem, public_pem
+
+
+def measure(iterations: int, token: str) -> float:
+    """返回单次 verify_token 的平均微秒数"""
+    assert security.verify_token(token) is not None
+    start = time.perf_counter()
+    for _ in range(iterations):
+        security.verify_token(token)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=5000)
+    options = parser.parse_args()
+    
+    claims = {"sub": "user-1", "exp": datetime.utcnow() + timedelta(hours=1)}
+    private_pem, public_pem = rsa_keys()
+    hs_secret = "bench-secret"
+    cases = (
+        ("HS256", jwt.encode(claims, hs_secret, algorithm="HS256"), hs_secret),
+        ("RS256", jwt.encode(claims, private_pem, algorithm="RS256"), public_pem),
+    )
+    
+    print(f"{'algorithm':<12}{'no cache':>14}{'cached':>14}{'speedup':>10}")
+    for algorithm, token, verify_key in cases:
+        settings.jwt.algorithm = algorithm
+        settings.jwt.secret_key = verify_key
+        
+        security.token_cache = None
+        uncached = measure(options.iterations, token)
+        
+        security.token_cache = LocalCache(
+            max_items=settings.jwt.token_cache_size, ttl=settings.jwt.token_cache_ttl
+        )
+        cached = measure(options.iterations, token)
+        
+        print(
+            f"{algorithm:<12}{uncached:>12.1f}us{cached:>12.1f}us"
+            f"{uncached / cached:>9.0f}x"
+        )
+
+
+if __name__ == "__main__":
+    main() 
\ No newline at end of file
@@ -0,0 +1,117 @@
+"""
+请求中间件基准测试
+
+在进程内通过ASGI直接驱动一个空端点，比较旧的两个 @app.middleware("http")
+函数（BaseHTTPMiddleware）与 RequestMetricsMiddleware 的每秒请求数，
+排除网络与服务器的干扰，只衡量中间件本身的开销。
+
+用法: python scripts/bench_middleware.py [--requests N] [--concurrency C]
+"""
+
+import argparse
+import asyncio
+import logging
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import httpx  # noqa: E402
+from fastapi import FastAPI, Request  # noqa: E402
+from fastapi.responses import PlainTextResponse  # noqa: E402
+
+from src.core.logging import get_logger  # noqa: E402
+from src.core.metrics import (  # noqa: E402
+    REQUEST_COUNT, REQUEST_LATENCY, RequestMetricsMiddleware,
+)
+
+
+def build_app(mode: str) -> FastAPI:
+    app = FastAPI()
+    
+    @app.get("/ping", response_class=PlainTextResponse)
+    async def ping():
+        return "pong"
+    
+    if mode == "none":
+        return app
+    
+    if mode == "asgi":
+        app.add_middleware(RequestMetricsMiddleware)
+        return app
+    
+    # 旧实现：两个 BaseHTTPMiddleware
+    logger = get_logger("request")
+    
+    @app.middleware("http")
+    async def metrics_middleware(request: Request, call_next):
+        start_time = asyncio.get_event_loop().time()
+        response = await call_next(request)
+        duration = asyncio.get_event_loop().time() - start_time
+        REQUEST_COUNT.labels(
+            method=request.method, endpoint=request.url.path, status=response.status_code
+        ).inc()
+        REQUEST_LATENCY.labels(
+            method=request.method, endpoint=request.url.path
+        ).observe(duration)
+        return response
+    
+    @app.middleware("http")
+    async def logging_middleware(request: Request, call_next):
+        logger.info("Request started", method=request.method, path=request.url.path)
+        response = await call_next(request)
+        logger.info(
+            "Request completed",
+            method=request.method,
+            path=request.url.path,
+            status_code=response.status_code,
+        )
+        return response
+    
+    return app
+
+
+async def measure(app: FastAPI, total: int, concurrency: int) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        # 预热
+        for _ in range(50):
+            await client.get("/ping")
+        
+        remaining = total
+        
+        async def worker():
+            nonlocal remaining
+            while remaining > 0:
+                remaining -= 1
+                await client.get("/ping")
+        
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return total / (time.perf_counter() - start)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=10)
+    options = parser.parse_args()
+    
+    # 日志输出到终端会淹没中间件本身的开销
+    logging.disable(logging.CRITICAL)
+    
+    print(f"{'middleware':<28}{'req/s':>10}")
+    baseline = None
+    for mode, label in (
+        ("none", "no middleware"),
+        ("http", "before: 2x @app.middleware"),
+        ("asgi", "after: RequestMetrics (ASGI)"),
+    ):
+        rps = asyncio.run(measure(build_app(mode), options.requests, options.concurrency))
+        baseline = baseline or rps
+        print(f"{label:<28}{rps:>10,.0f}  ({rps / baseline:.0%} of bare app)")
+
+
+if __name__ == "__main__":
+    main() 
\ No newline at end of file
@@ -0,0 +1,101 @@
+"""
+登录突发负载测试
+
+在进程内通过ASGI驱动一个模拟登录端点（bcrypt 校验密码）和一个空端点 /ping：
+并发发起一批登录请求，同时按固定间隔请求 /ping，比较在事件循环中直接调用
+verify_password 与使用线程池的 verify_password_async 时 /ping 的延迟
+（从计划发出时刻到收到响应）。
+
+用法: python scripts/bench_password_hash.py [--logins N] [--rounds R]
+"""
+
+import argparse
+import asyncio
+import logging
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import httpx  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+from fastapi.responses import PlainTextResponse  # noqa: E402
+from passlib.context import CryptContext  # noqa: E402
+
+from src.core import security  # noqa: E402
+
+
+def build_app(mode: str, hashed: str) -> FastAPI:
+    app = FastAPI()
+    
+    @app.get("/ping", response_class=PlainTextResponse)
+    async def ping():
+        return "pong"
+    
+    @app.post("/login")
+    async def login():
+        if mode == "sync":
+            ok = security.verify_password("correct horse", hashed)
+        else:
+            ok = await security.verify_password_async("correct horse", hashed)
+        return {"ok": ok}
+    
+    return app
+
+
+async def measure(app: FastAPI, logins: int, interval: float):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await client.get("/ping")
+        done = False
+        ping_latencies = []
+        
+        async def pinger():
+            # 延迟从计划发出的时刻算起，事件循环被阻塞的时间也计算在内
+            while not done:
+                scheduled = time.perf_counter() + interval
+                await asyncio.sleep(interval)
+                await client.get("/ping")
+                ping_latencies.append(time.perf_counter() - scheduled)
+        
+        ping_task = asyncio.create_task(pinger())
+        await asyncio.sleep(0)
+        start = time.perf_counter()
+        await asyncio.gather(*(client.post("/login") for _ in range(logins)))
+        elapsed = time.perf_counter() - start
+        done = True
+        await ping_task
+    return elapsed, ping_latencies
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--logins", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=12)
+    parser.add_argument("--interval", type=float, default=0.01)
+    options = parser.parse_args()
+    
+    logging.disable(logging.CRITICAL)
+    context = CryptContext(schemes=["bcrypt"], bcrypt__rounds=options.rounds)
+    security.pwd_context = context
+    hashed = context.hash("correct horse")
+    
+    print(f"{'mode':<24}{'logins/s':>10}{'pings':>8}{'ping p50':>11}{'ping p99':>11}{'ping max':>11}")
+    for mode, label in (("sync", "before: verify_password"), ("async", "after: thread pool")):
+        elapsed, pings = asyncio.run(
+            measure(build_app(mode, hashed), options.logins, options.interval)
+        )
+        pings.sort()
+        p99 = pings[min(len(pings) - 1, int(len(pings) * 0.99))]
+        print(
+            f"{label:<24}{options.logins / elapsed:>10.1f}{len(pings):>8}"
+            f"{statistics.median(pings) * 1000:>9.1f}ms{p99 * 1000:>9.1f}ms"
+            f"{pings[-1] * 1000:>9.1f}ms"
+        )
+    security.password_hasher.shutdown()
+
+
+if __name__ == "__main__":
+    main() 
\ No newline at end of file
@@ -7,11 +7,9 @@
 from datetime import datetime
 from typing import Dict, Any
 
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+from fastapi import APIRouter
 
-from ....core.database import get_db
-from ....core.cache import cache
+from ....core.health import health_checker
 from ....core.logging import get_logger
 
 router = APIRouter()
@@ -29,42 +27,15 @@ async def health_check() -> Dict[str, Any]:
 
 
 @router.get("/health/detailed")
-async def detailed_health_check(db: Session = Depends(get_db)) -> Dict[str, Any]:
-    """详细健康检查端点"""
-    health_status = {
-        "status": "healthy",
-        "timestamp": datetime.utcnow().isoformat(),
+async def detailed_health_check() -> Dict[str, Any]:
+    """详细健康检查端点
+    
+    各组件并发探测、独立超时，结果短时缓存，高频探测不会放大后端压力。
+    """
+    return {
+        **await health_checker.check(),
         "service": "llm-learn-api",
-        "components": {
-            "database": "unknown",
-            "cache": "unknown",
-        }
     }
-    
-    # 检查数据库连接
-    try:
-        db.execute("SELECT 1")
-        health_status["components"]["database"] = "healthy"
-    except Exception as e:
-        logger.error("Database health check failed", error=str(e))
-        health_status["components"]["database"] = "unhealthy"
-        health_status["status"] = "degraded"
-    
-    # 检查缓存连接
-    try:
-        await cache.set("health_check", "ok", expire=60)
-        result = await cache.get("health_check")
-        if result == "ok":
-            health_status["components"]["cache"] = "healthy"
-        else:
-            health_status["components"]["cache"] = "unhealthy"
-            health_status["status"] = "degraded"
-    except Exception as e:
-        logger.error("Cache health check failed", error=str(e))
-        health_status["components"]["cache"] = "unhealthy"
-        health_status["status"] = "degraded"
-    
-    return health_status
 
 
 @router.get("/health/ready")
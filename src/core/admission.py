@@ -0,0 +1,264 @@
+"""
+准入控制
+
+过载时与其接收所有请求、让延迟一路升高直到客户端超时，不如尽早拒绝一部分请求。
+并发上限按观测到的延迟自适应调整（梯度算法）：延迟接近基线时逐步放宽，
+明显高于基线时收缩；超出上限的请求进入有界等待队列，排不上或等待超时
+立即返回503和 Retry-After。
+"""
+
+import asyncio
+import json
+import math
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from .config import settings
+from .ratelimit import path_matches
+
+# 优先级：critical 不经过准入控制，high 从不拒绝，normal 排队，low 满载时直接拒绝
+PRIORITY_CRITICAL = "critical"
+PRIORITY_HIGH = "high"
+PRIORITY_NORMAL = "normal"
+PRIORITY_LOW = "low"
+PRIORITIES = (PRIORITY_CRITICAL, PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW)
+
+ADMISSION_LIMIT = Gauge(
+    "admission_concurrency_limit",
+    "Current adaptive concurrency limit",
+    multiprocess_mode="livesum",
+)
+
+ADMISSION_INFLIGHT = Gauge(
+    "admission_inflight_requests",
+    "Requests currently admitted",
+    multiprocess_mode="livesum",
+)
+
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "admission_queue_depth",
+    "Requests waiting for admission",
+    multiprocess_mode="livesum",
+)
+
+ADMISSION_QUEUE_WAIT = Histogram(
+    "admission_queue_wait_seconds",
+    "Time spent waiting in the admission queue",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+
+ADMISSION_REJECTED = Counter(
+    "admission_rejected_total",
+    "Requests shed by admission control",
+    ["priority", "reason"],
+)
+
+
+class GradientLimiter:
+    """基于延迟梯度的自适应并发上限
+    
+    long_rtt 是延迟的长期指数移动平均（基线），每个样本计算
+    gradient = clamp(tolerance * long_rtt / rtt, 0.5, 1.0)，
+    新上限 = limit * gradient + sqrt(limit)，再与旧值平滑。
+    延迟与基线相当时上限缓慢增长，排队导致延迟升高时按比例收缩；
+    实际并发不到上限一半时不再增长，避免空闲期间上限无限放大。
+    """
+    
+    def __init__(
+        self,
+        initial_limit: int = 50,
+        min_limit: int = 5,
+        max_limit: int = 1000,
+        tolerance: float = 2.0,
+        smoothing: float = 0.2,
+        long_window: int = 600,
+    ):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.smoothing = smoothing
+        self._long_alpha = 2.0 / (long_window + 1)
+        self.long_rtt: Optional[float] = None
+    
+    def on_sample(self, rtt: float, inflight: int) -> float:
+        """记录一个请求耗时，返回调整后的上限"""
+        rtt = max(rtt, 1e-6)
+        if self.long_rtt is None:
+            self.long_rtt = rtt
+        else:
+            self.long_rtt += self._long_alpha * (rtt - self.long_rtt)
+            # 延迟已恢复时让基线更快回落，否则高位的基线会掩盖下一次过载
+            if self.long_rtt / rtt > 2.0:
+                self.long_rtt *= 0.95
+        
+        gradient = max(0.5, min(1.0, self.tolerance * self.long_rtt / rtt))
+        if gradient >= 1.0 and inflight < self.limit / 2:
+            return self.limit
+        
+        new_limit = self.limit * gradient + math.sqrt(self.limit)
+        new_limit = (1 - self.smoothing) * self.limit + self.smoothing * new_limit
+        self.limit = max(self.min_limit, min(self.max_limit, new_limit))
+        return self.limit
+
+
+class AdmissionController:
+    """并发准入控制器"""
+    
+    def __init__(
+        self,
+        limiter: Optional[GradientLimiter] = None,
+        max_queue: int = 100,
+        max_queue_time: float = 1.0,
+    ):
+        self.limiter = limiter or GradientLimiter()
+        self.max_queue = max_queue
+        self.max_queue_time = max_queue_time
+        self.inflight = 0
+        self._queue: Deque[asyncio.Future] = deque()
+        ADMISSION_LIMIT.set(self.limiter.limit)
+    
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queue)
+    
+    async def acquire(self, priority: str = PRIORITY_NORMAL) -> Optional[str]:
+        """申请准入，成功返回 None，被拒绝时返回原因"""
+        if priority == PRIORITY_HIGH or self.inflight < int(self.limiter.limit):
+            self._admit()
+            return None
+        
+        if priority == PRIORITY_LOW:
+            return "saturated"
+        if len(self._queue) >= self.max_queue:
+            return "queue_full"
+        
+        waiter = asyncio.get_running_loop().create_future()
+        self._queue.append(waiter)
+        ADMISSION_QUEUE_DEPTH.set(len(self._queue))
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(waiter, self.max_queue_time)
+            return None
+        except asyncio.TimeoutError:
+            return "queue_timeout"
+        except asyncio.CancelledError:
+            # 已被唤醒并预留名额后客户端断开，归还名额
+            if waiter.done() and not waiter.cancelled():
+                self.inflight -= 1
+                ADMISSION_INFLIGHT.set(self.inflight)
+            raise
+        finally:
+            ADMISSION_QUEUE_WAIT.observe(time.perf_counter() - start)
+            if not waiter.done() or waiter.cancelled():
+                self._remove(waiter)
+            ADMISSION_QUEUE_DEPTH.set(len(self._queue))
+    
+    def release(self, rtt: float) -> None:
+        """请求结束，记录耗时并唤醒排队的请求"""
+        self.inflight -= 1
+        limit = self.limiter.on_sample(rtt, self.inflight + 1)
+        ADMISSION_LIMIT.set(limit)
+        
+        while self._queue and self.inflight < int(limit):
+            waiter = self._queue.popleft()
+            if not waiter.done():
+                # 名额在唤醒时即预留，避免被新到的请求抢走
+                self._admit()
+                waiter.set_result(None)
+        ADMISSION_QUEUE_DEPTH.set(len(self._queue))
+        ADMISSION_INFLIGHT.set(self.inflight)
+    
+    def retry_after(self) -> int:
+        """建议客户端重试的秒数"""
+        rtt = self.limiter.long_rtt or 0.0
+        return max(1, math.ceil(max(rtt, self.max_queue_time)))
+    
+    def _admit(self) -> None:
+        self.inflight += 1
+        ADMISSION_INFLIGHT.set(self.inflight)
+    
+    def _remove(self, waiter: asyncio.Future) -> None:
+        try:
+            self._queue.remove(waiter)
+        except ValueError:
+            pass
+
+
+class AdmissionControlMiddleware:
+    """准入控制中间件
+    
+    按路径最长前缀（完整路径段）匹配 priority_routes 决定优先级，未匹配时为 normal。
+    计入延迟样本的是请求准入后到响应结束的时间，不含排队时间。
+    """
+    
+    def __init__(
+        self,
+        app,
+        controller: Optional[AdmissionController] = None,
+        priority_routes: Optional[Dict[str, str]] = None,
+    ):
+        self.app = app
+        config = settings.admission
+        self.controller = controller or AdmissionController(
+            GradientLimiter(
+                initial_limit=config.initial_limit,
+                min_limit=config.min_limit,
+                max_limit=config.max_limit,
+                tolerance=config.tolerance,
+            ),
+            max_queue=config.max_queue,
+            max_queue_time=config.max_queue_time,
+        )
+        routes = config.priority_routes if priority_routes is None else priority_routes
+        for prefix, priority in routes.items():
+            if priority not in PRIORITIES:
+                raise ValueError(f"Unknown admission priority for {prefix}: {priority}")
+        # 长前缀优先
+        self.priority_routes: List[Tuple[str, str]] = sorted(
+            routes.items(), key=lambda item: len(item[0]), reverse=True
+        )
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        priority = self._priority(scope["path"])
+        if priority == PRIORITY_CRITICAL:
+            await self.app(scope, receive, send)
+            return
+        
+        reason = await self.controller.acquire(priority)
+        if reason is not None:
+            ADMISSION_REJECTED.labels(priority=priority, reason=reason).inc()
+            await self._reject(send)
+            return
+        
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(time.perf_counter() - start)
+    
+    def _priority(self, path: str) -> str:
+        for prefix, priority in self.priority_routes:
+            if path_matches(path, prefix):
+                return priority
+        return PRIORITY_NORMAL
+    
+    async def _reject(self, send) -> None:
+        body = json.dumps({"detail": "Service overloaded, please retry later"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"retry-after", str(self.controller.retry_after()).encode()),
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body}) 
\ No newline at end of file
@@ -4,52 +4,318 @@
 提供Redis缓存支持，包括键值缓存、会话存储等。
 """
 
+import asyncio
+import dataclasses
+import functools
+import hashlib
 import json
-import pickle
-from typing import Any, Optional, Union
-from datetime import timedelta
+import math
+import random
+import secrets
+import time
+from collections import OrderedDict
+from enum import Enum
+from typing import (
+    Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Set, Tuple, Union,
+)
+from datetime import date, datetime, time as dt_time, timedelta
+from decimal import Decimal
+from uuid import UUID
 
 import redis.asyncio as redis
+from prometheus_client import Counter
 from redis.asyncio import Redis
 
+from .codecs import CacheSerializer
 from .config import settings
+from .logging import get_logger
+
+logger = get_logger(__name__)
+
+# 缓存命中指标
+CACHE_REQUESTS = Counter(
+    "cache_requests_total",
+    "Total number of cache lookups",
+    ["tier", "result"]
+)
+_L1_HIT = CACHE_REQUESTS.labels(tier="l1", result="hit")
+_L2_HIT = CACHE_REQUESTS.labels(tier="l2", result="hit")
+_L2_MISS = CACHE_REQUESTS.labels(tier="l2", result="miss")
+
+# 本地缓存未命中标记
+_MISSING = object()
+
+# 过期时间：统一值或按键指定
+ExpireType = Union[int, timedelta]
+
+# 命名空间版本号与标签集合的键前缀
+NAMESPACE_KEY_PREFIX = "cache:ns:"
+TAG_KEY_PREFIX = "cache:tag:"
+
+# 仅当锁仍由自己持有时才删除
+_RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+# 使用二进制编解码器或压缩时，缓存值需要以bytes读写
+BINARY_VALUES = settings.redis.codec != "json" or bool(settings.redis.compression)
 
 # Redis连接池
 redis_pool: Optional[Redis] = None
 
+# 分片节点连接池（配置 REDIS_NODES 时每个节点一个）
+redis_shard_pools: List[Redis] = []
+
+
+def _jump_hash(key: int, num_buckets: int) -> int:
+    """Jump consistent hash，桶数由N增至N+1时约 1/(N+1) 的键迁移"""
+    bucket, j = -1, 0
+    while j < num_buckets:
+        bucket = j
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        j = int((bucket + 1) * (float(1 << 31) / float((key >> 33) + 1)))
+    return bucket
+
+
+def shard_index(key: Union[str, bytes], num_shards: int) -> int:
+    """计算键所属分片
+    
+    与Redis Cluster一致支持 {hash tag}：键中含非空 {...} 时只按其内容路由，
+    便于让相关的键落在同一分片。
+    """
+    if num_shards <= 1:
+        return 0
+    if isinstance(key, str):
+        key = key.encode("utf-8")
+    start = key.find(b"{")
+    if start != -1:
+        end = key.find(b"}", start + 1)
+        if end > start + 1:
+            key = key[start + 1:end]
+    digest = hashlib.blake2b(key, digest_size=8).digest()
+    return _jump_hash(int.from_bytes(digest, "big"), num_shards)
+
 
 async def get_redis() -> Redis:
-    """获取Redis连接"""
+    """获取Redis连接
+    
+    启用二进制编解码器或压缩时强制关闭 decode_responses，响应统一为 bytes。
+    """
     global redis_pool
     if redis_pool is None:
         redis_pool = redis.from_url(
             settings.redis.url,
             encoding="utf-8",
-            decode_responses=settings.redis.decode_responses,
+            decode_responses=settings.redis.decode_responses and not BINARY_VALUES,
             max_connections=settings.redis.pool_size,
         )
     return redis_pool
 
 
+async def get_redis_nodes() -> List[Redis]:
+    """获取缓存分片的连接列表
+    
+    未配置 REDIS_NODES 时只有 REDIS_URL 一个节点。节点只能追加到列表末尾，
+    调整已有节点的顺序会导致大部分键重新路由。
+    """
+    if not settings.redis.nodes:
+        return [await get_redis()]
+    
+    if not redis_shard_pools:
+        for url in settings.redis.nodes:
+            redis_shard_pools.append(
+                redis.from_url(
+                    url,
+                    encoding="utf-8",
+                    decode_responses=settings.redis.decode_responses
+                    and not BINARY_VALUES,
+                    max_connections=settings.redis.pool_size,
+                )
+            )
+    return redis_shard_pools
+
+
 async def close_redis() -> None:
     """关闭Redis连接"""
     global redis_pool
+    await cache.stop_invalidation_listener()
     if redis_pool:
         await redis_pool.close()
         redis_pool = None
+    for pool in redis_shard_pools:
+        await pool.close()
+    redis_shard_pools.clear()
+
+
+class LocalCache:
+    """进程内L1缓存
+    
+    按条目数和字节数限界，条目带TTL，超限时按LRU淘汰。
+    非线程安全，只应在事件循环线程中使用。
+    """
+    
+    def __init__(
+        self,
+        max_items: int = 10000,
+        max_bytes: int = 64 * 1024 * 1024,
+        ttl: float = 30,
+    ):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._data: "OrderedDict[str, Tuple[Any, float, int]]" = OrderedDict()
+        self._bytes = 0
+        # 每次失效递增，用于丢弃读取期间已被失效的回填
+        self._epoch = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    @property
+    def epoch(self) -> int:
+        """当前失效代数"""
+        return self._epoch
+    
+    def __len__(self) -> int:
+        return len(self._data)
+    
+    def get(self, key: str) -> Any:
+        """读取条目，未命中或已过期时返回 _MISSING"""
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return _MISSING
+        
+        value, expires_at, _ = entry
+        if expires_at <= time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return _MISSING
+        
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+    
+    def set(
+        self,
+        key: str,
+        value: Any,
+        size: int,
+        ttl: Optional[float] = None,
+        epoch: Optional[int] = None,
+    ) -> bool:
+        """写入条目，epoch 与当前代数不一致时放弃写入"""
+        if epoch is not None and epoch != self._epoch:
+            return False
+        
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0 or size > self.max_bytes:
+            return False
+        
+        self._remove(key)
+        self._data[key] = (value, time.monotonic() + ttl, size)
+        self._bytes += size
+        
+        while len(self._data) > self.max_items or self._bytes > self.max_bytes:
+            _, (_, _, evicted_size) = self._data.popitem(last=False)
+            self._bytes -= evicted_size
+            self.evictions += 1
+        return True
+    
+    def invalidate(self, key: str) -> None:
+        """失效单个键"""
+        self._epoch += 1
+        self._remove(key)
+    
+    def clear(self) -> None:
+        """清空全部条目"""
+        self._epoch += 1
+        self._data.clear()
+        self._bytes = 0
+    
+    def stats(self) -> Dict[str, Any]:
+        """统计信息"""
+        lookups = self.hits + self.misses
+        return {
+            "items": len(self._data),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+    
+    def _remove(self, key: str) -> None:
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
 
 
 class CacheManager:
-    """缓存管理器"""
+    """缓存管理器
+    
+    传入 local_cache 时启用两级缓存：get 先查进程内L1，未命中再查Redis；
+    set/delete/expire 等写操作通过 Redis pub/sub 广播失效消息，
+    各worker的监听任务收到后清除对应的L1条目。
     
-    def __init__(self):
+    auto_batch 为 True 时，同一事件循环轮次内并发发起的 get 会合并为一次 MGET。
+    
+    传入 serializer 时 get/set 使用带格式头的二进制编码，未传入时沿用
+    JSON文本编码（dict/list 之外的值及其中无法JSON编码的成员以 str() 保存）。
+    
+    配置多个节点时按键一致性哈希分片，批量操作按分片拆分后并发执行。
+    """
+    
+    def __init__(
+        self,
+        local_cache: Optional[LocalCache] = None,
+        auto_batch: bool = False,
+        serializer: Optional[CacheSerializer] = None,
+    ):
         self.redis: Optional[Redis] = None
+        self.nodes: List[Redis] = []
+        self.local = local_cache
+        self.auto_batch = auto_batch
+        self.serializer = serializer
+        self.l2_hits = 0
+        self.l2_misses = 0
+        self._listeners: List[asyncio.Task] = []
+        self._subscribed_nodes: Set[int] = set()
+        self._pending: Dict[str, List[asyncio.Future]] = {}
+        self._batch_scheduled = False
+        self._batch_tasks: Set[asyncio.Task] = set()
     
-    async def get_connection(self) -> Redis:
-        """获取Redis连接"""
+    async def get_connection(self, key: Optional[Union[str, bytes]] = None) -> Redis:
+        """获取Redis连接，分片模式下按键路由到所属节点"""
         if self.redis is None:
-            self.redis = await get_redis()
-        return self.redis
+            self.nodes = await get_redis_nodes()
+            self.redis = self.nodes[0]
+        if key is None or len(self.nodes) <= 1:
+            return self.redis
+        return self.nodes[shard_index(key, len(self.nodes))]
+    
+    @property
+    def _subscribed(self) -> bool:
+        """所有节点的失效频道均已订阅"""
+        return bool(self._subscribed_nodes) and len(self._subscribed_nodes) == max(
+            len(self.nodes), 1
+        )
+    
+    async def _group_by_shard(
+        self, keys: Iterable[Union[str, bytes]]
+    ) -> List[Tuple[Redis, List[Any]]]:
+        """按分片分组，返回 (连接, 键列表)"""
+        default = await self.get_connection()
+        if len(self.nodes) <= 1:
+            return [(default, list(keys))]
+        
+        groups: Dict[int, List[Any]] = {}
+        for key in keys:
+            groups.setdefault(shard_index(key, len(self.nodes)), []).append(key)
+        return [(self.nodes[index], group) for index, group in groups.items()]
     
     async def set(
         self,
@@ -59,106 +325,263 @@ class CacheManager:
         serialize: bool = True,
     ) -> bool:
         """设置缓存"""
-        redis_client = await self.get_connection()
+        redis_client = await self.get_connection(key)
         
         if serialize:
-            if isinstance(value, (dict, list)):
-                value = json.dumps(value, ensure_ascii=False)
-            else:
-                value = str(value)
+            value = self._serialize(value)
         
-        if expire:
-            if isinstance(expire, timedelta):
-                expire = int(expire.total_seconds())
-            return await redis_client.setex(key, expire, value)
-        else:
+        expire = self._expire_seconds(expire)
+        
+        if self.local is None:
+            if expire:
+                return await redis_client.setex(key, expire, value)
             return await redis_client.set(key, value)
+        
+        async with redis_client.pipeline(transaction=False) as pipe:
+            if expire:
+                pipe.setex(key, expire, value)
+            else:
+                pipe.set(key, value)
+            self._publish_invalidation(pipe, key)
+            result, _ = await pipe.execute()
+        self.local.invalidate(key)
+        return result
     
     async def get(
         self, key: str, default: Any = None, deserialize: bool = True
     ) -> Any:
-        """获取缓存"""
-        redis_client = await self.get_connection()
+        """获取缓存
+        
+        L1和合并读取返回的可能是共享对象，调用方不应原地修改。
+        """
+        if self.auto_batch and deserialize:
+            return await self._get_batched(key, default)
+        
+        if self.local is not None and deserialize:
+            return await self._get_two_tier(key, default)
+        
+        redis_client = await self.get_connection(key)
         value = await redis_client.get(key)
         
         if value is None:
+            self._record_l2(False)
             return default
         
+        self._record_l2(True)
         if deserialize:
-            try:
-                return json.loads(value)
-            except (json.JSONDecodeError, TypeError):
-                return value
+            return self._deserialize(value)
         
         return value
     
+    async def get_many(
+        self, keys: Iterable[str], default: Any = None
+    ) -> Dict[str, Any]:
+        """批量获取缓存
+        
+        L1未命中的键通过一次 MGET 读取（启用L1时与各键的 PTTL 同管道发送），
+        返回按输入顺序排列的字典，不存在的键取 default。
+        """
+        keys = list(dict.fromkeys(keys))
+        found: Dict[str, Any] = {}
+        missing = keys
+        
+        if self.local is not None:
+            missing = []
+            for key in keys:
+                value = self.local.get(key)
+                if value is _MISSING:
+                    missing.append(key)
+                else:
+                    _L1_HIT.inc()
+                    found[key] = value
+        
+        if missing:
+            fill = self.local is not None and self._subscribed
+            epoch = self.local.epoch if fill else None
+            groups = await self._group_by_shard(missing)
+            results = await asyncio.gather(
+                *(self._mget_shard(client, group, fill) for client, group in groups)
+            )
+            
+            for (_, group), (raws, pttls) in zip(groups, results):
+                for index, (key, raw) in enumerate(zip(group, raws)):
+                    if raw is None:
+                        self._record_l2(False)
+                        found[key] = default
+                        continue
+                    
+                    self._record_l2(True)
+                    value = self._deserialize(raw)
+                    found[key] = value
+                    if fill:
+                        self.local.set(
+                            key, value, len(raw),
+                            ttl=self._pttl_seconds(pttls[index]), epoch=epoch,
+                        )
+        
+        return {key: found[key] for key in keys}
+    
+    async def set_many(
+        self,
+        mapping: Dict[str, Any],
+        expire: Optional[Union[ExpireType, Dict[str, ExpireType]]] = None,
+        serialize: bool = True,
+    ) -> bool:
+        """批量设置缓存
+        
+        所有写入在一次管道往返内完成；expire 可以是统一的过期时间，
+        也可以是按键指定的字典（未列出的键不过期）。
+        """
+        if not mapping:
+            return True
+        
+        async def write_shard(redis_client: Redis, keys: List[str]) -> bool:
+            async with redis_client.pipeline(transaction=False) as pipe:
+                for key in keys:
+                    value = mapping[key]
+                    if serialize:
+                        value = self._serialize(value)
+                    ttl = expire.get(key) if isinstance(expire, dict) else expire
+                    ttl = self._expire_seconds(ttl)
+                    if ttl:
+                        pipe.setex(key, ttl, value)
+                    else:
+                        pipe.set(key, value)
+                if self.local is not None:
+                    self._publish_invalidation(pipe, *keys)
+                results = await pipe.execute()
+            return all(results[:len(keys)])
+        
+        groups = await self._group_by_shard(mapping)
+        results = await asyncio.gather(
+            *(write_shard(client, group) for client, group in groups)
+        )
+        
+        if self.local is not None:
+            for key in mapping:
+                self.local.invalidate(key)
+        return all(results)
+    
     async def delete(self, key: str) -> bool:
         """删除缓存"""
-        redis_client = await self.get_connection()
-        return bool(await redis_client.delete(key))
+        redis_client = await self.get_connection(key)
+        if self.local is None:
+            return bool(await redis_client.delete(key))
+        
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.delete(key)
+            self._publish_invalidation(pipe, key)
+            deleted, _ = await pipe.execute()
+        self.local.invalidate(key)
+        return bool(deleted)
+    
+    async def delete_many(self, keys: Iterable[str]) -> int:
+        """批量删除缓存，返回删除的键数"""
+        keys = list(keys)
+        if not keys:
+            return 0
+        
+        async def delete_shard(redis_client: Redis, group: List[str]) -> int:
+            if self.local is None:
+                return await redis_client.delete(*group)
+            async with redis_client.pipeline(transaction=False) as pipe:
+                pipe.delete(*group)
+                self._publish_invalidation(pipe, *group)
+                deleted, _ = await pipe.execute()
+            return deleted
+        
+        groups = await self._group_by_shard(keys)
+        results = await asyncio.gather(
+            *(delete_shard(client, group) for client, group in groups)
+        )
+        
+        if self.local is not None:
+            for key in keys:
+                self.local.invalidate(key)
+        return sum(results)
     
     async def exists(self, key: str) -> bool:
         """检查键是否存在"""
-        redis_client = await self.get_connection()
+        redis_client = await self.get_connection(key)
         return bool(await redis_client.exists(key))
     
     async def expire(self, key: str, seconds: int) -> bool:
         """设置过期时间"""
-        redis_client = await self.get_connection()
-        return bool(await redis_client.expire(key, seconds))
+        redis_client = await self.get_connection(key)
+        if self.local is None:
+            return bool(await redis_client.expire(key, seconds))
+        
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.expire(key, seconds)
+            self._publish_invalidation(pipe, key)
+            result, _ = await pipe.execute()
+        self.local.invalidate(key)
+        return bool(result)
     
     async def ttl(self, key: str) -> int:
         """获取剩余生存时间"""
-        redis_client = await self.get_connection()
+        redis_client = await self.get_connection(key)
         return await redis_client.ttl(key)
     
     async def incr(self, key: str, amount: int = 1) -> int:
         """递增计数器"""
-        redis_client = await self.get_connection()
-        return await redis_client.incr(key, amount)
+        redis_client = await self.get_connection(key)
+        if self.local is None:
+            return await redis_client.incr(key, amount)
+        
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.incr(key, amount)
+            self._publish_invalidation(pipe, key)
+            result, _ = await pipe.execute()
+        self.local.invalidate(key)
+        return result
     
     async def decr(self, key: str, amount: int = 1) -> int:
         """递减计数器"""
-        redis_client = await self.get_connection()
-        return await redis_client.decr(key, amount)
+        redis_client = await self.get_connection(key)
+        if self.local is None:
+            return await redis_client.decr(key, amount)
+        
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.decr(key, amount)
+            self._publish_invalidation(pipe, key)
+            result, _ = await pipe.execute()
+        self.local.invalidate(key)
+        return result
     
     async def hset(self, name: str, key: str, value: Any) -> bool:
         """设置哈希字段"""
-        redis_client = await self.get_connection()
+        redis_client = await self.get_connection(name)
         if isinstance(value, (dict, list)):
             value = json.dumps(value, ensure_ascii=False)
         return bool(await redis_client.hset(name, key, value))
     
     async def hget(self, name: str, key: str, default: Any = None) -> Any:
         """获取哈希字段"""
-        redis_client = await self.get_connection()
+        redis_client = await self.get_connection(name)
         value = await redis_client.hget(name, key)
         
         if value is None:
             return default
         
-        try:
-            return json.loads(value)
-        except (json.JSONDecodeError, TypeError):
-            return value
+        return self._deserialize(value)
     
     async def hgetall(self, name: str) -> dict:
-        """获取所有哈希字段"""
-        redis_client = await self.get_connection()
+        """获取所有哈希字段（大哈希请使用 hscan_iter）"""
+        redis_client = await self.get_connection(name)
         data = await redis_client.hgetall(name)
         result = {}
         
         for key, value in data.items():
-            try:
-                result[key] = json.loads(value)
-            except (json.JSONDecodeError, TypeError):
-                result[key] = value
+            if isinstance(key, bytes):
+                key = key.decode("utf-8")
+            result[key] = self._deserialize(value)
         
         return result
     
     async def sadd(self, name: str, *values: Any) -> int:
         """添加集合元素"""
-        redis_client = await self.get_connection()
+        redis_client = await self.get_connection(name)
         serialized_values = []
         for value in values:
             if isinstance(value, (dict, list)):
@@ -168,44 +591,592 @@ class CacheManager:
         return await redis_client.sadd(name, *serialized_values)
     
     async def smembers(self, name: str) -> set:
-        """获取集合所有元素"""
-        redis_client = await self.get_connection()
+        """获取集合所有元素（大集合请使用 sscan_iter）"""
+        redis_client = await self.get_connection(name)
         members = await redis_client.smembers(name)
         result = set()
         
         for member in members:
-            try:
-                result.add(json.loads(member))
-            except (json.JSONDecodeError, TypeError):
-                result.add(member)
+            result.add(self._deserialize(member))
         
         return result
+    
+    async def hscan_iter(
+        self, name: str, match: Optional[str] = None, count: int = 500
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """分批迭代哈希字段
+        
+        每次 HSCAN 取回约 count 个字段，值在迭代到时才反序列化，
+        不会一次性阻塞Redis或把整个哈希加载进内存。
+        """
+        redis_client = await self.get_connection(name)
+        cursor = 0
+        while True:
+            cursor, data = await redis_client.hscan(
+                name, cursor, match=match, count=count
+            )
+            for key, value in data.items():
+                if isinstance(key, bytes):
+                    key = key.decode("utf-8")
+                yield key, self._deserialize(value)
+            if cursor == 0:
+                break
+    
+    async def sscan_iter(
+        self, name: str, match: Optional[str] = None, count: int = 500
+    ) -> AsyncIterator[Any]:
+        """分批迭代集合元素，元素在迭代到时才反序列化"""
+        redis_client = await self.get_connection(name)
+        cursor = 0
+        while True:
+            cursor, members = await redis_client.sscan(
+                name, cursor, match=match, count=count
+            )
+            for member in members:
+                yield self._deserialize(member)
+            if cursor == 0:
+                break
+    
+    async def scan_keys(
+        self, match: Optional[str] = None, count: int = 500
+    ) -> AsyncIterator[str]:
+        """分批迭代匹配的键（依次遍历所有分片），同一个键可能返回多次"""
+        await self.get_connection()
+        for redis_client in self.nodes or [self.redis]:
+            cursor = 0
+            while True:
+                cursor, keys = await redis_client.scan(cursor, match=match, count=count)
+                for key in keys:
+                    yield key.decode("utf-8") if isinstance(key, bytes) else key
+                if cursor == 0:
+                    break
+    
+    async def delete_by_pattern(self, pattern: str, batch_size: int = 500) -> int:
+        """按模式分批删除键，返回删除的键数
+        
+        以 SCAN 逐批取键并用 UNLINK 删除，内存回收在Redis后台线程进行，
+        大批量失效不会长时间阻塞服务器。
+        """
+        deleted = 0
+        await self.get_connection()
+        for redis_client in self.nodes or [self.redis]:
+            batch: List[str] = []
+            cursor = 0
+            while True:
+                cursor, keys = await redis_client.scan(
+                    cursor, match=pattern, count=batch_size
+                )
+                batch.extend(
+                    key.decode("utf-8") if isinstance(key, bytes) else key
+                    for key in keys
+                )
+                if len(batch) >= batch_size or (cursor == 0 and batch):
+                    deleted += await self._unlink(redis_client, batch)
+                    batch = []
+                if cursor == 0:
+                    break
+        return deleted
+    
+    async def acquire_lock(self, name: str, timeout: float) -> Optional[str]:
+        """获取分布式锁，成功时返回释放用的令牌，超时后锁自动失效"""
+        redis_client = await self.get_connection(name)
+        token = secrets.token_hex(16)
+        if await redis_client.set(name, token, nx=True, px=int(timeout * 1000)):
+            return token
+        return None
+    
+    async def release_lock(self, name: str, token: str) -> bool:
+        """释放分布式锁"""
+        redis_client = await self.get_connection(name)
+        return bool(await redis_client.eval(_RELEASE_LOCK_SCRIPT, 1, name, token))
+    
+    async def namespace_version(self, namespace: str) -> int:
+        """获取命名空间当前版本号"""
+        return int(await self.get(f"{NAMESPACE_KEY_PREFIX}{namespace}", default=0))
+    
+    async def invalidate_namespace(self, namespace: str) -> int:
+        """递增命名空间版本号，使该命名空间下的全部键一次性失效（旧键随TTL过期）"""
+        return await self.incr(f"{NAMESPACE_KEY_PREFIX}{namespace}")
+    
+    async def add_tags(
+        self, key: str, tags: Iterable[str], expire: Optional[ExpireType] = None
+    ) -> None:
+        """将键登记到标签集合，标签集合的TTL随最近一次登记顺延"""
+        tags = list(tags)
+        if not tags:
+            return
+        
+        expire = self._expire_seconds(expire)
+        
+        async def register_shard(redis_client: Redis, tag_keys: List[str]) -> None:
+            async with redis_client.pipeline(transaction=False) as pipe:
+                for tag_key in tag_keys:
+                    pipe.sadd(tag_key, key)
+                    if expire:
+                        pipe.expire(tag_key, expire)
+                await pipe.execute()
+        
+        groups = await self._group_by_shard(f"{TAG_KEY_PREFIX}{tag}" for tag in tags)
+        await asyncio.gather(
+            *(register_shard(client, group) for client, group in groups)
+        )
+    
+    async def invalidate_tags(self, *tags: str) -> int:
+        """删除登记在指定标签下的全部键，返回删除的键数"""
+        if not tags:
+            return 0
+        
+        tag_keys = [f"{TAG_KEY_PREFIX}{tag}" for tag in tags]
+        
+        async def members_shard(redis_client: Redis, group: List[str]) -> List[Set]:
+            async with redis_client.pipeline(transaction=False) as pipe:
+                for tag_key in group:
+                    pipe.smembers(tag_key)
+                return await pipe.execute()
+        
+        groups = await self._group_by_shard(tag_keys)
+        results = await asyncio.gather(
+            *(members_shard(client, group) for client, group in groups)
+        )
+        
+        keys = {
+            member.decode("utf-8") if isinstance(member, bytes) else member
+            for member_sets in results
+            for members in member_sets
+            for member in members
+        }
+        deleted = await self.delete_many(list(keys)) if keys else 0
+        await self.delete_many(tag_keys)
+        return deleted
+    
+    def stats(self) -> Dict[str, Any]:
+        """两级缓存命中统计"""
+        l2_lookups = self.l2_hits + self.l2_misses
+        result: Dict[str, Any] = {
+            "l2": {
+                "hits": self.l2_hits,
+                "misses": self.l2_misses,
+                "hit_ratio": self.l2_hits / l2_lookups if l2_lookups else 0.0,
+            },
+        }
+        if self.local is not None:
+            result["l1"] = self.local.stats()
+            result["l1"]["subscribed"] = self._subscribed
+            total = self.local.hits + l2_lookups
+            result["overall_hit_ratio"] = (
+                (self.local.hits + self.l2_hits) / total if total else 0.0
+            )
+        return result
+    
+    async def start_invalidation_listener(self) -> None:
+        """启动L1失效消息监听任务（每个分片节点一个）"""
+        if self.local is None or self._listeners:
+            return
+        await self.get_connection()
+        nodes = self.nodes or [self.redis]
+        self._listeners = [
+            asyncio.create_task(self._listen_invalidations(index, client))
+            for index, client in enumerate(nodes)
+        ]
+    
+    async def stop_invalidation_listener(self) -> None:
+        """停止L1失效消息监听任务"""
+        for listener in self._listeners:
+            listener.cancel()
+        for listener in self._listeners:
+            try:
+                await listener
+            except asyncio.CancelledError:
+                pass
+        self._listeners = []
+    
+    async def _get_two_tier(self, key: str, default: Any) -> Any:
+        """先查L1，未命中时在一次往返内读取值和剩余TTL并回填L1"""
+        value = self.local.get(key)
+        if value is not _MISSING:
+            _L1_HIT.inc()
+            return value
+        
+        epoch = self.local.epoch
+        redis_client = await self.get_connection(key)
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.get(key)
+            pipe.pttl(key)
+            raw, pttl = await pipe.execute()
+        
+        if raw is None:
+            self._record_l2(False)
+            return default
+        
+        self._record_l2(True)
+        value = self._deserialize(raw)
+        
+        # 未订阅失效频道时无法保证一致性，不回填L1
+        if self._subscribed:
+            self.local.set(
+                key, value, len(raw), ttl=self._pttl_seconds(pttl), epoch=epoch
+            )
+        return value
+    
+    async def _unlink(self, redis_client: Redis, keys: List[str]) -> int:
+        """UNLINK 一批键并广播L1失效"""
+        if self.local is None:
+            return await redis_client.unlink(*keys)
+        
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.unlink(*keys)
+            self._publish_invalidation(pipe, *keys)
+            unlinked, _ = await pipe.execute()
+        for key in keys:
+            self.local.invalidate(key)
+        return unlinked
+    
+    async def _mget_shard(
+        self, redis_client: Redis, keys: List[str], with_ttl: bool
+    ) -> Tuple[List[Any], List[int]]:
+        """单个分片的 MGET，需要回填L1时在同一管道内读取 PTTL"""
+        if not with_ttl:
+            return await redis_client.mget(keys), []
+        
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.mget(keys)
+            for key in keys:
+                pipe.pttl(key)
+            raws, *pttls = await pipe.execute()
+        return raws, pttls
+    
+    async def _get_batched(self, key: str, default: Any) -> Any:
+        """登记到当前批次，由下一轮事件循环统一 MGET"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.setdefault(key, []).append(future)
+        if not self._batch_scheduled:
+            self._batch_scheduled = True
+            loop.call_soon(self._dispatch_batch)
+        
+        value = await future
+        return default if value is _MISSING else value
+    
+    def _dispatch_batch(self) -> None:
+        batch, self._pending = self._pending, {}
+        self._batch_scheduled = False
+        task = asyncio.ensure_future(self._flush_batch(batch))
+        # 持有任务引用，避免执行中被回收
+        self._batch_tasks.add(task)
+        task.add_done_callback(self._batch_tasks.discard)
+    
+    async def _flush_batch(self, batch: Dict[str, List[asyncio.Future]]) -> None:
+        try:
+            values = await self.get_many(batch, default=_MISSING)
+        except Exception as e:
+            for futures in batch.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+            return
+        
+        for key, futures in batch.items():
+            for future in futures:
+                if not future.done():
+                    future.set_result(values[key])
+    
+    def _serialize(self, value: Any) -> Any:
+        if self.serializer is not None:
+            return self.serializer.dumps(value)
+        if isinstance(value, (dict, list)):
+            # 与非容器值一致，无法JSON编码的成员（如 datetime）以 str() 保存
+            return json.dumps(value, ensure_ascii=False, default=str)
+        return str(value)
+    
+    def _deserialize(self, raw: Any) -> Any:
+        if self.serializer is not None and self.serializer.is_encoded(raw):
+            return self.serializer.loads(raw)
+        try:
+            return json.loads(raw)
+        except (ValueError, TypeError):
+            pass
+        # 二进制连接上的纯文本值
+        if isinstance(raw, bytes):
+            try:
+                return raw.decode("utf-8")
+            except UnicodeDecodeError:
+                return raw
+        return raw
+    
+    @staticmethod
+    def _expire_seconds(expire: Optional[ExpireType]) -> Optional[int]:
+        if isinstance(expire, timedelta):
+            return int(expire.total_seconds())
+        return expire
+    
+    @staticmethod
+    def _pttl_seconds(pttl: Optional[int]) -> Optional[float]:
+        """PTTL 转为秒，无过期时间时返回 None"""
+        return pttl / 1000 if pttl and pttl > 0 else None
+    
+    def _record_l2(self, hit: bool) -> None:
+        if hit:
+            self.l2_hits += 1
+            _L2_HIT.inc()
+        else:
+            self.l2_misses += 1
+            _L2_MISS.inc()
+    
+    def _publish_invalidation(self, pipe: Any, *keys: str) -> None:
+        """在管道中追加失效广播"""
+        pipe.publish(settings.redis.invalidation_channel, json.dumps(keys))
+    
+    async def _listen_invalidations(self, index: int, redis_client: Redis) -> None:
+        """订阅单个节点的失效频道，断线后自动重连"""
+        while True:
+            pubsub = None
+            try:
+                pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+                await pubsub.subscribe(settings.redis.invalidation_channel)
+                # 订阅建立前的变更收不到，清空L1重新开始
+                self.local.clear()
+                self._subscribed_nodes.add(index)
+                async for message in pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    for key in json.loads(message["data"]):
+                        self.local.invalidate(key)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Cache invalidation listener error", error=str(e))
+                await asyncio.sleep(1)
+            finally:
+                self._subscribed_nodes.discard(index)
+                self.local.clear()
+                if pubsub is not None:
+                    await pubsub.reset()
 
 
 # 全局缓存管理器实例
-cache = CacheManager()
+cache = CacheManager(
+    local_cache=LocalCache(
+        max_items=settings.redis.local_cache_max_items,
+        max_bytes=settings.redis.local_cache_max_bytes,
+        ttl=settings.redis.local_cache_ttl,
+    )
+    if settings.redis.local_cache_enabled
+    else None,
+    auto_batch=settings.redis.auto_batch,
+    serializer=CacheSerializer(
+        codec=settings.redis.codec,
+        compression=settings.redis.compression,
+        compress_threshold=settings.redis.compress_threshold,
+        allow_pickle=settings.redis.allow_pickle,
+        secret_key=settings.security.secret_key,
+    )
+    if BINARY_VALUES
+    else None,
+)
+
+
+def _canonical_default(obj: Any) -> Any:
+    """将JSON不支持的参数转换为稳定的表示"""
+    if isinstance(obj, (datetime, date, dt_time)):
+        return obj.isoformat()
+    if isinstance(obj, (Decimal, UUID)):
+        return str(obj)
+    if isinstance(obj, Enum):
+        return obj.value
+    if isinstance(obj, bytes):
+        return obj.hex()
+    if isinstance(obj, (set, frozenset)):
+        return sorted(_canonical_dumps(item) for item in obj)
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump(mode="json")
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return dataclasses.asdict(obj)
+    # 兜底使用 repr，未自定义 __repr__ 的对象会带内存地址，无法跨进程共享
+    return repr(obj)
+
+
+def _canonical_dumps(obj: Any) -> str:
+    return json.dumps(
+        obj,
+        default=_canonical_default,
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+    )
+
+
+def make_cache_key(
+    prefix: str,
+    func: Callable,
+    args: tuple,
+    kwargs: dict,
+    version: Optional[int] = None,
+) -> str:
+    """生成稳定的缓存键
+    
+    参数按规范化JSON编码后取 blake2b 摘要，不受进程哈希随机化影响，
+    不同worker和重启前后得到相同的键。
+    """
+    payload = _canonical_dumps([list(args), kwargs])
+    digest = hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+    name = f"{func.__module__}.{func.__qualname__}"
+    if version is not None:
+        name = f"{name}:v{version}"
+    return f"{prefix}:{name}:{digest}"
+
+
+# 进程内正在进行的重算任务（single-flight）
+_inflight: Dict[str, asyncio.Task] = {}
+
+
+def _is_envelope(entry: Any) -> bool:
+    return isinstance(entry, dict) and entry.keys() == {"value", "delta", "expires_at"}
+
+
+async def _recompute(
+    cache_key: str,
+    func: Callable,
+    args: tuple,
+    kwargs: dict,
+    expire: Optional[int],
+    stale_ttl: int,
+    tags: List[str],
+) -> Any:
+    """执行函数并写入缓存，同时记录计算耗时供提前重算使用"""
+    start = time.perf_counter()
+    result = await func(*args, **kwargs)
+    envelope = {
+        "value": result,
+        "delta": time.perf_counter() - start,
+        "expires_at": time.time() + expire if expire else None,
+    }
+    ttl = expire + stale_ttl if expire else None
+    await cache.set(cache_key, envelope, expire=ttl)
+    if tags:
+        await cache.add_tags(cache_key, tags, expire=ttl)
+    return result
+
+
+async def _load(
+    cache_key: str, compute: Callable[[], Any], lock_timeout: float
+) -> Any:
+    """缓存未命中：跨进程加锁重算，未抢到锁则等待持有者写回"""
+    lock_key = f"{cache_key}:lock"
+    token = await cache.acquire_lock(lock_key, lock_timeout)
+    if token is None:
+        deadline = time.monotonic() + lock_timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+            entry = await cache.get(cache_key)
+            if _is_envelope(entry):
+                return entry["value"]
+        # 锁持有者超时未写回，自行计算
+    
+    try:
+        return await compute()
+    finally:
+        if token is not None:
+            await cache.release_lock(lock_key, token)
+
+
+async def _refresh(
+    cache_key: str, compute: Callable[[], Any], lock_timeout: float
+) -> None:
+    """后台刷新：其他进程已在刷新时直接放弃"""
+    lock_key = f"{cache_key}:lock"
+    try:
+        token = await cache.acquire_lock(lock_key, lock_timeout)
+        if token is None:
+            return
+        try:
+            await compute()
+        finally:
+            await cache.release_lock(lock_key, token)
+    except Exception as e:
+        logger.warning("Background cache refresh failed", key=cache_key, error=str(e))
+
+
+def _single_flight(cache_key: str, factory: Callable[[], Any]) -> asyncio.Task:
+    """同一进程内同一键只保留一个进行中的任务"""
+    task = _inflight.get(cache_key)
+    if task is None:
+        task = asyncio.ensure_future(factory())
+        _inflight[cache_key] = task
+        task.add_done_callback(lambda _: _inflight.pop(cache_key, None))
+    return task
 
 
 # 缓存装饰器
-def cached(expire: Optional[Union[int, timedelta]] = None, key_prefix: str = ""):
-    """缓存装饰器"""
+def cached(
+    expire: Optional[Union[int, timedelta]] = None,
+    key_prefix: str = "",
+    stale_ttl: int = 0,
+    beta: float = 1.0,
+    lock_timeout: float = 30,
+    namespace: Optional[str] = None,
+    tags: Union[Iterable[str], Callable[..., Iterable[str]], None] = None,
+):
+    """缓存装饰器
+    
+    防击穿策略：
+    - 进程内同一键的并发未命中只执行一次函数，跨进程通过Redis锁互斥；
+    - 临近过期时按 XFetch 算法（beta 越大越提前，0 关闭）概率性触发后台重算；
+    - 过期后 stale_ttl 秒内仍返回旧值，同时由一个后台任务刷新。
+    
+    批量失效：
+    - namespace：键中带命名空间版本号，cache.invalidate_namespace 后整体失效；
+    - tags：固定标签列表，或以函数参数调用返回标签的可调用对象，
+      cache.invalidate_tags 删除对应的全部键。
+    """
+    expire_seconds = CacheManager._expire_seconds(expire)
+    static_tags = None if tags is None or callable(tags) else list(tags)
+    
     def decorator(func):
+        @functools.wraps(func)
         async def wrapper(*args, **kwargs):
             # 生成缓存键
-            cache_key = f"{key_prefix}:{func.__name__}:{hash(str(args) + str(kwargs))}"
+            version = (
+                await cache.namespace_version(namespace) if namespace else None
+            )
+            cache_key = make_cache_key(key_prefix, func, args, kwargs, version)
             
             # 尝试从缓存获取
-            cached_result = await cache.get(cache_key)
-            if cached_result is not None:
-                return cached_result
+            entry = await cache.get(cache_key)
+            if _is_envelope(entry):
+                expires_at = entry["expires_at"]
+                if expires_at is None:
+                    return entry["value"]
+                
+                now = time.time()
+                early = beta > 0 and (
+                    now - entry["delta"] * beta * math.log(1.0 - random.random())
+                    >= expires_at
+                )
+                if now < expires_at and not early:
+                    return entry["value"]
             
-            # 执行函数
-            result = await func(*args, **kwargs)
+            entry_tags = (
+                list(tags(*args, **kwargs)) if callable(tags) else static_tags or []
+            )
+            compute = functools.partial(
+                _recompute, cache_key, func, args, kwargs,
+                expire_seconds, stale_ttl, entry_tags,
+            )
             
-            # 存储到缓存
-            await cache.set(cache_key, result, expire=expire)
+            if _is_envelope(entry):
+                # 提前重算或处于 stale 窗口：返回旧值并后台刷新。
+                # 刷新任务不返回值，与未命中的加载任务分开登记
+                _single_flight(
+                    f"{cache_key}:refresh",
+                    lambda: _refresh(cache_key, compute, lock_timeout),
+                )
+                return entry["value"]
             
-            return result
+            # 未命中：合并并发请求，仅一个调用执行函数
+            task = _single_flight(
+                cache_key, lambda: _load(cache_key, compute, lock_timeout)
+            )
+            return await asyncio.shield(task)
         
         return wrapper
     return decorator 
\ No newline at end of file
@@ -0,0 +1,290 @@
+"""
+缓存值编解码
+
+提供带格式头的二进制编解码器，支持 orjson、msgpack 和签名 pickle，
+并在超过阈值时使用 zstd/lz4/zlib 压缩。
+
+编码结果的首字节记录格式和压缩算法：低3位为格式，第3-4位为压缩算法。
+首字节总在 0x01-0x1F 之间，可以与旧版本写入的纯文本值区分。
+"""
+
+import abc
+import hashlib
+import hmac
+import json
+import pickle
+import zlib
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, Optional
+from uuid import UUID
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:  # pragma: no cover
+    lz4_frame = None
+
+# 格式编号
+FORMAT_JSON = 1
+FORMAT_MSGPACK = 2
+FORMAT_PICKLE = 3
+
+# 压缩算法编号
+COMPRESSION_NONE = 0
+COMPRESSION_ZLIB = 1
+COMPRESSION_ZSTD = 2
+COMPRESSION_LZ4 = 3
+
+# msgpack 扩展类型编号
+_EXT_DATETIME = 1
+_EXT_DATE = 2
+_EXT_DECIMAL = 3
+_EXT_UUID = 4
+_EXT_SET = 5
+
+
+def _json_default(obj: Any) -> Any:
+    """JSON不支持的类型：Pydantic模型转字典，集合转列表，其余转字符串"""
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump(mode="json")
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    return str(obj)
+
+
+def _msgpack_default(obj: Any) -> Any:
+    """msgpack扩展类型，保证日期、Decimal、UUID、集合可以原样还原"""
+    if isinstance(obj, datetime):
+        return msgpack.ExtType(_EXT_DATETIME, obj.isoformat().encode())
+    if isinstance(obj, date):
+        return msgpack.ExtType(_EXT_DATE, obj.isoformat().encode())
+    if isinstance(obj, Decimal):
+        return msgpack.ExtType(_EXT_DECIMAL, str(obj).encode())
+    if isinstance(obj, UUID):
+        return msgpack.ExtType(_EXT_UUID, obj.bytes)
+    if isinstance(obj, (set, frozenset)):
+        return msgpack.ExtType(
+            _EXT_SET, msgpack.packb(list(obj), default=_msgpack_default)
+        )
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    raise TypeError(f"Object of type {type(obj).__name__} is not msgpack serializable")
+
+
+def _msgpack_ext_hook(code: int, data: bytes) -> Any:
+    if code == _EXT_DATETIME:
+        return datetime.fromisoformat(data.decode())
+    if code == _EXT_DATE:
+        return date.fromisoformat(data.decode())
+    if code == _EXT_DECIMAL:
+        return Decimal(data.decode())
+    if code == _EXT_UUID:
+        return UUID(bytes=data)
+    if code == _EXT_SET:
+        return set(
+            msgpack.unpackb(data, ext_hook=_msgpack_ext_hook, strict_map_key=False)
+        )
+    return msgpack.ExtType(code, data)
+
+
+class Codec(abc.ABC):
+    """编解码器基类"""
+    
+    format_id: int = 0
+    
+    @abc.abstractmethod
+    def dumps(self, value: Any) -> bytes:
+        """编码为不带格式头的字节串"""
+    
+    @abc.abstractmethod
+    def loads(self, data: bytes) -> Any:
+        """从不带格式头的字节串解码"""
+
+
+class JSONCodec(Codec):
+    """JSON编解码器，已安装 orjson 时使用 orjson"""
+    
+    format_id = FORMAT_JSON
+    
+    def dumps(self, value: Any) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(
+                value, default=_json_default, option=orjson.OPT_NON_STR_KEYS
+            )
+        return json.dumps(
+            value, default=_json_default, ensure_ascii=False, separators=(",", ":")
+        ).encode("utf-8")
+    
+    def loads(self, data: bytes) -> Any:
+        if orjson is not None:
+            return orjson.loads(data)
+        return json.loads(data)
+
+
+class MsgpackCodec(Codec):
+    """msgpack编解码器，bytes原生保留，日期等类型通过扩展类型还原"""
+    
+    format_id = FORMAT_MSGPACK
+    
+    def __init__(self):
+        if msgpack is None:
+            raise RuntimeError("msgpack codec requires the 'msgpack' package")
+    
+    def dumps(self, value: Any) -> bytes:
+        return msgpack.packb(value, default=_msgpack_default, use_bin_type=True)
+    
+    def loads(self, data: bytes) -> Any:
+        return msgpack.unpackb(
+            data, ext_hook=_msgpack_ext_hook, raw=False, strict_map_key=False
+        )
+
+
+class PickleCodec(Codec):
+    """签名pickle编解码器
+    
+    负载前附加 HMAC-SHA256 签名，签名不匹配时拒绝反序列化，
+    防止能写入Redis的一方借pickle执行任意代码。
+    """
+    
+    format_id = FORMAT_PICKLE
+    _digest_size = hashlib.sha256().digest_size
+    
+    def __init__(self, secret_key: str):
+        if not secret_key:
+            raise ValueError("pickle codec requires a signing key")
+        self._key = secret_key.encode("utf-8")
+    
+    def dumps(self, value: Any) -> bytes:
+        payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        return self._sign(payload) + payload
+    
+    def loads(self, data: bytes) -> Any:
+        signature = data[:self._digest_size]
+        payload = data[self._digest_size:]
+        if not hmac.compare_digest(signature, self._sign(payload)):
+            raise ValueError("pickle payload signature mismatch")
+        return pickle.loads(payload)
+    
+    def _sign(self, payload: bytes) -> bytes:
+        return hmac.new(self._key, payload, hashlib.sha256).digest()
+
+
+def _compressor(name: Optional[str], level: Optional[int]) -> Any:
+    """返回 (编号, 压缩函数)"""
+    if not name:
+        return COMPRESSION_NONE, None
+    if name == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstd compression requires the 'zstandard' package")
+        compressor = zstandard.ZstdCompressor(level=level or 3)
+        return COMPRESSION_ZSTD, compressor.compress
+    if name == "lz4":
+        if lz4_frame is None:
+            raise RuntimeError("lz4 compression requires the 'lz4' package")
+        return COMPRESSION_LZ4, lambda data: lz4_frame.compress(
+            data, compression_level=level or 0
+        )
+    if name == "zlib":
+        return COMPRESSION_ZLIB, lambda data: zlib.compress(
+            data, 6 if level is None else level
+        )
+    raise ValueError(f"Unknown compression: {name}")
+
+
+def _decompress(compression: int, data: bytes) -> bytes:
+    if compression == COMPRESSION_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("zstd compression requires the 'zstandard' package")
+        return zstandard.ZstdDecompressor().decompress(data)
+    if compression == COMPRESSION_LZ4:
+        if lz4_frame is None:
+            raise RuntimeError("lz4 compression requires the 'lz4' package")
+        return lz4_frame.decompress(data)
+    if compression == COMPRESSION_ZLIB:
+        return zlib.decompress(data)
+    return data
+
+
+class CacheSerializer:
+    """缓存值序列化器
+    
+    写入时使用配置的编解码器，负载超过 compress_threshold 字节且压缩后更小时压缩；
+    读取时按首字节的格式头选择编解码器，因此切换配置后旧值仍可读取。
+    """
+    
+    def __init__(
+        self,
+        codec: str = "orjson",
+        compression: Optional[str] = None,
+        compress_threshold: int = 1024,
+        compress_level: Optional[int] = None,
+        allow_pickle: bool = False,
+        secret_key: str = "",
+    ):
+        self._codecs: Dict[int, Codec] = {FORMAT_JSON: JSONCodec()}
+        if msgpack is not None:
+            self._codecs[FORMAT_MSGPACK] = MsgpackCodec()
+        if allow_pickle:
+            self._codecs[FORMAT_PICKLE] = PickleCodec(secret_key)
+        
+        if codec in ("json", "orjson"):
+            self.codec = self._codecs[FORMAT_JSON]
+        elif codec == "msgpack":
+            self.codec = self._codecs.get(FORMAT_MSGPACK) or MsgpackCodec()
+        elif codec == "pickle":
+            if not allow_pickle:
+                raise ValueError("pickle codec must be explicitly allowed")
+            self.codec = self._codecs[FORMAT_PICKLE]
+        else:
+            raise ValueError(f"Unknown codec: {codec}")
+        
+        self.compress_threshold = compress_threshold
+        self._compression, self._compress = _compressor(compression, compress_level)
+    
+    @staticmethod
+    def is_encoded(data: Any) -> bool:
+        """判断是否为带格式头的编码值"""
+        return (
+            isinstance(data, (bytes, bytearray))
+            and len(data) > 0
+            and 0 < data[0] < 0x20
+            and 0 < data[0] & 0x07 <= FORMAT_PICKLE
+        )
+    
+    def dumps(self, value: Any) -> bytes:
+        """编码并按需压缩"""
+        payload = self.codec.dumps(value)
+        compression = COMPRESSION_NONE
+        if self._compress is not None and len(payload) >= self.compress_threshold:
+            compressed = self._compress(payload)
+            if len(compressed) < len(payload):
+                payload = compressed
+                compression = self._compression
+        
+        header = (compression << 3) | self.codec.format_id
+        return bytes((header,)) + payload
+    
+    def loads(self, data: bytes) -> Any:
+        """解压并解码"""
+        header = data[0]
+        codec = self._codecs.get(header & 0x07)
+        if codec is None:
+            raise ValueError(f"Unsupported cache value format: {header & 0x07}")
+        return codec.loads(_decompress(header >> 3, bytes(data[1:]))) 
\ No newline at end of file
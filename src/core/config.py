@@ -4,12 +4,22 @@
 使用Pydantic Settings管理应用配置，支持环境变量和配置文件。
 """
 
+import json
 import os
 from functools import lru_cache
 from typing import Any, Dict, List, Optional, Union
 
 from pydantic import BaseModel, Field, validator
-from pydantic_settings import BaseSettings
+from pydantic_settings import BaseSettings, NoDecode
+from typing_extensions import Annotated
+
+
+def _split_list(value: str) -> List[Any]:
+    """解析列表型环境变量：JSON列表或逗号分隔"""
+    value = value.strip()
+    if value.startswith("["):
+        return json.loads(value)
+    return [item.strip() for item in value.split(",") if item.strip()]
 
 
 class DatabaseSettings(BaseSettings):
@@ -20,6 +30,41 @@ class DatabaseSettings(BaseSettings):
     max_overflow: int = Field(default=30, env="DATABASE_MAX_OVERFLOW")
     echo: bool = Field(default=False, env="DATABASE_ECHO")
     
+    # 连接预算：max_connections 为所有进程合计的连接上限（0 表示不限制，直接使用
+    # pool_size/max_overflow），扣除 reserved_connections 后按进程数平分，
+    # 进程内同步引擎占 sync_pool_share；process_count 为 0 时取 WORKERS
+    max_connections: int = Field(default=100, env="DATABASE_MAX_CONNECTIONS")
+    reserved_connections: int = Field(default=10, env="DATABASE_RESERVED_CONNECTIONS")
+    process_count: int = Field(default=0, env="DATABASE_PROCESS_COUNT")
+    sync_pool_share: float = Field(default=0.25, env="DATABASE_SYNC_POOL_SHARE")
+    
+    # 经PgBouncer事务池连接时关闭asyncpg预编译语句缓存
+    pgbouncer: bool = Field(default=False, env="DATABASE_PGBOUNCER")
+    
+    # 只读副本：round_robin 或 least_latency，复制滞后超过 replica_max_lag 秒时回退主库
+    replica_urls: Annotated[List[str], NoDecode] = Field(
+        default=[], env="DATABASE_REPLICA_URLS"
+    )
+    replica_strategy: str = Field(default="round_robin", env="DATABASE_REPLICA_STRATEGY")
+    replica_max_lag: float = Field(default=5.0, env="DATABASE_REPLICA_MAX_LAG")
+    replica_check_interval: float = Field(default=10.0, env="DATABASE_REPLICA_CHECK_INTERVAL")
+    
+    # 查询监控：超过 slow_query_threshold 秒记慢查询日志，
+    # 同一请求内同一指纹执行超过 n_plus_one_threshold 次视为 N+1
+    query_metrics_enabled: bool = Field(default=True, env="DATABASE_QUERY_METRICS_ENABLED")
+    slow_query_threshold: float = Field(default=0.5, env="DATABASE_SLOW_QUERY_THRESHOLD")
+    n_plus_one_threshold: int = Field(default=10, env="DATABASE_N_PLUS_ONE_THRESHOLD")
+    
+    # 查询结果缓存：提交时递增写过的表的版本号，使相关缓存查询失效
+    query_cache_enabled: bool = Field(default=True, env="DATABASE_QUERY_CACHE_ENABLED")
+    query_cache_ttl: int = Field(default=300, env="DATABASE_QUERY_CACHE_TTL")
+    
+    @validator("replica_urls", pre=True)
+    def parse_replica_urls(cls, v: Union[str, List[str]]) -> List[str]:
+        if isinstance(v, str):
+            return _split_list(v)
+        return v
+    
     class Config:
         env_prefix = "DATABASE_"
 
@@ -31,6 +76,37 @@ class RedisSettings(BaseSettings):
     pool_size: int = Field(10, env="REDIS_POOL_SIZE")
     decode_responses: bool = Field(True, env="REDIS_DECODE_RESPONSES")
     
+    # 缓存分片节点，为空时只使用 url；只能在末尾追加节点
+    # 环境变量不经JSON解码，由 parse_nodes 解析
+    nodes: Annotated[List[str], NoDecode] = Field([], env="REDIS_NODES")
+    
+    # 进程内L1缓存（需配合失效广播频道保证多worker一致）
+    local_cache_enabled: bool = Field(False, env="REDIS_LOCAL_CACHE_ENABLED")
+    local_cache_max_items: int = Field(10000, env="REDIS_LOCAL_CACHE_MAX_ITEMS")
+    local_cache_max_bytes: int = Field(64 * 1024 * 1024, env="REDIS_LOCAL_CACHE_MAX_BYTES")
+    local_cache_ttl: int = Field(30, env="REDIS_LOCAL_CACHE_TTL")
+    invalidation_channel: str = Field("cache:invalidate", env="REDIS_INVALIDATION_CHANNEL")
+    
+    # 合并同一事件循环轮次内的并发 get 为一次 MGET
+    auto_batch: bool = Field(False, env="REDIS_AUTO_BATCH")
+    
+    # 缓存值编解码：json（文本，兼容旧数据）、orjson、msgpack、pickle（需显式允许）
+    codec: str = Field("json", env="REDIS_CODEC")
+    compression: Optional[str] = Field(None, env="REDIS_COMPRESSION")
+    compress_threshold: int = Field(1024, env="REDIS_COMPRESS_THRESHOLD")
+    allow_pickle: bool = Field(False, env="REDIS_ALLOW_PICKLE")
+    
+    # HTTP响应缓存（路由通过 @cache_response 启用）
+    response_cache_enabled: bool = Field(True, env="REDIS_RESPONSE_CACHE_ENABLED")
+    response_cache_ttl: int = Field(60, env="REDIS_RESPONSE_CACHE_TTL")
+    response_cache_max_body: int = Field(1024 * 1024, env="REDIS_RESPONSE_CACHE_MAX_BODY")
+    
+    @validator("nodes", pre=True)
+    def parse_nodes(cls, v: Union[str, List[str]]) -> List[str]:
+        if isinstance(v, str):
+            return _split_list(v)
+        return v
+    
     class Config:
         env_prefix = "REDIS_"
 
@@ -43,6 +119,12 @@ class SecuritySettings(BaseSettings):
     access_token_expire_minutes: int = Field(30, env="ACCESS_TOKEN_EXPIRE_MINUTES")
     refresh_token_expire_days: int = Field(7, env="REFRESH_TOKEN_EXPIRE_DAYS")
     
+    # bcrypt 成本参数，修改后旧哈希在用户下次登录时自动重新计算
+    bcrypt_rounds: int = Field(12, env="SECURITY_BCRYPT_ROUNDS")
+    # 密码哈希线程池大小（0 表示 min(4, CPU数)）与排队上限
+    password_hash_workers: int = Field(0, env="SECURITY_PASSWORD_HASH_WORKERS")
+    password_hash_max_pending: int = Field(64, env="SECURITY_PASSWORD_HASH_MAX_PENDING")
+    
     class Config:
         env_prefix = "SECURITY_"
 
@@ -53,6 +135,12 @@ class JWTSettings(BaseSettings):
     secret_key: str = Field(..., env="JWT_SECRET_KEY")
     algorithm: str = Field("HS256", env="JWT_ALGORITHM")
     
+    # 已验证令牌的进程内缓存：条目数（0 表示关闭）、最长缓存秒数（不超过令牌 exp）
+    token_cache_size: int = Field(10000, env="JWT_TOKEN_CACHE_SIZE")
+    token_cache_ttl: float = Field(300, env="JWT_TOKEN_CACHE_TTL")
+    # 无效令牌的缓存秒数
+    token_cache_negative_ttl: float = Field(60, env="JWT_TOKEN_CACHE_NEGATIVE_TTL")
+    
     class Config:
         env_prefix = "JWT_"
 
@@ -63,6 +151,31 @@ class LoggingSettings(BaseSettings):
     level: str = Field("INFO", env="LOG_LEVEL")
     format: str = Field("json", env="LOG_FORMAT")
     
+    # 队列模式：请求路径上只入队，由后台线程批量渲染和写出
+    async_enabled: bool = Field(False, env="LOG_ASYNC_ENABLED")
+    queue_size: int = Field(10000, env="LOG_QUEUE_SIZE")
+    batch_size: int = Field(256, env="LOG_BATCH_SIZE")
+    flush_interval: float = Field(0.5, env="LOG_FLUSH_INTERVAL")
+    # 队列满时的策略：drop 丢弃并计数，block 阻塞等待
+    overflow: str = Field("drop", env="LOG_OVERFLOW")
+    
+    # 请求日志尾部采样：出错、5xx和慢请求总是保留，其余按事件名的采样率保留
+    sampling_enabled: bool = Field(True, env="LOG_SAMPLING_ENABLED")
+    sample_rates: Dict[str, float] = Field({"Request completed": 0.01}, env="LOG_SAMPLE_RATES")
+    sample_default_rate: float = Field(1.0, env="LOG_SAMPLE_DEFAULT_RATE")
+    slow_request_threshold: float = Field(1.0, env="LOG_SLOW_REQUEST_THRESHOLD")
+    # 同一事件每个窗口最多写出的条数，超出部分汇总为一行，0 表示不限速
+    rate_limit_burst: int = Field(100, env="LOG_RATE_LIMIT_BURST")
+    rate_limit_window: float = Field(60.0, env="LOG_RATE_LIMIT_WINDOW")
+    # log_performance 记录慢调用日志的耗时阈值（秒），为空时只计入直方图
+    slow_call_threshold: Optional[float] = Field(None, env="LOG_SLOW_CALL_THRESHOLD")
+    
+    @validator("overflow")
+    def validate_overflow(cls, v: str) -> str:
+        if v not in ("drop", "block"):
+            raise ValueError("LOG_OVERFLOW must be 'drop' or 'block'")
+        return v
+    
     class Config:
         env_prefix = "LOG_"
 
@@ -73,6 +186,32 @@ class MonitoringSettings(BaseSettings):
     sentry_dsn: Optional[str] = Field(None, env="SENTRY_DSN")
     prometheus_enabled: bool = Field(True, env="PROMETHEUS_ENABLED")
     
+    # 详细健康检查：结果缓存秒数与单个组件探针的超时
+    health_cache_ttl: float = Field(5.0, env="MONITORING_HEALTH_CACHE_TTL")
+    health_check_timeout: float = Field(2.0, env="MONITORING_HEALTH_CHECK_TIMEOUT")
+    
+    # 直方图桶（秒）：HTTP请求耗时/首字节时间，以及SQL语句耗时
+    # 环境变量不经JSON解码，由 parse_buckets 解析（JSON列表或逗号分隔）
+    http_latency_buckets: Annotated[List[float], NoDecode] = Field(
+        [0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0],
+        env="MONITORING_HTTP_LATENCY_BUCKETS",
+    )
+    db_latency_buckets: Annotated[List[float], NoDecode] = Field(
+        [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0],
+        env="MONITORING_DB_LATENCY_BUCKETS",
+    )
+    
+    # 多进程指标文件目录，WORKERS>1 时未设置则启动时自动创建临时目录
+    multiproc_dir: Optional[str] = Field(None, env="MONITORING_MULTIPROC_DIR")
+    # /debug/perf 函数耗时快照
+    perf_debug_enabled: bool = Field(False, env="MONITORING_PERF_DEBUG_ENABLED")
+    
+    @validator("http_latency_buckets", "db_latency_buckets", pre=True)
+    def parse_buckets(cls, v: Union[str, List[float]]) -> List[float]:
+        if isinstance(v, str):
+            return [float(bucket) for bucket in _split_list(v)]
+        return v
+    
     class Config:
         env_prefix = "MONITORING_"
 
@@ -117,10 +256,42 @@ class RateLimitSettings(BaseSettings):
     requests: int = Field(100, env="RATE_LIMIT_REQUESTS")
     window: int = Field(60, env="RATE_LIMIT_WINDOW")
     
+    # 每次从Redis租用的令牌数，本地用尽后再访问Redis
+    lease_size: int = Field(10, env="RATE_LIMIT_LEASE_SIZE")
+    # 按路径前缀的规则，如 {"/api/v1/auth/login": "5/60"}
+    route_limits: Dict[str, str] = Field({}, env="RATE_LIMIT_ROUTE_LIMITS")
+    # 按完整路径段匹配：/health 豁免 /health/live，不豁免 /healthz
+    exempt_paths: List[str] = Field(
+        ["/health", "/api/v1/health", "/metrics"], env="RATE_LIMIT_EXEMPT_PATHS"
+    )
+    
     class Config:
         env_prefix = "RATE_LIMIT_"
 
 
+class AdmissionSettings(BaseSettings):
+    """准入控制配置"""
+    
+    enabled: bool = Field(True, env="ADMISSION_ENABLED")
+    # 并发上限的初始值与范围，运行中按观测到的延迟自适应调整
+    initial_limit: int = Field(50, env="ADMISSION_INITIAL_LIMIT")
+    min_limit: int = Field(5, env="ADMISSION_MIN_LIMIT")
+    max_limit: int = Field(1000, env="ADMISSION_MAX_LIMIT")
+    # 延迟超过基线的倍数在此以内不收缩上限
+    tolerance: float = Field(2.0, env="ADMISSION_TOLERANCE")
+    # 等待队列长度与最长排队秒数，超出直接返回503
+    max_queue: int = Field(100, env="ADMISSION_MAX_QUEUE")
+    max_queue_time: float = Field(1.0, env="ADMISSION_MAX_QUEUE_TIME")
+    # 按路径前缀的优先级：critical 不受控制，high 从不拒绝，low 满载时直接拒绝不排队
+    priority_routes: Dict[str, str] = Field(
+        {"/health": "critical", "/api/v1/health": "critical", "/metrics": "critical"},
+        env="ADMISSION_PRIORITY_ROUTES",
+    )
+    
+    class Config:
+        env_prefix = "ADMISSION_"
+
+
 class Settings(BaseSettings):
     """应用主配置"""
     
@@ -145,6 +316,7 @@ class Settings(BaseSettings):
     celery: CelerySettings = CelerySettings()
     cors: CORSettings = CORSettings()
     rate_limit: RateLimitSettings = RateLimitSettings()
+    admission: AdmissionSettings = AdmissionSettings()
     
     # 外部API配置
     openai_api_key: Optional[str] = Field(None, env="OPENAI_API_KEY")
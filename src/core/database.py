@@ -4,44 +4,316 @@
 提供SQLAlchemy数据库连接、会话管理和事务支持。
 """
 
+import asyncio
+import itertools
+import threading
+import time
 from contextlib import contextmanager
-from typing import AsyncGenerator, Generator
+from typing import Any, AsyncGenerator, Dict, Generator, List, Optional, Tuple
+from uuid import uuid4
 
-from sqlalchemy import create_engine, event
-from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine,
+)
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import Session, sessionmaker
 from sqlalchemy.pool import StaticPool
+from sqlalchemy.sql import Select
 
 from .config import settings
+from .logging import get_logger
+from .query_cache import track_table_writes
+from .query_metrics import (
+    TimedAsyncQueuePool, TimedQueuePool, instrument_engine, observe_pool,
+)
+
+logger = get_logger(__name__)
 
 # 创建基础模型类
 Base = declarative_base()
 
-# 同步数据库引擎
-engine = create_engine(
-    settings.database.url,
-    pool_size=settings.database.pool_size,
-    max_overflow=settings.database.max_overflow,
-    echo=settings.database.echo,
-    pool_pre_ping=True,
+_engine: Optional[Engine] = None
+_async_engine: Optional[AsyncEngine] = None
+_engine_lock = threading.Lock()
+
+
+def connection_budget(kind: str) -> Tuple[int, int]:
+    """按全局连接上限计算单个进程的连接池大小，返回 (pool_size, max_overflow)
+    
+    kind 为 sync 或 async。未设置 max_connections 时沿用 pool_size/max_overflow，
+    否则两者之和不超过本进程分到的预算。
+    """
+    db = settings.database
+    if not db.max_connections:
+        return db.pool_size, db.max_overflow
+    
+    processes = max(1, db.process_count or settings.workers)
+    per_process = max(2, (db.max_connections - db.reserved_connections) // processes)
+    sync_limit = max(1, int(per_process * db.sync_pool_share))
+    limit = sync_limit if kind == "sync" else max(1, per_process - sync_limit)
+    pool_size = min(db.pool_size, limit)
+    return pool_size, min(db.max_overflow, limit - pool_size)
+
+
+def _async_url(url: str) -> str:
+    return url.replace("postgresql://", "postgresql+asyncpg://")
+
+
+def _create_async_engine(url: str, name: str) -> AsyncEngine:
+    """按连接预算创建异步引擎并注册监控"""
+    pool_size, max_overflow = connection_budget("async")
+    kwargs: Dict[str, Any] = {}
+    if not url.startswith("sqlite"):
+        kwargs["poolclass"] = TimedAsyncQueuePool
+    if settings.database.pgbouncer:
+        # 事务池模式下同一会话的语句可能落在不同的服务端连接上，
+        # 不能复用预编译语句，语句名也必须全局唯一
+        kwargs["connect_args"] = {
+            "statement_cache_size": 0,
+            "prepared_statement_cache_size": 0,
+            "prepared_statement_name_func": lambda: f"__asyncpg_{uuid4()}__",
+        }
+    
+    async_engine = create_async_engine(
+        _async_url(url),
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        echo=settings.database.echo,
+        pool_pre_ping=True,
+        **kwargs,
+    )
+    instrument_engine(async_engine.sync_engine)
+    observe_pool(name, async_engine.sync_engine, pool_size + max_overflow)
+    logger.info(
+        "Database engine created",
+        engine=name,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+    )
+    return async_engine
+
+
+def get_engine() -> Engine:
+    """获取同步数据库引擎，首次使用时创建"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                pool_size, max_overflow = connection_budget("sync")
+                kwargs: Dict[str, Any] = {}
+                if not settings.database.url.startswith("sqlite"):
+                    kwargs["poolclass"] = TimedQueuePool
+                sync_engine = create_engine(
+                    settings.database.url,
+                    pool_size=pool_size,
+                    max_overflow=max_overflow,
+                    echo=settings.database.echo,
+                    pool_pre_ping=True,
+                    **kwargs,
+                )
+                event.listen(sync_engine, "connect", set_sqlite_pragma)
+                instrument_engine(sync_engine)
+                observe_pool("primary_sync", sync_engine, pool_size + max_overflow)
+                logger.info(
+                    "Database engine created",
+                    engine="primary_sync",
+                    pool_size=pool_size,
+                    max_overflow=max_overflow,
+                )
+                _engine = sync_engine
+    return _engine
+
+
+def get_async_engine() -> AsyncEngine:
+    """获取异步数据库引擎，首次使用时创建"""
+    global _async_engine
+    if _async_engine is None:
+        with _engine_lock:
+            if _async_engine is None:
+                _async_engine = _create_async_engine(settings.database.url, "primary_async")
+    return _async_engine
+
+
+def __getattr__(name: str) -> Any:
+    # 兼容 from .database import engine / async_engine，访问时才创建引擎
+    if name == "engine":
+        return get_engine()
+    if name == "async_engine":
+        return get_async_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# 只读副本复制延迟查询（WAL已全部回放时视为无延迟）
+_REPLICA_LAG_SQL = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) "
+    "END"
 )
 
-# 异步数据库引擎
-async_engine = create_async_engine(
-    settings.database.url.replace("postgresql://", "postgresql+asyncpg://"),
-    pool_size=settings.database.pool_size,
-    max_overflow=settings.database.max_overflow,
-    echo=settings.database.echo,
-    pool_pre_ping=True,
+
+class ReplicaPool:
+    """只读副本池
+    
+    后台定期探测各副本的延迟与复制滞后，滞后超过 max_lag 或探测失败的副本
+    暂不使用；选择策略支持 round_robin 和 least_latency。
+    """
+    
+    def __init__(
+        self,
+        urls: List[str],
+        strategy: str = "round_robin",
+        max_lag: float = 5.0,
+        check_interval: float = 10.0,
+    ):
+        self.engines: List[AsyncEngine] = [
+            _create_async_engine(url, f"replica_{index}")
+            for index, url in enumerate(urls)
+        ]
+        self.strategy = strategy
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        # 首次探测前默认可用
+        self.healthy = [True] * len(self.engines)
+        self.latency = [0.0] * len(self.engines)
+        self.lag = [0.0] * len(self.engines)
+        self._counter = itertools.count()
+        self._task: Optional[asyncio.Task] = None
+    
+    def choose(self) -> Optional[AsyncEngine]:
+        """选择一个可用副本，没有可用副本时返回 None"""
+        candidates = [i for i, healthy in enumerate(self.healthy) if healthy]
+        if not candidates:
+            return None
+        if self.strategy == "least_latency":
+            index = min(candidates, key=self.latency.__getitem__)
+        else:
+            index = candidates[next(self._counter) % len(candidates)]
+        return self.engines[index]
+    
+    async def check(self) -> None:
+        """并发探测所有副本"""
+        await asyncio.gather(*(self._check_one(i) for i in range(len(self.engines))))
+    
+    async def _check_one(self, index: int) -> None:
+        replica = self.engines[index]
+        start = time.perf_counter()
+        try:
+            async with replica.connect() as conn:
+                if replica.dialect.name == "postgresql":
+                    lag = float((await conn.execute(_REPLICA_LAG_SQL)).scalar() or 0)
+                else:
+                    await conn.execute(text("SELECT 1"))
+                    lag = 0.0
+        except Exception as e:
+            if self.healthy[index]:
+                logger.warning("Replica unavailable", replica=index, error=str(e))
+            self.healthy[index] = False
+            return
+        
+        # 延迟取指数移动平均，避免单次抖动导致频繁切换
+        elapsed = time.perf_counter() - start
+        self.latency[index] = elapsed if not self.latency[index] else (
+            0.8 * self.latency[index] + 0.2 * elapsed
+        )
+        self.lag[index] = lag
+        healthy = lag <= self.max_lag
+        if healthy != self.healthy[index]:
+            logger.warning("Replica health changed", replica=index, healthy=healthy, lag=lag)
+        self.healthy[index] = healthy
+    
+    async def _monitor(self) -> None:
+        while True:
+            try:
+                await self.check()
+            except Exception as e:
+                logger.error("Replica health check failed", error=str(e))
+            await asyncio.sleep(self.check_interval)
+    
+    def start(self) -> None:
+        """启动后台探测任务"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._monitor())
+    
+    async def close(self) -> None:
+        """停止探测并释放副本连接"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for replica in self.engines:
+            await replica.dispose()
+    
+    def stats(self) -> List[Dict[str, Any]]:
+        """各副本状态"""
+        return [
+            {"healthy": healthy, "latency": latency, "lag": lag}
+            for healthy, latency, lag in zip(self.healthy, self.latency, self.lag)
+        ]
+
+
+# 只读副本池（未配置副本时为 None）
+replica_pool: Optional[ReplicaPool] = (
+    ReplicaPool(
+        settings.database.replica_urls,
+        strategy=settings.database.replica_strategy,
+        max_lag=settings.database.replica_max_lag,
+        check_interval=settings.database.replica_check_interval,
+    )
+    if settings.database.replica_urls
+    else None
 )
 
+
+class RoutingSession(Session):
+    """读写分离会话
+    
+    只读 SELECT 路由到副本；flush、INSERT/UPDATE/DELETE、SELECT ... FOR UPDATE
+    以及其他语句走主库。会话一旦写过主库，后续所有语句都留在主库，
+    保证读到自己的写入。session.info["use_primary"] = True 可强制使用主库；
+    只需单条语句走主库时传 bind_arguments={"use_primary": True}。
+    """
+    
+    def get_bind(self, mapper=None, clause=None, use_primary=False, **kwargs):
+        primary = get_async_engine().sync_engine
+        if replica_pool is None or use_primary or self.info.get("use_primary"):
+            return primary
+        
+        if (
+            not self._flushing
+            and isinstance(clause, Select)
+            and clause._for_update_arg is None
+        ):
+            replica = replica_pool.choose()
+            return replica.sync_engine if replica is not None else primary
+        
+        if self._flushing or clause is not None:
+            self.info["use_primary"] = True
+        return primary
+
+
+class LazyBindSession(Session):
+    """同步会话，执行时才获取（并按需创建）同步引擎"""
+    
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        return get_engine()
+
+
+# 提交时递增写过的表的版本号（查询结果缓存失效）
+track_table_writes(Session)
+
 # 同步会话工厂
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, class_=LazyBindSession)
 
 # 异步会话工厂
 AsyncSessionLocal = async_sessionmaker(
-    async_engine, class_=AsyncSession, expire_on_commit=False
+    class_=AsyncSession,
+    sync_session_class=RoutingSession,
+    expire_on_commit=False,
 )
 
 
@@ -55,7 +327,7 @@ def get_db() -> Generator[Session, None, None]:
 
 
 async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
-    """获取异步数据库会话"""
+    """获取异步数据库会话（配置副本时读写分离）"""
     async with AsyncSessionLocal() as session:
         try:
             yield session
@@ -79,18 +351,25 @@ def get_db_context() -> Generator[Session, None, None]:
 
 async def init_db() -> None:
     """初始化数据库"""
-    async with async_engine.begin() as conn:
+    async with get_async_engine().begin() as conn:
         # 创建所有表
         await conn.run_sync(Base.metadata.create_all)
+    
+    if replica_pool is not None:
+        replica_pool.start()
 
 
 async def close_db() -> None:
     """关闭数据库连接"""
-    await async_engine.dispose()
+    if replica_pool is not None:
+        await replica_pool.close()
+    if _async_engine is not None:
+        await _async_engine.dispose()
+    if _engine is not None:
+        _engine.dispose()
 
 
-# 数据库事件监听器
-@event.listens_for(engine, "connect")
+# 数据库事件监听器（在 get_engine 中注册）
 def set_sqlite_pragma(dbapi_connection, connection_record):
     """SQLite特定配置"""
     if "sqlite" in settings.database.url:
@@ -0,0 +1,162 @@
+"""
+健康检查
+
+各组件探针异步并发执行，每个探针有独立超时；结果在进程内缓存 cache_ttl 秒，
+并发的检查请求共享同一次探测，负载均衡器的探测频率再高，
+对后端的访问也只有每个TTL周期一次。
+"""
+
+import asyncio
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, NamedTuple, Optional
+
+import httpx
+from sqlalchemy import text
+
+from .cache import get_redis_nodes
+from .config import settings
+from .database import get_async_engine, replica_pool
+from .logging import get_logger
+
+logger = get_logger(__name__)
+
+# 探针返回附加信息字典（可包含 status 覆盖为 degraded），失败时抛出异常
+Probe = Callable[[], Awaitable[Optional[Dict[str, Any]]]]
+
+
+class _Component(NamedTuple):
+    probe: Probe
+    timeout: float
+
+
+class HealthChecker:
+    """可插拔的组件健康检查"""
+    
+    def __init__(self, cache_ttl: float = 5.0, timeout: float = 2.0):
+        self.cache_ttl = cache_ttl
+        self.timeout = timeout
+        self._components: Dict[str, _Component] = {}
+        self._result: Optional[Dict[str, Any]] = None
+        self._expires_at = 0.0
+        self._inflight: Optional[asyncio.Task] = None
+    
+    def register(self, name: str, probe: Probe, timeout: Optional[float] = None) -> None:
+        """注册组件探针，同名探针会被替换"""
+        self._components[name] = _Component(probe, timeout or self.timeout)
+        self._result = None
+    
+    def unregister(self, name: str) -> None:
+        self._components.pop(name, None)
+        self._result = None
+    
+    async def check(self, force: bool = False) -> Dict[str, Any]:
+        """返回各组件状态，TTL内直接返回缓存结果
+        
+        components 为组件名到状态字符串（healthy/degraded/unhealthy）的映射，
+        details 为各组件的完整结果（状态、延迟、错误及探针返回的附加信息）。
+        """
+        if not force and self._result is not None and time.monotonic() < self._expires_at:
+            return self._result
+        
+        if self._inflight is None:
+            self._inflight = asyncio.create_task(self._check_all())
+        # 调用方被取消时不影响其他等待同一次探测的请求
+        return await asyncio.shield(self._inflight)
+    
+    async def _check_all(self) -> Dict[str, Any]:
+        try:
+            names = list(self._components)
+            results = await asyncio.gather(
+                *(self._check_one(name, self._components[name]) for name in names)
+            )
+            details = dict(zip(names, results))
+            healthy = all(result["status"] == "healthy" for result in details.values())
+            # components 保持原有的 组件名 -> 状态字符串，延迟等附加信息放在 details
+            self._result = {
+                "status": "healthy" if healthy else "degraded",
+                "timestamp": datetime.utcnow().isoformat(),
+                "components": {name: result["status"] for name, result in details.items()},
+                "details": details,
+            }
+            self._expires_at = time.monotonic() + self.cache_ttl
+            return self._result
+        finally:
+            self._inflight = None
+    
+    async def _check_one(self, name: str, component: _Component) -> Dict[str, Any]:
+        start = time.perf_counter()
+        try:
+            details = await asyncio.wait_for(component.probe(), component.timeout)
+            result = {"status": "healthy", **(details or {})}
+        except asyncio.TimeoutError:
+            result = {"status": "unhealthy", "error": f"timed out after {component.timeout}s"}
+        except Exception as e:
+            result = {"status": "unhealthy", "error": str(e)}
+        
+        result["latency_ms"] = round((time.perf_counter() - start) * 1000, 2)
+        if result["status"] != "healthy":
+            logger.warning("Health check failed", component=name, **result)
+        return result
+
+
+async def probe_database() -> None:
+    """主库 SELECT 1"""
+    async with get_async_engine().connect() as conn:
+        await conn.execute(text("SELECT 1"))
+
+
+async def probe_redis() -> Dict[str, Any]:
+    """并发 PING 所有缓存节点"""
+    nodes = await get_redis_nodes()
+    await asyncio.gather(*(node.ping() for node in nodes))
+    return {"nodes": len(nodes)}
+
+
+async def probe_replicas() -> Dict[str, Any]:
+    """读取副本监控的最近一次探测结果，不访问数据库"""
+    stats = replica_pool.stats() if replica_pool is not None else []
+    healthy = sum(1 for replica in stats if replica["healthy"])
+    return {
+        "status": "healthy" if healthy == len(stats) else "degraded",
+        "healthy": healthy,
+        "total": len(stats),
+    }
+
+
+def http_probe(url: str, headers: Optional[Dict[str, str]] = None) -> Probe:
+    """HTTP探针，5xx或连接失败视为不健康，用于LLM服务商等外部依赖"""
+    async def probe() -> Dict[str, Any]:
+        async with httpx.AsyncClient() as client:
+            response = await client.get(url, headers=headers)
+        if response.status_code >= 500:
+            raise RuntimeError(f"HTTP {response.status_code}")
+        return {"http_status": response.status_code}
+    return probe
+
+
+# 全局健康检查器
+health_checker = HealthChecker(
+    cache_ttl=settings.monitoring.health_cache_ttl,
+    timeout=settings.monitoring.health_check_timeout,
+)
+health_checker.register("database", probe_database)
+health_checker.register("cache", probe_redis)
+if replica_pool is not None:
+    health_checker.register("replicas", probe_replicas)
+if settings.openai_api_key:
+    health_checker.register(
+        "openai",
+        http_probe(
+            "https://api.openai.com/v1/models",
+            {"Authorization": f"Bearer {settings.openai_api_key}"},
+        ),
+    )
+if settings.anthropic_api_key:
+    health_checker.register(
+        "anthropic",
+        http_probe(
+            "https://api.anthropic.com/v1/models",
+            {"x-api-key": settings.anthropic_api_key, "anthropic-version": "2023-06-01"},
+        ),
+    ) 
\ No newline at end of file
@@ -2,22 +2,526 @@
 结构化日志配置
 
 使用structlog提供结构化日志记录，支持JSON格式和性能监控。
+
+队列模式（LOG_ASYNC_ENABLED）下，请求路径上只把 (时间戳, 事件字典) 放入
+有界队列，由后台线程用 orjson 渲染后批量写到 stdout，标准库日志也经同一队列写出。
+队列满时按 LOG_OVERFLOW 丢弃或阻塞，两种情况都有计数。
+
+采样（LOG_SAMPLING_ENABLED）按请求做尾部采样：请求内的日志先缓冲，请求结束时
+整体保留或丢弃，出错、5xx和慢请求总是保留，其余按事件名的采样率保留。
+写出前再按 (logger, 事件名) 限速，被抑制的条数定期汇总为一行。
 """
 
+import atexit
+import functools
+import inspect
 import logging
+import os
+import queue
+import random
 import sys
+import threading
 import time
-from typing import Any, Dict, Optional
+from contextvars import ContextVar, Token
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
+import orjson
 import structlog
+from prometheus_client import Counter
 from structlog.stdlib import LoggerFactory
 
 from .config import settings
+from .perf import get_histogram
+
+LOG_QUEUE_OVERFLOW = Counter(
+    "log_queue_overflow_total",
+    "Log events that found the log queue full",
+    ["policy"],
+)
+
+_STOP = object()
+
+
+class LogWriter(threading.Thread):
+    """后台日志线程：从队列取出事件，批量渲染并写出
+    
+    停止后 put 改为在调用线程中直接写出，不会丢失或阻塞。
+    """
+    
+    def __init__(
+        self,
+        stream: Any,
+        queue_size: int = 10000,
+        batch_size: int = 256,
+        flush_interval: float = 0.5,
+        overflow: str = "drop",
+        json_format: bool = True,
+    ):
+        super().__init__(name="log-writer", daemon=True)
+        self.stream = stream
+        self.queue: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.block = overflow == "block"
+        self.dropped = 0
+        self.blocked = 0
+        self.stopped = False
+        # 日志线程与停止后的直接写出共用，保证行不交错
+        self._write_lock = threading.Lock()
+        self._exc_formatter = structlog.processors.format_exc_info
+        self._console = None if json_format else structlog.dev.ConsoleRenderer()
+    
+    def put(self, timestamp: float, event_dict: Dict[str, Any]) -> None:
+        """请求路径上调用：只入队，不渲染"""
+        if self.stopped:
+            self.write_now(timestamp, event_dict)
+            return
+        try:
+            self.queue.put_nowait((timestamp, event_dict))
+        except queue.Full:
+            if not self.block:
+                self.dropped += 1
+                LOG_QUEUE_OVERFLOW.labels(policy="drop").inc()
+                return
+            self.blocked += 1
+            LOG_QUEUE_OVERFLOW.labels(policy="block").inc()
+            # 分段等待，日志线程在等待期间停止时改为直接写出
+            while True:
+                try:
+                    self.queue.put((timestamp, event_dict), timeout=self.flush_interval)
+                    break
+                except queue.Full:
+                    if self.stopped:
+                        self.write_now(timestamp, event_dict)
+                        return
+        if self.stopped and not self.is_alive():
+            # 与 stop 竞争时入队晚于日志线程退出，由调用方写出
+            self._drain()
+    
+    def write_now(self, timestamp: float, event_dict: Dict[str, Any]) -> None:
+        """在调用线程中渲染并写出单条日志"""
+        self._write([(timestamp, event_dict)])
+    
+    def run(self) -> None:
+        while True:
+            try:
+                item = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            
+            batch: List[Tuple[float, Dict[str, Any]]] = []
+            stop = item is _STOP
+            if not stop:
+                batch.append(item)
+            while not stop and len(batch) < self.batch_size:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                else:
+                    batch.append(item)
+            
+            if batch:
+                self._write(batch)
+            if stop:
+                return
+    
+    def stop(self, timeout: float = 5.0) -> None:
+        """写出队列中剩余的日志后退出"""
+        self.stopped = True
+        if self.is_alive():
+            self.queue.put(_STOP)
+            self.join(timeout)
+        if not self.is_alive():
+            self._drain()
+    
+    def _drain(self) -> None:
+        """日志线程退出后写出仍留在队列中的日志（排在 _STOP 之后入队的）"""
+        leftover = []
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                leftover.append(item)
+        if leftover:
+            self._write(leftover)
+    
+    def _write(self, batch: List[Tuple[float, Dict[str, Any]]]) -> None:
+        lines = []
+        for timestamp, event_dict in batch:
+            try:
+                lines.append(self._render(timestamp, event_dict))
+            except Exception as e:
+                lines.append(orjson.dumps({"event": "Failed to render log event", "error": str(e)}))
+        try:
+            with self._write_lock:
+                self.stream.write(b"\n".join(lines) + b"\n")
+                self.stream.flush()
+        except Exception:
+            # 输出不可用时丢弃本批，日志线程不能退出
+            pass
+    
+    def _render(self, timestamp: float, event_dict: Dict[str, Any]) -> bytes:
+        event_dict["timestamp"] = datetime.fromtimestamp(timestamp, timezone.utc).isoformat()
+        if "exc_info" in event_dict or "stack_info" in event_dict:
+            event_dict = self._exc_formatter(None, "", event_dict)
+        if self._console is not None:
+            return self._console(None, "", event_dict).encode("utf-8", "replace")
+        return orjson.dumps(event_dict, default=str, option=orjson.OPT_NON_STR_KEYS)
+
+
+class QueueLogger:
+    """structlog 的输出端：把处理器链的结果交给日志线程"""
+    
+    __slots__ = ("name",)
+    
+    def __init__(self, name: Optional[str] = None):
+        self.name = name
+    
+    def msg(self, event_dict: Dict[str, Any]) -> None:
+        _emit(event_dict.pop("_timestamp", None) or time.time(), event_dict)
+    
+    debug = info = warning = warn = error = critical = exception = fatal = log = msg
+
+
+class QueueLoggerFactory:
+    def __call__(self, *args: Any) -> QueueLogger:
+        return QueueLogger(args[0] if args else None)
+
+
+class QueueHandler(logging.Handler):
+    """标准库日志（uvicorn、SQLAlchemy等）也经日志线程写出，避免与structlog输出交错"""
+    
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            event_dict = {
+                "event": record.getMessage(),
+                "logger": record.name,
+                "level": record.levelname.lower(),
+            }
+            if record.exc_info:
+                event_dict["exc_info"] = record.exc_info
+            _emit(record.created, event_dict)
+        except Exception:
+            self.handleError(record)
+
+
+def _add_logger_name(logger: Any, method_name: str, event_dict: Dict[str, Any]) -> Dict[str, Any]:
+    if logger.name is not None:
+        event_dict["logger"] = logger.name
+    return event_dict
+
+
+def _capture_exc_info(logger: Any, method_name: str, event_dict: Dict[str, Any]) -> Dict[str, Any]:
+    # 异常信息只能在抛出异常的线程里取得，格式化留给日志线程
+    if event_dict.get("exc_info") is True:
+        event_dict["exc_info"] = sys.exc_info()
+    return event_dict
+
+
+def _capture_time(logger: Any, method_name: str, event_dict: Dict[str, Any]) -> Dict[str, Any]:
+    # 缓冲后写出的事件保留产生时的时间
+    event_dict["_timestamp"] = time.time()
+    return event_dict
+
+
+def _to_queue(logger: Any, method_name: str, event_dict: Dict[str, Any]) -> Tuple[tuple, dict]:
+    return (event_dict,), {}
+
+
+# 采样之后执行的处理器（限速、渲染），缓冲的事件在请求结束后经这些处理器写出
+_tail_processors: List[Callable] = []
+
+_SUPPRESSED_EVENT = "Suppressed repeated log events"
+
+
+def _dispatch(logger: Any, method_name: str, event_dict: Dict[str, Any]) -> None:
+    """按 structlog 的方式执行尾部处理器并交给底层logger"""
+    try:
+        for processor in _tail_processors:
+            event_dict = processor(logger, method_name, event_dict)
+    except structlog.DropEvent:
+        return
+    if isinstance(event_dict, (str, bytes, bytearray)):
+        args, kwargs = (event_dict,), {}
+    elif isinstance(event_dict, tuple):
+        args, kwargs = event_dict
+    else:
+        args, kwargs = (), event_dict
+    getattr(logger, method_name)(*args, **kwargs)
+
+
+class _RequestBuffer:
+    """单个请求内缓冲的日志"""
+    
+    __slots__ = ("entries", "rate", "keep", "exempt", "closed")
+    
+    def __init__(self):
+        self.entries: List[Tuple[Any, str, Dict[str, Any]]] = []
+        self.rate = 1.0
+        self.keep = False
+        # 因出错或慢请求而保留的请求不受限速影响
+        self.exempt = False
+        self.closed = False
+
+
+_request_buffer: ContextVar[Optional[_RequestBuffer]] = ContextVar("log_buffer", default=None)
+
+
+class LogSampler:
+    """尾部采样处理器
+    
+    请求内的事件先缓冲，请求结束时以其中各事件采样率的最小值决定整体去留；
+    出现 warning 及以上级别的事件时立即写出已缓冲的事件，之后不再缓冲。
+    请求之外的事件按各自的采样率逐条采样，warning 及以上总是保留。
+    """
+    
+    def __init__(
+        self,
+        rates: Optional[Dict[str, float]] = None,
+        default_rate: float = 1.0,
+        slow_threshold: float = 1.0,
+        max_buffer: int = 1000,
+    ):
+        self.rates = rates or {}
+        self.default_rate = default_rate
+        self.slow_threshold = slow_threshold
+        self.max_buffer = max_buffer
+    
+    def rate_for(self, event: Any) -> float:
+        return self.rates.get(event, self.default_rate)
+    
+    def __call__(self, logger: Any, method_name: str, event_dict: Dict[str, Any]) -> Dict[str, Any]:
+        important = logging.getLevelName(str(event_dict.get("level", "info")).upper())
+        important = isinstance(important, int) and important >= logging.WARNING
+        buffer = _request_buffer.get()
+        if buffer is None or buffer.closed:
+            if important or random.random() < self.rate_for(event_dict.get("event")):
+                return event_dict
+            raise structlog.DropEvent
+        
+        if buffer.keep:
+            return event_dict
+        if important or len(buffer.entries) >= self.max_buffer:
+            self._flush(buffer, exempt=important)
+            return event_dict
+        
+        buffer.entries.append((logger, method_name, event_dict))
+        buffer.rate = min(buffer.rate, self.rate_for(event_dict.get("event")))
+        raise structlog.DropEvent
+    
+    def begin_request(self) -> Token:
+        return _request_buffer.set(_RequestBuffer())
+    
+    def end_request(self, token: Token, status_code: int, duration: float) -> bool:
+        """结束请求，返回是否保留了该请求的日志"""
+        buffer = _request_buffer.get()
+        try:
+            if buffer is None:
+                return True
+            if buffer.keep:
+                return True
+            if status_code >= 500 or duration >= self.slow_threshold:
+                self._flush(buffer, exempt=True)
+                return True
+            if random.random() < buffer.rate:
+                self._flush(buffer)
+                return True
+            buffer.entries.clear()
+            return False
+        finally:
+            if buffer is not None:
+                buffer.closed = True
+            _request_buffer.reset(token)
+    
+    @staticmethod
+    def _flush(buffer: _RequestBuffer, exempt: bool = False) -> None:
+        buffer.keep = True
+        buffer.exempt = buffer.exempt or exempt
+        entries, buffer.entries = buffer.entries, []
+        for logger, method_name, event_dict in entries:
+            _dispatch(logger, method_name, event_dict)
+
+
+class LogRateLimiter:
+    """按 (logger, 事件名) 限速的处理器
+    
+    每个窗口内同一事件最多写出 burst 条，超出的丢弃并计数；
+    窗口结束后的第一次日志调用把各事件被抑制的条数汇总为一行 warning。
+    因出错或慢请求而保留的请求中的事件不受限速。
+    """
+    
+    def __init__(
+        self,
+        burst: int = 100,
+        window: float = 60.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.burst = burst
+        self.window = window
+        self.clock = clock
+        self._counts: Dict[Tuple[Any, Any], int] = {}
+        self._suppressed: Dict[Tuple[Any, Any], int] = {}
+        self._window_end = clock() + window
+        self._lock = threading.Lock()
+    
+    def __call__(self, logger: Any, method_name: str, event_dict: Dict[str, Any]) -> Dict[str, Any]:
+        event = event_dict.get("event")
+        buffer = _request_buffer.get()
+        if event == _SUPPRESSED_EVENT or (buffer is not None and buffer.exempt):
+            return event_dict
+        
+        key = (event_dict.get("logger"), event)
+        with self._lock:
+            summary = self._rollover()
+            count = self._counts.get(key, 0) + 1
+            self._counts[key] = count
+            if count > self.burst:
+                self._suppressed[key] = self._suppressed.get(key, 0) + 1
+                allowed = False
+            else:
+                allowed = True
+        
+        if summary:
+            self._report(summary)
+        if not allowed:
+            raise structlog.DropEvent
+        return event_dict
+    
+    def _rollover(self) -> Dict[Tuple[Any, Any], int]:
+        now = self.clock()
+        if now < self._window_end:
+            return {}
+        summary, self._suppressed = self._suppressed, {}
+        self._counts = {}
+        self._window_end = now + self.window
+        return summary
+    
+    def _report(self, summary: Dict[Tuple[Any, Any], int]) -> None:
+        # 汇总行不属于当前请求，不参与该请求的采样
+        token = _request_buffer.set(None)
+        try:
+            for (logger_name, event), suppressed in summary.items():
+                get_logger(logger_name or "logging").warning(
+                    _SUPPRESSED_EVENT,
+                    suppressed_event=event,
+                    suppressed=suppressed,
+                    window_seconds=self.window,
+                )
+        finally:
+            _request_buffer.reset(token)
+
+
+_sampler: Optional[LogSampler] = None
+
+
+def begin_request_sampling() -> Optional[Token]:
+    """开始缓冲当前请求的日志，未启用采样时返回 None"""
+    return _sampler.begin_request() if _sampler is not None else None
+
+
+def end_request_sampling(token: Optional[Token], status_code: int, duration: float) -> None:
+    """请求结束，决定缓冲的日志写出还是丢弃"""
+    if token is not None and _sampler is not None:
+        _sampler.end_request(token, status_code, duration)
+
+
+def _sampling_processors() -> Tuple[List[Callable], List[Callable]]:
+    """返回 (采样处理器, 限速处理器)，未启用时为空"""
+    global _sampler
+    config = settings.logging
+    head: List[Callable] = []
+    tail: List[Callable] = []
+    if config.sampling_enabled:
+        _sampler = LogSampler(
+            rates=config.sample_rates,
+            default_rate=config.sample_default_rate,
+            slow_threshold=config.slow_request_threshold,
+        )
+        head.append(_sampler)
+    if config.rate_limit_burst > 0:
+        tail.append(LogRateLimiter(config.rate_limit_burst, config.rate_limit_window))
+    return head, tail
+
+
+_writer: Optional[LogWriter] = None
+# 日志线程停止后（shutdown_logging 之后）用于直接写出的已停止的写入器
+_stopped_writer: Optional[LogWriter] = None
+
+
+def _emit(timestamp: float, event_dict: Dict[str, Any]) -> None:
+    writer = _writer
+    if writer is not None:
+        writer.put(timestamp, event_dict)
+    elif _stopped_writer is not None:
+        _stopped_writer.write_now(timestamp, event_dict)
+
+
+def _start_writer() -> None:
+    global _writer
+    config = settings.logging
+    _writer = LogWriter(
+        sys.stdout.buffer,
+        queue_size=config.queue_size,
+        batch_size=config.batch_size,
+        flush_interval=config.flush_interval,
+        overflow=config.overflow,
+        json_format=config.format == "json",
+    )
+    _writer.start()
+
+
+def shutdown_logging(timeout: float = 5.0) -> None:
+    """写出队列中剩余的日志并停止日志线程，队列模式以外无操作
+    
+    之后的日志在调用线程中同步写出。
+    """
+    global _writer, _stopped_writer
+    writer = _writer
+    if writer is None:
+        return
+    _writer = None
+    _stopped_writer = writer
+    writer.stop(timeout)
+
+
+def _configure_queue_logging(level: int) -> None:
+    _start_writer()
+    logging.basicConfig(level=level, handlers=[QueueHandler()], force=True)
+    sampling, rate_limit = _sampling_processors()
+    _tail_processors[:] = [*rate_limit, _to_queue]
+    structlog.configure(
+        processors=[
+            structlog.stdlib.add_log_level,
+            _add_logger_name,
+            _capture_time,
+            structlog.processors.StackInfoRenderer(),
+            _capture_exc_info,
+            *sampling,
+            *_tail_processors,
+        ],
+        context_class=dict,
+        logger_factory=QueueLoggerFactory(),
+        wrapper_class=structlog.make_filtering_bound_logger(level),
+        cache_logger_on_first_use=True,
+    )
+    atexit.register(shutdown_logging)
+    # fork 出的子进程（如Celery prefork worker）中没有日志线程，需重新启动
+    os.register_at_fork(after_in_child=_start_writer)
 
 
 def configure_logging() -> None:
     """配置结构化日志"""
     
+    if settings.logging.async_enabled:
+        _configure_queue_logging(getattr(logging, settings.logging.level.upper()))
+        return
+    
     # 配置标准库日志
     logging.basicConfig(
         format="%(message)s",
@@ -25,7 +529,13 @@ def configure_logging() -> None:
         level=getattr(logging, settings.logging.level.upper()),
     )
     
-    # 配置structlog
+    # 配置structlog（时间戳和异常信息须在采样缓冲之前生成）
+    sampling, rate_limit = _sampling_processors()
+    _tail_processors[:] = [
+        *rate_limit,
+        structlog.processors.UnicodeDecoder(),
+        structlog.processors.JSONRenderer() if settings.logging.format == "json" else structlog.dev.ConsoleRenderer(),
+    ]
     structlog.configure(
         processors=[
             structlog.stdlib.filter_by_level,
@@ -35,8 +545,8 @@ def configure_logging() -> None:
             structlog.processors.TimeStamper(fmt="iso"),
             structlog.processors.StackInfoRenderer(),
             structlog.processors.format_exc_info,
-            structlog.processors.UnicodeDecoder(),
-            structlog.processors.JSONRenderer() if settings.logging.format == "json" else structlog.dev.ConsoleRenderer(),
+            *sampling,
+            *_tail_processors,
         ],
         context_class=dict,
         logger_factory=LoggerFactory(),
@@ -60,71 +570,60 @@ class LoggerMixin:
 
 
 # 性能监控装饰器
-def log_performance(logger_name: Optional[str] = None):
-    """记录函数执行性能的装饰器"""
+def log_performance(logger_name: Optional[str] = None, slow_threshold: Optional[float] = None):
+    """记录函数耗时的装饰器，同步和异步函数均可使用
+    
+    每次调用只计入进程内的耗时直方图（见 perf 模块），不写日志。
+    耗时超过 slow_threshold 秒（默认 LOG_SLOW_CALL_THRESHOLD，未设置时不记录）
+    的调用记录一条 warning。
+    """
+    threshold = slow_threshold if slow_threshold is not None else settings.logging.slow_call_threshold
+    threshold_ns = int(threshold * 1e9) if threshold is not None else None
+    
     def decorator(func):
+        name = f"{func.__module__}.{func.__qualname__}"
+        histogram = get_histogram(name)
+        
+        def record(start: int, error: bool) -> None:
+            duration = time.perf_counter_ns() - start
+            histogram.record(duration, error)
+            if threshold_ns is not None and duration >= threshold_ns:
+                get_logger(logger_name or func.__module__).warning(
+                    "Slow function call",
+                    function=name,
+                    duration_ms=round(duration / 1e6, 2),
+                    status="error" if error else "success",
+                )
+        
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                start = time.perf_counter_ns()
+                error = True
+                try:
+                    result = await func(*args, **kwargs)
+                    error = False
+                    return result
+                finally:
+                    record(start, error)
+            return async_wrapper
+        
+        @functools.wraps(func)
         def wrapper(*args, **kwargs):
-            import time
-            logger = get_logger(logger_name or func.__module__)
-            
-            start_time = time.time()
+            start = time.perf_counter_ns()
+            error = True
             try:
                 result = func(*args, **kwargs)
-                execution_time = time.time() - start_time
-                logger.info(
-                    "function_executed",
-                    function=func.__name__,
-                    execution_time=execution_time,
-                    status="success"
-                )
+                error = False
                 return result
-            except Exception as e:
-                execution_time = time.time() - start_time
-                logger.error(
-                    "function_failed",
-                    function=func.__name__,
-                    execution_time=execution_time,
-                    error=str(e),
-                    status="error"
-                )
-                raise
-        
+            finally:
+                record(start, error)
         return wrapper
     return decorator
 
 
-# 异步性能监控装饰器
-def log_async_performance(logger_name: Optional[str] = None):
-    """记录异步函数执行性能的装饰器"""
-    def decorator(func):
-        async def wrapper(*args, **kwargs):
-            import time
-            logger = get_logger(logger_name or func.__module__)
-            
-            start_time = time.time()
-            try:
-                result = await func(*args, **kwargs)
-                execution_time = time.time() - start_time
-                logger.info(
-                    "async_function_executed",
-                    function=func.__name__,
-                    execution_time=execution_time,
-                    status="success"
-                )
-                return result
-            except Exception as e:
-                execution_time = time.time() - start_time
-                logger.error(
-                    "async_function_failed",
-                    function=func.__name__,
-                    execution_time=execution_time,
-                    error=str(e),
-                    status="error"
-                )
-                raise
-        
-        return wrapper
-    return decorator
+# 异步性能监控装饰器（log_performance 已自动识别异步函数，保留此名称以兼容）
+log_async_performance = log_performance
 
 
 # 请求日志中间件
@@ -138,6 +637,14 @@ class RequestLoggingMiddleware:
     async def __call__(self, scope, receive, send):
         if scope["type"] == "http":
             start_time = time.time()
+            status_code = 500
+            sampling_token = begin_request_sampling()
+            
+            async def send_with_status(message):
+                nonlocal status_code
+                if message["type"] == "http.response.start":
+                    status_code = message["status"]
+                await send(message)
             
             # 记录请求开始
             self.logger.info(
@@ -149,16 +656,19 @@ class RequestLoggingMiddleware:
             )
             
             # 处理请求
-            await self.app(scope, receive, send)
-            
-            # 记录请求结束
-            execution_time = time.time() - start_time
-            self.logger.info(
-                "request_finished",
-                method=scope.get("method"),
-                path=scope.get("path"),
-                execution_time=execution_time,
-            )
+            try:
+                await self.app(scope, receive, send_with_status)
+            finally:
+                # 记录请求结束
+                execution_time = time.time() - start_time
+                self.logger.info(
+                    "request_finished",
+                    method=scope.get("method"),
+                    path=scope.get("path"),
+                    status_code=status_code,
+                    execution_time=execution_time,
+                )
+                end_request_sampling(sampling_token, status_code, execution_time)
         else:
             await self.app(scope, receive, send)
 
@@ -0,0 +1,161 @@
+"""
+HTTP请求指标
+
+纯ASGI中间件在一次请求处理中同时记录Prometheus指标和请求日志，
+不经过 BaseHTTPMiddleware 的任务和流包装，流式响应也不会被缓冲。
+
+endpoint 标签取匹配到的路由模板（如 /users/{user_id}），未匹配任何路由的
+请求统一记为 UNMATCHED_ENDPOINT，时间序列数量不随URL中的ID增长。
+多worker运行时通过 prometheus_client 的多进程模式（mmap 值文件）聚合，
+一次抓取即可得到所有worker的指标。
+"""
+
+import glob
+import os
+import tempfile
+import time
+from typing import Any, Dict
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess,
+)
+from starlette.routing import Match
+
+from . import query_metrics
+from .config import settings
+from .logging import begin_request_sampling, end_request_sampling, get_logger
+
+UNMATCHED_ENDPOINT = "<unmatched>"
+MULTIPROC_ENV = "PROMETHEUS_MULTIPROC_DIR"
+
+REQUEST_COUNT = Counter(
+    "http_requests_total",
+    "Total number of HTTP requests",
+    ["method", "endpoint", "status"]
+)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency in seconds",
+    ["method", "endpoint"],
+    buckets=settings.monitoring.http_latency_buckets,
+)
+
+REQUEST_TTFB = Histogram(
+    "http_request_ttfb_seconds",
+    "Time until the response headers are sent in seconds",
+    ["method", "endpoint"],
+    buckets=settings.monitoring.http_latency_buckets,
+)
+
+
+def route_template(scope: Dict[str, Any]) -> str:
+    """请求对应的路由模板
+    
+    正常请求由路由器写入 scope["route"]；在路由之前就返回的请求（如限流的429）
+    再按应用的路由表匹配一次，仍未匹配时返回 UNMATCHED_ENDPOINT。
+    """
+    route = scope.get("route")
+    if route is None:
+        app = scope.get("app")
+        for candidate in getattr(app, "routes", ()):
+            match, _ = candidate.matches(scope)
+            if match != Match.NONE:
+                route = candidate
+                break
+    if route is None:
+        return UNMATCHED_ENDPOINT
+    return getattr(route, "path_format", None) or getattr(route, "path", UNMATCHED_ENDPOINT)
+
+
+def setup_multiprocess(workers: int) -> None:
+    """多worker启动前准备多进程指标目录，须在worker进程导入 prometheus_client 之前调用
+    
+    已设置 PROMETHEUS_MULTIPROC_DIR 时沿用（如gunicorn部署），否则使用
+    MONITORING_MULTIPROC_DIR 或新建临时目录，并删除上次运行留下的值文件
+    （只删除目录下的 *.db，目录本身和其他文件保留）。
+    """
+    if workers <= 1 or os.environ.get(MULTIPROC_ENV):
+        return
+    
+    directory = settings.monitoring.multiproc_dir or tempfile.mkdtemp(prefix="prometheus_")
+    os.makedirs(directory, exist_ok=True)
+    for path in glob.glob(os.path.join(directory, "*.db")):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    os.environ[MULTIPROC_ENV] = directory
+
+
+def mark_process_dead() -> None:
+    """worker退出时清理本进程的实时Gauge文件"""
+    if os.environ.get(MULTIPROC_ENV):
+        multiprocess.mark_process_dead(os.getpid())
+
+
+def render_metrics() -> tuple:
+    """返回 (指标文本, Content-Type)，多进程模式下聚合所有worker"""
+    if os.environ.get(MULTIPROC_ENV):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+class RequestMetricsMiddleware:
+    """请求指标与日志中间件
+    
+    首字节时间在响应头发出时记录，总耗时在最后一个响应体分块发出后记录，
+    因此流式响应的两个指标都能反映真实情况。应用抛出异常时按500记录。
+    请求内的日志按尾部采样整体保留或丢弃。
+    """
+    
+    def __init__(self, app):
+        self.app = app
+        self.logger = get_logger("request")
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        start = time.perf_counter()
+        status_code = 500
+        ttfb = None
+        
+        async def send_with_timing(message):
+            nonlocal status_code, ttfb
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                ttfb = time.perf_counter() - start
+            await send(message)
+        
+        query_token = query_metrics.begin_request()
+        sampling_token = begin_request_sampling()
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            duration = time.perf_counter() - start
+            method = scope["method"]
+            endpoint = route_template(scope)
+            query_stats = query_metrics.end_request(query_token, method, endpoint)
+            
+            REQUEST_COUNT.labels(method=method, endpoint=endpoint, status=status_code).inc()
+            REQUEST_LATENCY.labels(method=method, endpoint=endpoint).observe(duration)
+            if ttfb is not None:
+                REQUEST_TTFB.labels(method=method, endpoint=endpoint).observe(ttfb)
+            
+            client = scope.get("client")
+            self.logger.info(
+                "Request completed",
+                method=method,
+                path=scope["path"],
+                endpoint=endpoint,
+                status_code=status_code,
+                duration_ms=round(duration * 1000, 2),
+                ttfb_ms=round(ttfb * 1000, 2) if ttfb is not None else None,
+                db_queries=query_stats.count if query_stats else 0,
+                client=client[0] if client else None,
+            )
+            end_request_sampling(sampling_token, status_code, duration) 
\ No newline at end of file
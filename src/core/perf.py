@@ -0,0 +1,149 @@
+"""
+函数耗时直方图
+
+log_performance 装饰的函数每次调用只在进程内的对数分桶直方图中计数，
+不写日志。直方图以 Prometheus summary（带 p50/p95/p99 分位数）导出，
+也可通过 /debug/perf 查看JSON快照。
+
+分桶方式与 HdrHistogram 相同：每个2的幂区间再等分为16个子桶，
+相对误差不超过 1/16。计数不加锁，多线程并发时可能偶尔少计一次，
+换取热路径上只有几次整数运算。
+分位数无法跨进程合并，多进程指标模式下 /metrics 不包含这些summary，
+需通过各worker的 /debug/perf 查看。
+"""
+
+from typing import Any, Dict, Iterator, List
+
+from prometheus_client.core import REGISTRY, Metric
+
+_SUB_BITS = 4
+_SUB_COUNT = 1 << _SUB_BITS
+_SUB_MASK = _SUB_COUNT - 1
+# 覆盖 0 到 2^64 纳秒
+_BUCKET_COUNT = (64 - _SUB_BITS + 1) * _SUB_COUNT
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def bucket_index(value: int) -> int:
+    """纳秒值对应的桶序号"""
+    if value < _SUB_COUNT:
+        return max(value, 0)
+    exponent = value.bit_length() - 1
+    shift = exponent - _SUB_BITS
+    return (shift + 1) * _SUB_COUNT + ((value >> shift) & _SUB_MASK)
+
+
+def bucket_upper(index: int) -> int:
+    """桶内的最大纳秒值"""
+    if index < _SUB_COUNT:
+        return index
+    shift = index // _SUB_COUNT - 1
+    lower = (_SUB_COUNT + index % _SUB_COUNT) << shift
+    return lower + (1 << shift) - 1
+
+
+class LatencyHistogram:
+    """单个函数的耗时直方图（纳秒）"""
+    
+    __slots__ = ("name", "counts", "count", "total", "max", "errors")
+    
+    def __init__(self, name: str):
+        self.name = name
+        self.counts: List[int] = [0] * _BUCKET_COUNT
+        self.count = 0
+        self.total = 0
+        self.max = 0
+        self.errors = 0
+    
+    def record(self, duration_ns: int, error: bool = False) -> None:
+        self.counts[bucket_index(duration_ns)] += 1
+        self.count += 1
+        self.total += duration_ns
+        if duration_ns > self.max:
+            self.max = duration_ns
+        if error:
+            self.errors += 1
+    
+    def percentile(self, quantile: float) -> int:
+        """分位数（纳秒），不超过记录到的最大值"""
+        if not self.count:
+            return 0
+        target = max(1, quantile * self.count)
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= target:
+                return min(bucket_upper(index), self.max)
+        return self.max
+    
+    def snapshot(self) -> Dict[str, Any]:
+        """以毫秒为单位的统计快照"""
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "mean_ms": round(self.total / self.count / 1e6, 4) if self.count else 0.0,
+            **{
+                f"p{int(quantile * 100)}_ms": round(self.percentile(quantile) / 1e6, 4)
+                for quantile in QUANTILES
+            },
+            "max_ms": round(self.max / 1e6, 4),
+        }
+    
+    def reset(self) -> None:
+        self.counts = [0] * _BUCKET_COUNT
+        self.count = self.total = self.max = self.errors = 0
+
+
+_histograms: Dict[str, LatencyHistogram] = {}
+
+
+def get_histogram(name: str) -> LatencyHistogram:
+    """按函数名获取直方图，不存在时创建"""
+    histogram = _histograms.get(name)
+    if histogram is None:
+        histogram = _histograms.setdefault(name, LatencyHistogram(name))
+    return histogram
+
+
+def perf_snapshot() -> Dict[str, Dict[str, Any]]:
+    """所有函数的统计快照，按总耗时降序"""
+    histograms = sorted(_histograms.values(), key=lambda h: h.total, reverse=True)
+    return {histogram.name: histogram.snapshot() for histogram in histograms}
+
+
+def reset_perf() -> None:
+    for histogram in list(_histograms.values()):
+        histogram.reset()
+
+
+class PerfCollector:
+    """以 summary 导出各函数的耗时直方图"""
+    
+    def collect(self) -> Iterator[Metric]:
+        metric = Metric(
+            "function_duration_seconds",
+            "Latency of functions decorated with log_performance",
+            "summary",
+        )
+        errors = Metric(
+            "function_errors",
+            "Calls of functions decorated with log_performance that raised",
+            "counter",
+        )
+        for histogram in list(_histograms.values()):
+            labels = {"function": histogram.name}
+            for quantile in QUANTILES:
+                metric.add_sample(
+                    "function_duration_seconds",
+                    {**labels, "quantile": str(quantile)},
+                    histogram.percentile(quantile) / 1e9,
+                )
+            metric.add_sample("function_duration_seconds_count", labels, histogram.count)
+            metric.add_sample("function_duration_seconds_sum", labels, histogram.total / 1e9)
+            errors.add_sample("function_errors_total", labels, histogram.errors)
+        yield metric
+        yield errors
+
+
+REGISTRY.register(PerfCollector()) 
\ No newline at end of file
@@ -0,0 +1,252 @@
+"""
+查询结果缓存
+
+以编译后的SQL、绑定参数和所涉及各表的版本号作为缓存键，将查询结果行缓存到
+CacheManager。每张表在Redis中有一个版本号（即 "table:<表名>" 命名空间的版本），
+会话提交时自动递增本事务写过的表的版本号，涉及该表的所有缓存查询随之失效，
+无需手动管理缓存键。
+"""
+
+import hashlib
+import json
+import threading
+from typing import Any, Dict, List, Optional, Set
+
+import redis
+from prometheus_client import Counter
+from sqlalchemy import Table, event
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Select
+from sqlalchemy.sql.util import find_tables
+from sqlalchemy.util.concurrency import await_only, in_greenlet
+
+from .cache import NAMESPACE_KEY_PREFIX, cache, shard_index
+from .codecs import JSONCodec
+from .config import settings
+from .logging import get_logger
+
+logger = get_logger(__name__)
+
+QUERY_KEY_PREFIX = "query:"
+_PENDING_TABLES = "query_cache_pending_tables"
+
+_json = JSONCodec()
+
+INVALIDATION_FAILURES = Counter(
+    "query_cache_invalidation_failures_total",
+    "Commits whose table versions could not be bumped",
+)
+
+# 同步会话提交时使用的同步Redis连接（每个缓存节点一个）
+_sync_clients: List[redis.Redis] = []
+_sync_clients_lock = threading.Lock()
+
+
+def table_namespace(table_name: str) -> str:
+    """表版本号对应的缓存命名空间"""
+    return f"table:{table_name}"
+
+
+def _statement_tables(stmt: Any) -> Set[str]:
+    """语句涉及的全部表名（含子查询和JOIN）"""
+    return {
+        table.fullname
+        for table in find_tables(
+            stmt, include_aliases=True, include_joins=True, include_selects=True
+        )
+        if isinstance(table, Table)
+    }
+
+
+def _mark_tables(session: Session, tables: Set[str]) -> None:
+    if tables:
+        session.info.setdefault(_PENDING_TABLES, set()).update(tables)
+
+
+def mark_tables_written(session: Session, *tables: str) -> None:
+    """登记绕过ORM事件的写入（如 COPY），提交时一并递增这些表的版本号"""
+    if settings.database.query_cache_enabled:
+        _mark_tables(session, set(tables))
+
+
+def _after_flush(session: Session, flush_context) -> None:
+    tables: Set[str] = set()
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        tables.update(table.fullname for table in sa_inspect(obj).mapper.tables)
+    _mark_tables(session, tables)
+
+
+def _do_orm_execute(orm_execute_state) -> None:
+    # 覆盖 session.execute(insert/update/delete(...))，包括ORM批量操作
+    # 和 after_bulk_update/after_bulk_delete 对应的旧式 Query 批量写入
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, "table", None)
+        if isinstance(table, Table):
+            _mark_tables(orm_execute_state.session, {table.fullname})
+
+
+def _after_transaction_end(session: Session, transaction) -> None:
+    # 只在最外层事务结束时清理，回滚到保存点不影响之前的写入
+    if transaction.parent is None:
+        session.info.pop(_PENDING_TABLES, None)
+
+
+def _after_commit(session: Session) -> None:
+    tables = session.info.pop(_PENDING_TABLES, None)
+    if not tables:
+        return
+    
+    try:
+        if in_greenlet():
+            # 异步会话：事件在 greenlet 内触发，可以直接等待，提交返回前版本号已递增
+            await_only(bump_table_versions(tables))
+        else:
+            # 同步会话（线程池、Celery、脚本）：不依赖事件循环，用同步连接递增
+            bump_table_versions_sync(tables)
+    except Exception as e:
+        # 事务已提交，不能再向调用方抛出；记为错误并计数以便告警
+        INVALIDATION_FAILURES.inc()
+        logger.error(
+            "Failed to bump table versions, cached queries may be stale until TTL",
+            tables=sorted(tables),
+            error=str(e),
+            exc_info=True,
+        )
+
+
+async def bump_table_versions(tables: Set[str]) -> None:
+    """递增各表版本号，使涉及这些表的缓存查询失效"""
+    for table_name in sorted(tables):
+        await cache.invalidate_namespace(table_namespace(table_name))
+
+
+def _get_sync_clients() -> List[redis.Redis]:
+    if not _sync_clients:
+        with _sync_clients_lock:
+            if not _sync_clients:
+                _sync_clients.extend(
+                    redis.Redis.from_url(url, max_connections=settings.redis.pool_size)
+                    for url in settings.redis.nodes or [settings.redis.url]
+                )
+    return _sync_clients
+
+
+def bump_table_versions_sync(tables: Set[str]) -> None:
+    """bump_table_versions 的同步版本，供不在事件循环中的同步会话使用
+    
+    与 CacheManager.incr 一致：按键路由到所属分片，启用L1时同一管道内广播失效。
+    """
+    clients = _get_sync_clients()
+    groups: Dict[int, List[str]] = {}
+    for table_name in sorted(tables):
+        key = f"{NAMESPACE_KEY_PREFIX}{table_namespace(table_name)}"
+        groups.setdefault(shard_index(key, len(clients)), []).append(key)
+    
+    for index, keys in groups.items():
+        with clients[index].pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.incr(key)
+            if cache.local is not None:
+                pipe.publish(settings.redis.invalidation_channel, json.dumps(keys))
+            pipe.execute()
+        if cache.local is not None:
+            for key in keys:
+                cache.local.invalidate(key)
+
+
+def track_table_writes(session_class: type = Session) -> None:
+    """为会话类注册写入追踪事件，提交后自动递增写过的表的版本号"""
+    if not settings.database.query_cache_enabled:
+        return
+    if event.contains(session_class, "after_commit", _after_commit):
+        return
+    event.listen(session_class, "after_flush", _after_flush)
+    event.listen(session_class, "do_orm_execute", _do_orm_execute)
+    event.listen(session_class, "after_commit", _after_commit)
+    event.listen(session_class, "after_transaction_end", _after_transaction_end)
+
+
+async def cached_query(
+    session: AsyncSession,
+    stmt: Select,
+    expire: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """执行查询并缓存结果行
+    
+    返回字典列表：选择单个ORM实体时为 to_dict() 的结果，否则为列名到值的映射。
+    命中与未命中返回同样经过序列化的值（JSON编解码器下日期为ISO字符串）。
+    会话中有未提交的写入涉及查询的表时直接查询数据库，保证读到自己的写入。
+    未命中时的回填查询固定走主库：提交后版本号已递增，若从滞后的副本读取，
+    旧数据会以新版本号写入缓存，直到TTL过期。
+    """
+    tables = _statement_tables(stmt)
+    pending = session.sync_session.info.get(_PENDING_TABLES, set())
+    if (
+        not settings.database.query_cache_enabled
+        or not tables
+        or pending & tables
+        or session.new
+        or session.dirty
+        or session.deleted
+    ):
+        return await _execute(session, stmt)
+    
+    names = sorted(tables)
+    compiled = stmt.compile(dialect=session.get_bind().dialect)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(str(compiled).encode())
+    digest.update(repr(sorted(compiled.params.items())).encode())
+    try:
+        versions = await cache.get_many(
+            [f"{NAMESPACE_KEY_PREFIX}{table_namespace(name)}" for name in names], default=0
+        )
+        digest.update(repr(list(versions.values())).encode())
+        cache_key = f"{QUERY_KEY_PREFIX}{'+'.join(names)}:{digest.hexdigest()}"
+        payload = await cache.get(cache_key, deserialize=False)
+    except Exception as e:
+        logger.warning("Query cache unavailable", error=str(e))
+        return await _execute(session, stmt)
+    
+    if payload is not None:
+        return cache._deserialize(payload)
+    
+    rows = await _execute(session, stmt, use_primary=True)
+    payload = _dumps(rows)
+    try:
+        await cache.set(
+            cache_key,
+            payload,
+            expire=expire or settings.database.query_cache_ttl,
+            serialize=False,
+        )
+    except Exception as e:
+        logger.warning("Query cache unavailable", error=str(e))
+    return cache._deserialize(payload)
+
+
+def _dumps(rows: List[Dict[str, Any]]) -> Any:
+    if cache.serializer is not None:
+        return cache.serializer.dumps(rows)
+    # 未配置编解码器时沿用文本JSON，日期等类型转为字符串
+    return _json.dumps(rows).decode("utf-8")
+
+
+async def _execute(
+    session: AsyncSession, stmt: Select, use_primary: bool = False
+) -> List[Dict[str, Any]]:
+    # use_primary 经 bind_arguments 传给 RoutingSession.get_bind，只影响本条语句
+    bind_arguments = {"use_primary": True} if use_primary else None
+    result = await session.execute(stmt, bind_arguments=bind_arguments)
+    descriptions = stmt.column_descriptions
+    if len(descriptions) == 1 and descriptions[0]["expr"] is descriptions[0]["entity"]:
+        entities = result.scalars().all()
+        return [
+            entity.to_dict() if hasattr(entity, "to_dict") else {
+                column.name: getattr(entity, column.key)
+                for column in entity.__table__.columns
+            }
+            for entity in entities
+        ]
+    return [dict(row) for row in result.mappings().all()] 
\ No newline at end of file
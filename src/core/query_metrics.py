@@ -0,0 +1,262 @@
+"""
+SQL查询监控
+
+通过引擎的 before/after_cursor_execute 事件记录每条语句的耗时：
+按归一化的SQL指纹汇总延迟直方图，统计每个请求的查询次数与数据库耗时，
+检测同一请求内重复执行同一指纹的 N+1 模式，并记录慢查询日志。
+另外导出连接池的占用、饱和度和借出等待时间。
+"""
+
+import hashlib
+import re
+import time
+from collections import Counter as CounterDict
+from contextvars import ContextVar, Token
+from functools import lru_cache
+from typing import Any, Callable, Optional, Tuple
+
+from prometheus_client import Counter, Gauge, Histogram
+from sqlalchemy import event
+from sqlalchemy import exc as sa_exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from .config import settings
+from .logging import get_logger
+
+logger = get_logger(__name__)
+
+QUERY_LATENCY = Histogram(
+    "db_query_duration_seconds",
+    "SQL statement latency in seconds by fingerprint",
+    ["operation", "fingerprint"],
+    buckets=settings.monitoring.db_latency_buckets,
+)
+
+REQUEST_QUERY_COUNT = Histogram(
+    "db_queries_per_request",
+    "Number of SQL statements executed per HTTP request",
+    ["method", "endpoint"],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200),
+)
+
+REQUEST_DB_TIME = Histogram(
+    "db_time_per_request_seconds",
+    "Total SQL time per HTTP request in seconds",
+    ["method", "endpoint"],
+    buckets=settings.monitoring.db_latency_buckets,
+)
+
+N_PLUS_ONE = Counter(
+    "db_n_plus_one_total",
+    "Requests that repeated the same SQL fingerprint more than the threshold",
+    ["method", "endpoint", "fingerprint"],
+)
+
+POOL_CONNECTIONS = Gauge(
+    "db_pool_connections",
+    "Connections in the pool by state",
+    ["engine", "state"],
+    multiprocess_mode="livesum",
+)
+
+POOL_LIMIT = Gauge(
+    "db_pool_limit",
+    "Maximum connections per process (pool_size + max_overflow)",
+    ["engine"],
+    multiprocess_mode="livesum",
+)
+
+POOL_SATURATION = Gauge(
+    "db_pool_saturation",
+    "Checked-out connections as a fraction of the pool limit",
+    ["engine"],
+    multiprocess_mode="livemax",
+)
+
+POOL_CHECKOUT_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time spent waiting for a pooled connection",
+    ["engine"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+
+POOL_CHECKOUT_TIMEOUTS = Counter(
+    "db_pool_checkout_timeouts_total",
+    "Checkouts that gave up after pool_timeout",
+    ["engine"],
+)
+
+# 归一化规则：参数占位符、字符串与数字字面量替换为 ?，IN列表和多行VALUES折叠
+_NORMALIZE_RULES = [
+    (re.compile(r"'(?:[^']|'')*'"), "?"),
+    (re.compile(r"\$\d+|%\(\w+\)s|%s|(?<!:):\w+"), "?"),
+    (re.compile(r"\b\d+(?:\.\d+)?\b"), "?"),
+    (re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)"), "(?+)"),
+    (re.compile(r"\(\?\+\)(?:\s*,\s*\(\?\+\))+"), "(?+)"),
+    (re.compile(r"\s+"), " "),
+]
+
+
+class QueryStats:
+    """单个请求内的查询统计"""
+    
+    __slots__ = ("count", "duration", "fingerprints", "statements")
+    
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints: CounterDict = CounterDict()
+        self.statements = {}
+
+
+_request_stats: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+
+@lru_cache(maxsize=4096)
+def fingerprint(statement: str) -> Tuple[str, str, str]:
+    """返回 (指纹ID, 归一化SQL, 操作类型)"""
+    normalized = statement.strip()
+    for pattern, replacement in _NORMALIZE_RULES:
+        normalized = pattern.sub(replacement, normalized)
+    fingerprint_id = hashlib.blake2b(normalized.encode(), digest_size=6).hexdigest()
+    operation = normalized.split(" ", 1)[0].lower() if normalized else "unknown"
+    return fingerprint_id, normalized, operation
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._query_start_time = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, "_query_start_time", None)
+    if start is None:
+        return
+    duration = time.perf_counter() - start
+    fingerprint_id, normalized, operation = fingerprint(statement)
+    QUERY_LATENCY.labels(operation=operation, fingerprint=fingerprint_id).observe(duration)
+    
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.count += 1
+        stats.duration += duration
+        stats.fingerprints[fingerprint_id] += 1
+        stats.statements.setdefault(fingerprint_id, normalized)
+    
+    if duration >= settings.database.slow_query_threshold:
+        logger.warning(
+            "Slow query",
+            fingerprint=fingerprint_id,
+            operation=operation,
+            sql=normalized,
+            duration_ms=round(duration * 1000, 2),
+            executemany=executemany,
+        )
+
+
+def instrument_engine(engine: Engine) -> None:
+    """为同步引擎注册监控事件，异步引擎传入其 sync_engine"""
+    if not settings.database.query_metrics_enabled:
+        return
+    if event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+class _TimedPoolMixin:
+    """记录连接池借出等待时间，并在借出/归还后刷新占用指标"""
+    
+    metrics_name = "default"
+    metrics_refresh: Optional[Callable[[Any], None]] = None
+    
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except sa_exc.TimeoutError:
+            POOL_CHECKOUT_TIMEOUTS.labels(engine=self.metrics_name).inc()
+            raise
+        finally:
+            POOL_CHECKOUT_WAIT.labels(engine=self.metrics_name).observe(
+                time.perf_counter() - start
+            )
+            if self.metrics_refresh is not None:
+                self.metrics_refresh(self)
+    
+    def _do_return_conn(self, record):
+        try:
+            super()._do_return_conn(record)
+        finally:
+            if self.metrics_refresh is not None:
+                self.metrics_refresh(self)
+    
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics_name = self.metrics_name
+        pool.metrics_refresh = self.metrics_refresh
+        return pool
+
+
+class TimedQueuePool(_TimedPoolMixin, QueuePool):
+    """带等待时间统计的同步连接池"""
+
+
+class TimedAsyncQueuePool(_TimedPoolMixin, AsyncAdaptedQueuePool):
+    """带等待时间统计的异步连接池"""
+
+
+def observe_pool(name: str, engine: Engine, limit: int) -> None:
+    """导出引擎连接池的占用情况
+    
+    连接池借出/归还后刷新取值（多进程模式下不能使用回调式Gauge），
+    只对 TimedQueuePool/TimedAsyncQueuePool 生效。
+    """
+    POOL_LIMIT.labels(engine=name).set(limit)
+    checked_out = POOL_CONNECTIONS.labels(engine=name, state="checked_out")
+    idle = POOL_CONNECTIONS.labels(engine=name, state="idle")
+    overflow = POOL_CONNECTIONS.labels(engine=name, state="overflow")
+    saturation = POOL_SATURATION.labels(engine=name)
+    
+    def refresh(pool) -> None:
+        in_use = pool.checkedout()
+        checked_out.set(in_use)
+        idle.set(pool.checkedin())
+        overflow.set(max(0, pool.overflow()))
+        saturation.set(in_use / limit if limit else 0.0)
+    
+    engine.pool.metrics_name = name
+    engine.pool.metrics_refresh = refresh
+
+
+def begin_request() -> Token:
+    """开始收集当前请求的查询统计"""
+    return _request_stats.set(QueryStats())
+
+
+def end_request(token: Token, method: str, endpoint: str) -> Optional[QueryStats]:
+    """结束收集，记录请求级指标并检查 N+1"""
+    stats = _request_stats.get()
+    _request_stats.reset(token)
+    if stats is None:
+        return None
+    
+    REQUEST_QUERY_COUNT.labels(method=method, endpoint=endpoint).observe(stats.count)
+    REQUEST_DB_TIME.labels(method=method, endpoint=endpoint).observe(stats.duration)
+    
+    threshold = settings.database.n_plus_one_threshold
+    for fingerprint_id, count in stats.fingerprints.items():
+        if count > threshold:
+            N_PLUS_ONE.labels(
+                method=method, endpoint=endpoint, fingerprint=fingerprint_id
+            ).inc()
+            logger.warning(
+                "Possible N+1 query",
+                method=method,
+                endpoint=endpoint,
+                fingerprint=fingerprint_id,
+                sql=stats.statements[fingerprint_id],
+                count=count,
+            )
+    return stats 
\ No newline at end of file
@@ -0,0 +1,276 @@
+"""
+分布式限流
+
+基于Redis GCRA算法的ASGI限流中间件。各进程以批量租约的方式从Redis领取令牌，
+本地令牌桶处理大多数请求，只有租约用尽时才执行一次Lua脚本访问Redis。
+"""
+
+import asyncio
+import json
+import math
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from .cache import get_redis
+from .config import settings
+from .logging import get_logger
+from .security import verify_token
+
+logger = get_logger(__name__)
+
+# GCRA批量租约：一次原子调用领取至多 requested 个令牌
+# 返回 {领取数, Redis中剩余可用数, 需等待微秒数, 桶恢复满额的微秒数}
+_GCRA_LEASE_SCRIPT = """
+local interval = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+
+local now_parts = redis.call("TIME")
+local now = tonumber(now_parts[1]) * 1000000 + tonumber(now_parts[2])
+local tat = tonumber(redis.call("GET", KEYS[1]) or now)
+if tat < now then
+    tat = now
+end
+
+local available = math.floor((now + burst - tat) / interval)
+local granted = math.min(requested, available)
+if granted <= 0 then
+    return {0, 0, tat - burst + interval - now, tat - now}
+end
+
+tat = tat + granted * interval
+redis.call("SET", KEYS[1], string.format("%.0f", tat), "PX", math.ceil((tat - now) / 1000))
+return {granted, available - granted, 0, tat - now}
+"""
+
+
+class RateLimit(NamedTuple):
+    """限流规则：window 秒内最多 requests 次"""
+    
+    requests: int
+    window: int
+    
+    @classmethod
+    def parse(cls, value: str) -> "RateLimit":
+        """解析 "100/60" 形式的规则"""
+        requests, _, window = value.partition("/")
+        return cls(int(requests), int(window or 60))
+
+
+class RateLimitResult(NamedTuple):
+    """限流判定结果"""
+    
+    allowed: bool
+    limit: int
+    remaining: int
+    reset_after: float
+    retry_after: float
+
+
+class _Bucket:
+    """本地令牌桶：持有从Redis租来的令牌"""
+    
+    __slots__ = ("tokens", "remaining", "reset_at", "retry_at", "lock")
+    
+    def __init__(self):
+        self.tokens = 0
+        self.remaining = 0
+        self.reset_at = 0.0
+        self.retry_at = 0.0
+        self.lock = asyncio.Lock()
+
+
+class RateLimiter:
+    """GCRA限流器
+    
+    每个桶从Redis一次领取 lease_size 个令牌在本地消耗，领取时已在Redis中记账，
+    因此多进程合计不会超过限额；被拒绝后在 retry_after 内直接本地拒绝。
+    Redis不可用时放行请求，并在 failure_backoff 秒内不再尝试。
+    """
+    
+    def __init__(
+        self,
+        key_prefix: str = "ratelimit:",
+        lease_size: int = 10,
+        max_buckets: int = 10000,
+        failure_backoff: float = 5.0,
+    ):
+        self.key_prefix = key_prefix
+        self.lease_size = lease_size
+        self.max_buckets = max_buckets
+        self.failure_backoff = failure_backoff
+        self._buckets: "OrderedDict[str, _Bucket]" = OrderedDict()
+        self._script: Any = None
+        self._redis_retry_at = 0.0
+    
+    async def hit(self, key: str, limit: RateLimit) -> RateLimitResult:
+        """消耗一个令牌"""
+        bucket = self._bucket(key)
+        now = time.monotonic()
+        
+        if bucket.tokens <= 0 and bucket.retry_at <= now:
+            async with bucket.lock:
+                # 等锁期间可能已由其他请求完成租约
+                if bucket.tokens <= 0 and bucket.retry_at <= time.monotonic():
+                    if not await self._lease(key, bucket, limit):
+                        return RateLimitResult(True, limit.requests, limit.requests, 0.0, 0.0)
+            now = time.monotonic()
+        
+        if bucket.tokens > 0:
+            bucket.tokens -= 1
+            return RateLimitResult(
+                True,
+                limit.requests,
+                bucket.remaining + bucket.tokens,
+                max(0.0, bucket.reset_at - now),
+                0.0,
+            )
+        
+        return RateLimitResult(
+            False,
+            limit.requests,
+            0,
+            max(0.0, bucket.reset_at - now),
+            max(0.0, bucket.retry_at - now),
+        )
+    
+    def _bucket(self, key: str) -> _Bucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = _Bucket()
+            self._buckets[key] = bucket
+            if len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+    
+    async def _lease(self, key: str, bucket: _Bucket, limit: RateLimit) -> bool:
+        """从Redis租用令牌，Redis不可用时返回 False"""
+        now = time.monotonic()
+        if now < self._redis_retry_at:
+            return False
+        
+        interval = max(1, int(limit.window * 1_000_000 / limit.requests))
+        lease = max(1, min(self.lease_size, limit.requests // 10))
+        try:
+            if self._script is None:
+                redis_client = await get_redis()
+                self._script = redis_client.register_script(_GCRA_LEASE_SCRIPT)
+            granted, remaining, retry_us, reset_us = await self._script(
+                keys=[f"{self.key_prefix}{key}"],
+                args=[interval, interval * limit.requests, lease],
+            )
+        except Exception as e:
+            logger.warning("Rate limiter unavailable, allowing requests", error=str(e))
+            self._redis_retry_at = now + self.failure_backoff
+            return False
+        
+        now = time.monotonic()
+        bucket.tokens = int(granted)
+        bucket.remaining = int(remaining)
+        bucket.reset_at = now + int(reset_us) / 1_000_000
+        bucket.retry_at = now + int(retry_us) / 1_000_000
+        return True
+
+
+def path_matches(path: str, prefix: str) -> bool:
+    """按完整路径段匹配前缀：/health 匹配 /health 与 /health/live，不匹配 /healthz"""
+    return path == prefix or path.startswith(prefix.rstrip("/") + "/")
+
+
+class RateLimitMiddleware:
+    """限流中间件
+    
+    身份优先取JWT中的 sub，无有效令牌时使用客户端IP；规则按路径最长前缀匹配
+    route_limits，未匹配时使用全局规则。响应附带 RateLimit-* 头，超限返回429。
+    OPTIONS 预检请求不计入配额；应挂在 CORSMiddleware 之内，使429也带CORS头。
+    """
+    
+    def __init__(
+        self,
+        app,
+        limiter: Optional[RateLimiter] = None,
+        default_limit: Optional[RateLimit] = None,
+        route_limits: Optional[Dict[str, str]] = None,
+        exempt_paths: Optional[Iterable[str]] = None,
+    ):
+        self.app = app
+        self.limiter = limiter or RateLimiter(lease_size=settings.rate_limit.lease_size)
+        self.default_limit = default_limit or RateLimit(
+            settings.rate_limit.requests, settings.rate_limit.window
+        )
+        routes = settings.rate_limit.route_limits if route_limits is None else route_limits
+        # 长前缀优先
+        self.route_limits: List[Tuple[str, RateLimit]] = sorted(
+            ((prefix, RateLimit.parse(rule)) for prefix, rule in routes.items()),
+            key=lambda item: len(item[0]),
+            reverse=True,
+        )
+        self.exempt_paths = tuple(
+            settings.rate_limit.exempt_paths if exempt_paths is None else exempt_paths
+        )
+    
+    async def __call__(self, scope, receive, send):
+        # 预检请求不计入配额
+        if (
+            scope["type"] != "http"
+            or scope["method"] == "OPTIONS"
+            or self._is_exempt(scope["path"])
+        ):
+            await self.app(scope, receive, send)
+            return
+        
+        route, limit = self._match(scope["path"])
+        result = await self.limiter.hit(f"{route}:{self._identity(scope)}", limit)
+        headers = [
+            (b"ratelimit-limit", str(result.limit).encode()),
+            (b"ratelimit-remaining", str(result.remaining).encode()),
+            (b"ratelimit-reset", str(math.ceil(result.reset_after)).encode()),
+            (b"ratelimit-policy", f"{limit.requests};w={limit.window}".encode()),
+        ]
+        
+        if not result.allowed:
+            body = json.dumps({"detail": "Too many requests"}).encode()
+            await send({
+                "type": "http.response.start",
+                "status": 429,
+                "headers": headers + [
+                    (b"retry-after", str(max(1, math.ceil(result.retry_after))).encode()),
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                ],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+        
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + headers
+            await send(message)
+        
+        await self.app(scope, receive, send_with_headers)
+    
+    def _is_exempt(self, path: str) -> bool:
+        return any(path_matches(path, prefix) for prefix in self.exempt_paths)
+    
+    def _match(self, path: str) -> Tuple[str, RateLimit]:
+        for prefix, limit in self.route_limits:
+            if path_matches(path, prefix):
+                return prefix, limit
+        return "*", self.default_limit
+    
+    @staticmethod
+    def _identity(scope) -> str:
+        for name, value in scope.get("headers", []):
+            if name == b"authorization":
+                scheme, _, token = value.decode("latin-1").partition(" ")
+                if scheme.lower() == "bearer" and token:
+                    payload = verify_token(token)
+                    if payload and payload.get("sub"):
+                        return f"user:{payload['sub']}"
+                break
+        
+        client = scope.get("client")
+        return f"ip:{client[0]}" if client else "ip:unknown" 
\ No newline at end of file
@@ -0,0 +1,354 @@
+"""
+HTTP响应缓存
+
+路由用 @cache_response 声明缓存策略后，ResponseCacheMiddleware 在路由之前
+按方法、路径、查询参数和 vary 请求头查找 CacheManager 中的响应，命中时
+不执行处理函数，重复请求只需一次缓存读取。响应带强 ETag，客户端携带匹配的
+If-None-Match 时返回304。遵守请求和响应的 Cache-Control，
+并可按标签失效（与 @cached 共用 cache.invalidate_tags）。
+
+命中时路由的依赖项（包括认证、权限检查）同样不会执行，只有 vary 中的请求头
+区分不同调用方。需要逐次鉴权的路由不应使用响应缓存，或须把凭据所在的请求头
+加入 vary，使未携带有效凭据的请求无法命中其他用户的缓存。
+"""
+
+import base64
+import hashlib
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple, Union
+from urllib.parse import parse_qsl, urlencode
+
+from starlette.routing import Match
+
+from .cache import cache
+from .config import settings
+from .logging import get_logger
+
+logger = get_logger(__name__)
+
+RESPONSE_KEY_PREFIX = "http:"
+
+# 304 响应保留的头（RFC 9110 15.4.5）
+_NOT_MODIFIED_HEADERS = {
+    b"cache-control", b"content-location", b"date", b"etag", b"expires", b"vary",
+}
+
+# tags 可以是固定列表，或以路径参数调用返回标签的可调用对象
+TagsType = Union[Iterable[str], Callable[..., Iterable[str]], None]
+
+
+class CachePolicy(NamedTuple):
+    """路由的响应缓存策略"""
+    
+    expire: Optional[int]
+    vary: Tuple[str, ...]
+    tags: TagsType
+
+
+# 按顺序排列的 (路由, 缓存策略)
+_RouteTable = List[Tuple[Any, Optional[CachePolicy]]]
+
+
+def cache_response(
+    expire: Optional[int] = None,
+    vary: Iterable[str] = ("accept", "authorization"),
+    tags: TagsType = None,
+):
+    """为GET路由启用响应缓存
+    
+    须写在路由装饰器下方（先于 @router.get 应用）。expire 默认取
+    REDIS_RESPONSE_CACHE_TTL，响应的 Cache-Control max-age/s-maxage 优先。
+    vary 中的请求头参与缓存键，默认按 Authorization 区分用户；
+    依赖Cookie识别用户的路由需把 "cookie" 加入 vary。
+    命中缓存时不执行路由的依赖项，认证和权限检查也会被跳过。
+    """
+    policy = CachePolicy(expire, tuple(name.lower() for name in vary), tags)
+    
+    def decorator(func):
+        func.__response_cache__ = policy
+        return func
+    return decorator
+
+
+def _cache_control(value: Optional[bytes]) -> Dict[str, Optional[str]]:
+    directives: Dict[str, Optional[str]] = {}
+    if not value:
+        return directives
+    for part in value.decode("latin-1").split(","):
+        name, _, argument = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = argument.strip('"') or None
+    return directives
+
+
+def _max_age(directives: Dict[str, Optional[str]]) -> Optional[int]:
+    for name in ("s-maxage", "max-age"):
+        value = directives.get(name)
+        if value is not None:
+            try:
+                return int(value)
+            except ValueError:
+                return 0
+    return None
+
+
+def _etag_matches(if_none_match: Optional[bytes], etag: str) -> bool:
+    """If-None-Match 使用弱比较"""
+    if not if_none_match:
+        return False
+    header = if_none_match.decode("latin-1").strip()
+    if header == "*":
+        return True
+    target = etag[2:] if etag.startswith("W/") else etag
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == target:
+            return True
+    return False
+
+
+def make_etag(body: bytes) -> str:
+    """响应体的强ETag"""
+    return f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+def response_cache_key(scope: Dict[str, Any], vary: Tuple[str, ...]) -> str:
+    """按路径、规范化的查询参数和 vary 请求头生成缓存键（HEAD 与 GET 共用）"""
+    headers = _headers(scope)
+    query_string = scope.get("query_string", b"").decode("latin-1")
+    query = urlencode(sorted(parse_qsl(query_string, keep_blank_values=True)))
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(query.encode("latin-1"))
+    for name in vary:
+        digest.update(b"\0" + headers.get(name.encode("latin-1"), b""))
+    return f"{RESPONSE_KEY_PREFIX}{scope['path']}:{digest.hexdigest()}"
+
+
+async def invalidate_responses(*tags: str) -> int:
+    """删除登记在指定标签下的缓存响应，返回删除的键数"""
+    return await cache.invalidate_tags(*tags)
+
+
+def _headers(scope: Dict[str, Any]) -> Dict[bytes, bytes]:
+    return {name.lower(): value for name, value in scope.get("headers", [])}
+
+
+class ResponseCacheMiddleware:
+    """响应缓存中间件
+    
+    只处理声明了 @cache_response 的 GET/HEAD 请求。状态码200、响应体不超过
+    REDIS_RESPONSE_CACHE_MAX_BODY、且响应未设置 Set-Cookie、no-store 或
+    private 时写入缓存；超过大小的响应按原样流式转发。
+    缓存不可用时退化为直接处理。命中时不经过路由，依赖项和认证都不执行。
+    """
+    
+    def __init__(self, app, max_body: Optional[int] = None):
+        self.app = app
+        self.max_body = max_body or settings.redis.response_cache_max_body
+        # (路由数, 截至最后一个带缓存策略的路由为止的 (路由, 策略) 列表)
+        self._route_table: Optional[Tuple[int, _RouteTable]] = None
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("GET", "HEAD"):
+            await self.app(scope, receive, send)
+            return
+        
+        policy, path_params = self._match_route(scope)
+        if policy is None:
+            await self.app(scope, receive, send)
+            return
+        
+        headers = _headers(scope)
+        request_directives = _cache_control(headers.get(b"cache-control"))
+        if "no-store" in request_directives:
+            await self.app(scope, receive, send)
+            return
+        
+        key = response_cache_key(scope, policy.vary)
+        if "no-cache" not in request_directives and request_directives.get("max-age") != "0":
+            try:
+                entry = await cache.get(key)
+            except Exception as e:
+                logger.warning("Response cache unavailable", error=str(e))
+                await self.app(scope, receive, send)
+                return
+            if isinstance(entry, dict) and "etag" in entry:
+                await self._send_cached(scope, send, entry, headers.get(b"if-none-match"))
+                return
+        
+        if scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+        
+        await self._fill(scope, receive, send, key, policy, path_params, headers)
+    
+    def _routes(self, app: Any) -> _RouteTable:
+        """各路由的缓存策略只解析一次；路由表变化（数量改变）时重建
+        
+        最后一个带策略的路由之后的路由不可能返回策略，不再参与匹配；
+        没有任何路由声明缓存时列表为空，请求直接放行。
+        """
+        routes = getattr(app, "routes", ())
+        if self._route_table is None or self._route_table[0] != len(routes):
+            table = [
+                (route, getattr(getattr(route, "endpoint", None), "__response_cache__", None))
+                for route in routes
+            ]
+            last = max((i for i, (_, policy) in enumerate(table) if policy), default=-1)
+            self._route_table = (len(routes), table[:last + 1])
+        return self._route_table[1]
+    
+    def _match_route(
+        self, scope: Dict[str, Any]
+    ) -> Tuple[Optional[CachePolicy], Dict[str, Any]]:
+        """路由之前找到处理函数的缓存策略及路径参数
+        
+        按路由表顺序匹配，前面未声明缓存的路由匹配时同样返回 None。
+        """
+        for route, policy in self._routes(scope.get("app")):
+            match, child_scope = route.matches(scope)
+            if match == Match.FULL:
+                return policy, child_scope.get("path_params", {})
+            if match == Match.PARTIAL:
+                # 路径匹配但方法不匹配，交给路由器返回405
+                break
+        return None, {}
+    
+    async def _send_cached(self, scope, send, entry: Dict[str, Any], if_none_match) -> None:
+        response_headers = [
+            (name.encode("latin-1"), value.encode("latin-1")) for name, value in entry["headers"]
+        ]
+        if _etag_matches(if_none_match, entry["etag"]):
+            await send({
+                "type": "http.response.start",
+                "status": 304,
+                "headers": [
+                    (name, value) for name, value in response_headers
+                    if name.lower() in _NOT_MODIFIED_HEADERS
+                ],
+            })
+            await send({"type": "http.response.body", "body": b""})
+            return
+        
+        body = base64.b64decode(entry["body"])
+        await send({
+            "type": "http.response.start",
+            "status": entry["status"],
+            "headers": response_headers + [(b"x-cache", b"HIT")],
+        })
+        await send({
+            "type": "http.response.body",
+            "body": b"" if scope["method"] == "HEAD" else body,
+        })
+    
+    async def _fill(
+        self, scope, receive, send, key, policy, path_params, request_headers
+    ) -> None:
+        """执行处理函数，缓冲响应体，补上ETag后写入缓存"""
+        start_message: Optional[Dict[str, Any]] = None
+        chunks: List[bytes] = []
+        size = 0
+        passthrough = False
+        
+        async def capture(message):
+            nonlocal start_message, size, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+            
+            chunks.append(message.get("body", b""))
+            size += len(chunks[-1])
+            if message.get("more_body", False):
+                if size > self.max_body:
+                    # 响应过大，不再缓冲，已缓冲的部分原样发出后继续流式转发
+                    passthrough = True
+                    await send(start_message)
+                    await send({
+                        "type": "http.response.body",
+                        "body": b"".join(chunks),
+                        "more_body": True,
+                    })
+                return
+            await self._finish(
+                send, start_message, b"".join(chunks), key, policy, path_params, request_headers
+            )
+        
+        await self.app(scope, receive, capture)
+    
+    async def _finish(
+        self, send, start_message, body, key, policy, path_params, request_headers
+    ) -> None:
+        response_headers = list(start_message.get("headers", []))
+        names = {name.lower() for name, _ in response_headers}
+        etag = next(
+            (
+                value.decode("latin-1")
+                for name, value in response_headers if name.lower() == b"etag"
+            ),
+            None,
+        )
+        if etag is None and start_message["status"] == 200:
+            etag = make_etag(body)
+            response_headers.append((b"etag", etag.encode("latin-1")))
+        # 写入缓存的头不含 x-cache
+        headers = list(response_headers)
+        
+        directives = _cache_control(next(
+            (value for name, value in response_headers if name.lower() == b"cache-control"),
+            None,
+        ))
+        expire = _max_age(directives)
+        if expire is None:
+            expire = policy.expire or settings.redis.response_cache_ttl
+        storable = (
+            start_message["status"] == 200
+            and len(body) <= self.max_body
+            and b"set-cookie" not in names
+            and "no-store" not in directives
+            and "private" not in directives
+            and expire > 0
+        )
+        
+        if etag is not None and _etag_matches(request_headers.get(b"if-none-match"), etag):
+            await send({
+                "type": "http.response.start",
+                "status": 304,
+                "headers": [
+                    (name, value) for name, value in response_headers
+                    if name.lower() in _NOT_MODIFIED_HEADERS
+                ],
+            })
+            await send({"type": "http.response.body", "body": b""})
+        else:
+            if storable:
+                response_headers.append((b"x-cache", b"MISS"))
+            await send({**start_message, "headers": response_headers})
+            await send({"type": "http.response.body", "body": body})
+        
+        if storable:
+            entry = {
+                "status": start_message["status"],
+                "etag": etag,
+                "headers": [
+                    [name.decode("latin-1"), value.decode("latin-1")] for name, value in headers
+                ],
+                "body": base64.b64encode(body).decode("ascii"),
+            }
+            await self._store(key, entry, expire, policy, path_params)
+    
+    async def _store(self, key, entry, expire, policy, path_params) -> None:
+        tags = policy.tags
+        entry_tags = list(tags(**path_params) if callable(tags) else tags or [])
+        try:
+            await cache.set(key, entry, expire=expire)
+            if entry_tags:
+                await cache.add_tags(key, entry_tags, expire=expire)
+        except Exception as e:
+            logger.warning("Response cache unavailable", key=key, error=str(e)) 
\ No newline at end of file
@@ -2,19 +2,87 @@
 安全认证和授权
 
 提供JWT认证、密码加密、权限验证等功能。
+
+bcrypt 每次计算耗时约100-300ms CPU，异步代码中应使用 *_async 版本：
+计算在专用线程池中执行（bcrypt 计算期间释放GIL），事件循环不被阻塞；
+排队数超过上限时抛出 PasswordHasherBusy，而不是无限堆积。
+verify_token 的验证结果在进程内缓存，同一令牌重复请求时不再验签。
 """
 
+import asyncio
+import hashlib
+import os
 import secrets
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional, Union
+from typing import Callable, Optional, Set, Tuple, TypeVar, Union
 
 from jose import JWTError, jwt
+from jose.exceptions import JWTClaimsError
 from passlib.context import CryptContext
+from prometheus_client import Counter, Gauge, Histogram
 
+from .cache import _MISSING, LocalCache
 from .config import settings
 
-# 密码加密上下文
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+T = TypeVar("T")
+
+# 密码加密上下文，修改 SECURITY_BCRYPT_ROUNDS 后旧哈希在下次登录时重新计算
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=settings.security.bcrypt_rounds,
+)
+
+PASSWORD_HASH_PENDING = Gauge(
+    "password_hash_pending",
+    "Password hash operations running or waiting for a worker",
+    multiprocess_mode="livesum",
+)
+
+PASSWORD_HASH_WAIT = Histogram(
+    "password_hash_queue_wait_seconds",
+    "Time a password hash operation waited for a worker",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+
+PASSWORD_HASH_DURATION = Histogram(
+    "password_hash_duration_seconds",
+    "Password hash operation time on the worker",
+    ["operation"],
+    buckets=(0.01, 0.05, 0.1, 0.2, 0.3, 0.5, 1.0, 2.5),
+)
+
+PASSWORD_HASH_REJECTED = Counter(
+    "password_hash_rejected_total",
+    "Password hash operations rejected because the queue was full",
+)
+
+
+TOKEN_CACHE_REQUESTS = Counter(
+    "jwt_cache_requests_total",
+    "Verified-token cache lookups",
+    ["result"],
+)
+_TOKEN_CACHE_HIT = TOKEN_CACHE_REQUESTS.labels(result="hit")
+_TOKEN_CACHE_MISS = TOKEN_CACHE_REQUESTS.labels(result="miss")
+
+# 已验证令牌缓存，键为令牌的摘要；LocalCache 非线程安全，同步依赖可能在线程池中调用
+token_cache: Optional[LocalCache] = (
+    LocalCache(
+        max_items=settings.jwt.token_cache_size,
+        ttl=settings.jwt.token_cache_ttl,
+    )
+    if settings.jwt.token_cache_size > 0
+    else None
+)
+_token_cache_lock = threading.Lock()
+
+
+class PasswordHasherBusy(RuntimeError):
+    """密码哈希线程池排队已满"""
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
@@ -27,6 +95,94 @@ def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
 
+def verify_and_update_password(
+    plain_password: str, hashed_password: str
+) -> Tuple[bool, Optional[str]]:
+    """验证密码，哈希参数已过时则同时返回新哈希（调用方应保存），否则为 None"""
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
+class PasswordHasher:
+    """在有界线程池中执行密码哈希"""
+    
+    def __init__(self, workers: int = 0, max_pending: int = 64):
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self.max_pending = max_pending
+        self.pending = 0
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # 已提交未完成的任务，关闭时取消尚未开始的部分
+        self._futures: Set[Future] = set()
+    
+    async def run(self, operation: str, func: Callable[..., T], *args) -> T:
+        if self.pending >= self.max_pending:
+            PASSWORD_HASH_REJECTED.inc()
+            raise PasswordHasherBusy(f"{self.pending} password hash operations pending")
+        
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix="password-hash"
+            )
+        
+        submitted = time.perf_counter()
+        
+        def timed() -> T:
+            started = time.perf_counter()
+            PASSWORD_HASH_WAIT.observe(started - submitted)
+            try:
+                return func(*args)
+            finally:
+                PASSWORD_HASH_DURATION.labels(operation=operation).observe(
+                    time.perf_counter() - started
+                )
+        
+        self.pending += 1
+        PASSWORD_HASH_PENDING.inc()
+        try:
+            future = self._executor.submit(timed)
+            self._futures.add(future)
+            future.add_done_callback(self._futures.discard)
+            return await asyncio.wrap_future(future)
+        finally:
+            self.pending -= 1
+            PASSWORD_HASH_PENDING.dec()
+    
+    def shutdown(self) -> None:
+        """关闭线程池，排队中的任务取消，正在执行的任务不等待
+        
+        不使用 shutdown(cancel_futures=True)，该参数需要 Python 3.9+。
+        """
+        if self._executor is not None:
+            for future in list(self._futures):
+                future.cancel()
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+password_hasher = PasswordHasher(
+    workers=settings.security.password_hash_workers,
+    max_pending=settings.security.password_hash_max_pending,
+)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """验证密码（线程池执行）"""
+    return await password_hasher.run("verify", verify_password, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    """获取密码哈希值（线程池执行）"""
+    return await password_hasher.run("hash", get_password_hash, password)
+
+
+async def verify_and_update_password_async(
+    plain_password: str, hashed_password: str
+) -> Tuple[bool, Optional[str]]:
+    """登录时使用：验证密码，哈希参数已过时则返回新哈希供调用方保存（线程池执行）"""
+    return await password_hasher.run(
+        "verify", verify_and_update_password, plain_password, hashed_password
+    )
+
+
 def create_access_token(
     data: dict, expires_delta: Optional[timedelta] = None
 ) -> str:
@@ -63,15 +219,55 @@ def create_refresh_token(
     return encoded_jwt
 
 
+def _decode_token(token: str) -> dict:
+    return jwt.decode(
+        token, settings.jwt.secret_key, algorithms=[settings.jwt.algorithm]
+    )
+
+
 def verify_token(token: str) -> Optional[dict]:
-    """验证令牌"""
+    """验证令牌
+    
+    验证通过的声明缓存到 exp（不超过 JWT_TOKEN_CACHE_TTL），同一令牌重复使用时
+    不再重新验签；格式错误、签名无效或已过期的令牌缓存 JWT_TOKEN_CACHE_NEGATIVE_TTL 秒。
+    返回的是缓存声明的浅拷贝。
+    """
+    if token_cache is None:
+        try:
+            return _decode_token(token)
+        except JWTError:
+            return None
+    
+    key = hashlib.blake2b(token.encode("utf-8"), digest_size=16).digest()
+    with _token_cache_lock:
+        cached = token_cache.get(key)
+    if cached is not _MISSING:
+        _TOKEN_CACHE_HIT.inc()
+        return dict(cached) if cached is not None else None
+    
+    _TOKEN_CACHE_MISS.inc()
     try:
-        payload = jwt.decode(
-            token, settings.jwt.secret_key, algorithms=[settings.jwt.algorithm]
-        )
-        return payload
+        payload = _decode_token(token)
+    except JWTClaimsError:
+        # nbf 等声明校验失败的令牌稍后可能生效，不缓存
+        return None
     except JWTError:
+        with _token_cache_lock:
+            token_cache.set(key, None, size=len(key), ttl=settings.jwt.token_cache_negative_ttl)
         return None
+    
+    exp = payload.get("exp")
+    ttl = exp - time.time() if isinstance(exp, (int, float)) else None
+    with _token_cache_lock:
+        token_cache.set(key, payload, size=len(token), ttl=ttl)
+    return dict(payload)
+
+
+def clear_token_cache() -> None:
+    """清空令牌缓存（如更换签名密钥后）"""
+    if token_cache is not None:
+        with _token_cache_lock:
+            token_cache.clear()
 
 
 def generate_secret_key() -> str:
@@ -0,0 +1,144 @@
+"""
+查询结果流式导出
+
+使用服务端游标分批读取查询结果，边读边以 NDJSON 或 CSV 格式写入响应，
+内存占用只与批次大小有关，与导出总行数无关。
+"""
+
+import csv
+import io
+from datetime import date, datetime
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Sequence
+
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import Select
+
+from .codecs import JSONCodec
+from .database import AsyncSessionLocal
+from .logging import get_logger
+
+logger = get_logger(__name__)
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+_json = JSONCodec()
+
+
+def _row_to_dict(row: Any) -> Dict[str, Any]:
+    """结果行转字典：单个ORM实体使用 to_dict，否则按列名"""
+    if len(row) == 1 and hasattr(row[0], "__table__"):
+        entity = row[0]
+        if hasattr(entity, "to_dict"):
+            return entity.to_dict()
+        return {column.name: getattr(entity, column.key) for column in entity.__table__.columns}
+    return row._asdict()
+
+
+def _csv_value(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def encode_ndjson(rows: Sequence[Dict[str, Any]]) -> bytes:
+    """每行一个JSON对象"""
+    return b"".join(_json.dumps(row) + b"\n" for row in rows)
+
+
+class CSVEncoder:
+    """CSV编码器，首个批次前输出表头"""
+    
+    def __init__(self, columns: Optional[Sequence[str]] = None):
+        self.columns: Optional[List[str]] = list(columns) if columns else None
+        self._header_written = False
+    
+    def encode(self, rows: Sequence[Dict[str, Any]]) -> bytes:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if not self._header_written:
+            if self.columns is None:
+                self.columns = list(rows[0].keys()) if rows else []
+            writer.writerow(self.columns)
+            self._header_written = True
+        for row in rows:
+            writer.writerow([_csv_value(row.get(name)) for name in self.columns])
+        return buffer.getvalue().encode("utf-8")
+
+
+async def iter_query(
+    stmt: Select,
+    format: str = "ndjson",
+    columns: Optional[Sequence[str]] = None,
+    batch_size: int = 1000,
+    session_factory: Callable[[], AsyncSession] = AsyncSessionLocal,
+) -> AsyncIterator[bytes]:
+    """以服务端游标执行查询，逐批产出编码后的字节块
+    
+    每批 batch_size 行编码为一个块后立即交给调用方，下一批要等上一块被
+    消费后才会读取，因此慢速客户端会自然反压到数据库游标上。
+    使用独立会话，不依赖请求作用域的会话在响应发送期间保持打开。
+    """
+    if format not in MEDIA_TYPES:
+        raise ValueError(f"Unsupported export format: {format}")
+    csv_encoder = CSVEncoder(columns) if format == "csv" else None
+    rows_sent = 0
+    
+    async with session_factory() as session:
+        try:
+            result = await session.stream(stmt.execution_options(yield_per=batch_size))
+            if csv_encoder is not None and csv_encoder.columns is None:
+                # 表头不等第一批数据，尽快发出首字节
+                keys = list(result.keys())
+                descriptions = stmt.column_descriptions
+                if len(descriptions) == 1 and descriptions[0]["expr"] is descriptions[0]["entity"]:
+                    keys = [column.name for column in descriptions[0]["entity"].__table__.columns]
+                csv_encoder.columns = keys
+                yield csv_encoder.encode([])
+            
+            async for partition in result.partitions():
+                rows = [_row_to_dict(row) for row in partition]
+                # 已编码的ORM对象不再需要，逐个移出会话，避免身份映射随导出行数增长
+                for row in partition:
+                    for item in row:
+                        if hasattr(item, "__table__"):
+                            session.expunge(item)
+                if columns and csv_encoder is None:
+                    rows = [{name: row.get(name) for name in columns} for row in rows]
+                yield encode_ndjson(rows) if csv_encoder is None else csv_encoder.encode(rows)
+                rows_sent += len(rows)
+        except Exception as e:
+            # 响应头已发出，只能中断连接，由客户端感知不完整的响应
+            logger.error("Streaming export failed", rows_sent=rows_sent, error=str(e))
+            raise
+    
+    logger.info("Streaming export finished", format=format, rows=rows_sent)
+
+
+def stream_query(
+    stmt: Select,
+    format: str = "ndjson",
+    columns: Optional[Sequence[str]] = None,
+    filename: Optional[str] = None,
+    batch_size: int = 1000,
+    session_factory: Callable[[], AsyncSession] = AsyncSessionLocal,
+) -> StreamingResponse:
+    """将查询结果作为 NDJSON 或 CSV 流式响应返回
+    
+    stmt 可以选择ORM实体或具体列，只选择需要的列可以省去实体构造的开销。
+    指定 filename 时附带 Content-Disposition 头，浏览器会作为附件下载。
+    """
+    if format not in MEDIA_TYPES:
+        raise ValueError(f"Unsupported export format: {format}")
+    
+    headers = {}
+    if filename:
+        headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return StreamingResponse(
+        iter_query(stmt, format, columns, batch_size, session_factory),
+        media_type=MEDIA_TYPES[format],
+        headers=headers,
+    ) 
\ No newline at end of file
@@ -4,38 +4,32 @@
 FastAPI应用的主入口文件，包含应用配置、中间件、路由等。
 """
 
-import asyncio
+import os
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, Request, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from fastapi.responses import JSONResponse, Response
-from prometheus_client import Counter, Histogram
 import sentry_sdk
 from sentry_sdk.integrations.fastapi import FastApiIntegration
 
 from .core.config import settings
 from .core.database import init_db, close_db
-from .core.cache import close_redis
-from .core.logging import get_logger
+from .core.admission import AdmissionControlMiddleware
+from .core.cache import cache, close_redis
+from .core.logging import get_logger, shutdown_logging
+from .core.metrics import (
+    RequestMetricsMiddleware, mark_process_dead, render_metrics, setup_multiprocess,
+)
+from .core.perf import perf_snapshot
+from .core.ratelimit import RateLimitMiddleware
+from .core.security import password_hasher
+from .core.response_cache import ResponseCacheMiddleware
 
 # 初始化日志
 logger = get_logger(__name__)
 
-# Prometheus指标
-REQUEST_COUNT = Counter(
-    "http_requests_total",
-    "Total number of HTTP requests",
-    ["method", "endpoint", "status"]
-)
-
-REQUEST_LATENCY = Histogram(
-    "http_request_duration_seconds",
-    "HTTP request latency in seconds",
-    ["method", "endpoint"]
-)
-
 # 初始化Sentry
 if settings.monitoring.sentry_dsn:
     sentry_sdk.init(
@@ -60,6 +54,9 @@ async def lifespan(app: FastAPI):
         logger.error("Failed to initialize database", error=str(e))
         raise
     
+    # 启动L1缓存失效监听
+    await cache.start_invalidation_listener()
+    
     yield
     
     # 关闭时执行
@@ -78,6 +75,15 @@ async def lifespan(app: FastAPI):
         logger.info("Redis connections closed")
     except Exception as e:
         logger.error("Error closing Redis connections", error=str(e))
+    
+    # 停止密码哈希线程池
+    password_hasher.shutdown()
+    
+    # 清理本worker的多进程指标文件
+    mark_process_dead()
+    
+    # 写出日志队列中剩余的日志
+    shutdown_logging()
 
 
 # 创建FastAPI应用
@@ -91,6 +97,14 @@ app = FastAPI(
     lifespan=lifespan,
 )
 
+# 添加响应缓存中间件（在CORS之内，缓存的响应不含按Origin变化的CORS头）
+if settings.redis.response_cache_enabled:
+    app.add_middleware(ResponseCacheMiddleware)
+
+# 添加限流中间件（在CORS之内，429响应同样带CORS头，预检请求由CORS直接应答）
+if settings.rate_limit.enabled:
+    app.add_middleware(RateLimitMiddleware)
+
 # 添加中间件
 app.add_middleware(
     CORSMiddleware,
@@ -106,50 +120,12 @@ app.add_middleware(
     allowed_hosts=["*"] if settings.debug else ["localhost", "127.0.0.1"]
 )
 
+# 添加准入控制中间件（在限流之前执行，过载时尽早返回503）
+if settings.admission.enabled:
+    app.add_middleware(AdmissionControlMiddleware)
 
-@app.middleware("http")
-async def metrics_middleware(request: Request, call_next):
-    """指标收集中间件"""
-    start_time = asyncio.get_event_loop().time()
-    
-    response = await call_next(request)
-    
-    # 记录请求指标
-    duration = asyncio.get_event_loop().time() - start_time
-    REQUEST_COUNT.labels(
-        method=request.method,
-        endpoint=request.url.path,
-        status=response.status_code
-    ).inc()
-    
-    REQUEST_LATENCY.labels(
-        method=request.method,
-        endpoint=request.url.path
-    ).observe(duration)
-    
-    return response
-
-
-@app.middleware("http")
-async def logging_middleware(request: Request, call_next):
-    """日志中间件"""
-    logger.info(
-        "Request started",
-        method=request.method,
-        path=request.url.path,
-        client=request.client.host if request.client else None,
-    )
-    
-    response = await call_next(request)
-    
-    logger.info(
-        "Request completed",
-        method=request.method,
-        path=request.url.path,
-        status_code=response.status_code,
-    )
-    
-    return response
+# 添加请求指标与日志中间件（最外层，限流拒绝的请求也会被记录）
+app.add_middleware(RequestMetricsMiddleware)
 
 
 # 异常处理器
@@ -203,23 +179,37 @@ async def metrics():
             content={"detail": "Metrics endpoint disabled"},
         )
     
-    from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
-    return Response(
-        generate_latest(),
-        media_type=CONTENT_TYPE_LATEST,
-    )
+    data, content_type = render_metrics()
+    return Response(data, media_type=content_type)
+
+
+# 函数耗时快照端点
+@app.get("/debug/perf")
+async def debug_perf():
+    """log_performance 装饰的函数耗时统计（本worker）"""
+    if not settings.monitoring.perf_debug_enabled:
+        return JSONResponse(
+            status_code=status.HTTP_404_NOT_FOUND,
+            content={"detail": "Perf endpoint disabled"},
+        )
+    
+    return {"pid": os.getpid(), "functions": perf_snapshot()}
 
 
 def main():
     """主函数"""
     import uvicorn
     
+    workers = settings.workers if not settings.debug else 1
+    # 必须在worker进程启动前设置，worker导入 prometheus_client 时读取
+    setup_multiprocess(workers)
+    
     uvicorn.run(
         "src.main:app",
         host=settings.host,
         port=settings.port,
         reload=settings.debug,
-        workers=settings.workers if not settings.debug else 1,
+        workers=workers,
         log_level=settings.logging.level.lower(),
     )
 
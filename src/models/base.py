@@ -4,14 +4,32 @@
 包含所有模型的基础类和通用字段。
 """
 
+import base64
+import binascii
+import hashlib
+import json
 from datetime import datetime
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
 
-from sqlalchemy import Column, DateTime, Integer, String, Text
+from sqlalchemy import (
+    Column, DateTime, Integer, String, Text, func, insert, select, text, tuple_, update,
+)
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.ext.declarative import declared_attr
 from pydantic import BaseModel, Field
 
+from ..core.cache import cache
 from ..core.database import Base
+from ..core.logging import get_logger
+from ..core.query_cache import mark_tables_written
+
+logger = get_logger(__name__)
+
+# PostgreSQL 统计信息中的估算行数，表从未 ANALYZE 时为 -1（PG14+）或 0
+_ESTIMATE_COUNT_SQL = text(
+    "SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:table)"
+)
 
 
 class BaseModelMixin:
@@ -39,6 +57,249 @@ class BaseModelMixin:
         for key, value in kwargs.items():
             if hasattr(self, key):
                 setattr(self, key, value)
+    
+    @classmethod
+    async def bulk_insert(
+        cls,
+        session: AsyncSession,
+        rows: Sequence[Dict[str, Any]],
+        return_ids: bool = False,
+        chunk_size: int = 5000,
+    ) -> Optional[List[int]]:
+        """批量插入
+        
+        绕过ORM对象和逐行flush，按块以多行 VALUES 插入；
+        return_ids 为 True 时按输入顺序返回生成的主键。
+        """
+        ids: List[int] = []
+        stmt = insert(cls.__table__)
+        if return_ids:
+            stmt = stmt.returning(cls.__table__.c.id, sort_by_parameter_order=True)
+        
+        for chunk in _chunks(cls._with_timestamps(rows), chunk_size):
+            result = await session.execute(stmt, chunk)
+            if return_ids:
+                ids.extend(result.scalars().all())
+        return ids if return_ids else None
+    
+    @classmethod
+    async def bulk_upsert(
+        cls,
+        session: AsyncSession,
+        rows: Sequence[Dict[str, Any]],
+        conflict_columns: Sequence[str] = ("id",),
+        update_columns: Optional[Sequence[str]] = None,
+        return_ids: bool = False,
+        chunk_size: int = 5000,
+    ) -> Optional[List[int]]:
+        """批量插入或更新（INSERT ... ON CONFLICT DO UPDATE）
+        
+        冲突时更新 update_columns（默认为除冲突列和 created_at 外传入的所有列），
+        并刷新 updated_at。支持 PostgreSQL 和 SQLite，其他方言抛出 ValueError。
+        """
+        if not rows:
+            return [] if return_ids else None
+        
+        dialect = session.get_bind().dialect.name
+        if dialect == "postgresql":
+            stmt = postgresql.insert(cls.__table__)
+        elif dialect == "sqlite":
+            stmt = sqlite.insert(cls.__table__)
+        else:
+            raise ValueError(f"bulk_upsert is not supported on {dialect}")
+        
+        if update_columns is None:
+            skip = set(conflict_columns) | {"created_at"}
+            update_columns = [key for key in rows[0] if key not in skip]
+        set_ = {name: stmt.excluded[name] for name in update_columns}
+        set_["updated_at"] = stmt.excluded.updated_at
+        stmt = stmt.on_conflict_do_update(index_elements=list(conflict_columns), set_=set_)
+        
+        ids: List[int] = []
+        if return_ids:
+            stmt = stmt.returning(cls.__table__.c.id, sort_by_parameter_order=True)
+        for chunk in _chunks(cls._with_timestamps(rows), chunk_size):
+            result = await session.execute(stmt, chunk)
+            if return_ids:
+                ids.extend(result.scalars().all())
+        return ids if return_ids else None
+    
+    @classmethod
+    async def bulk_update(
+        cls,
+        session: AsyncSession,
+        rows: Sequence[Dict[str, Any]],
+        chunk_size: int = 5000,
+    ) -> None:
+        """按主键批量更新，每行必须包含 id，自动刷新 updated_at"""
+        now = datetime.utcnow()
+        for chunk in _chunks(rows, chunk_size):
+            await session.execute(
+                update(cls), [{"updated_at": now, **row} for row in chunk]
+            )
+    
+    @classmethod
+    async def copy_insert(
+        cls,
+        session: AsyncSession,
+        rows: Sequence[Dict[str, Any]],
+        columns: Optional[Sequence[str]] = None,
+    ) -> int:
+        """使用 PostgreSQL COPY 批量导入（需 asyncpg 驱动），返回导入行数
+        
+        吞吐量最高但不返回主键，也不触发ORM事件；columns 默认取首行的键。
+        表会登记为已写入，提交时递增其版本号使查询缓存失效。
+        驱动不是 asyncpg 时抛出 RuntimeError。
+        """
+        if not rows:
+            return 0
+        
+        rows = cls._with_timestamps(rows)
+        columns = list(columns or rows[0].keys())
+        connection = await session.connection()
+        raw_connection = await connection.get_raw_connection()
+        driver_connection = raw_connection.driver_connection
+        if not hasattr(driver_connection, "copy_records_to_table"):
+            raise RuntimeError("copy_insert requires the asyncpg driver")
+        
+        await driver_connection.copy_records_to_table(
+            cls.__table__.name,
+            records=[tuple(row.get(name) for name in columns) for row in rows],
+            columns=columns,
+            schema_name=cls.__table__.schema,
+        )
+        # COPY 不经过ORM事件，需手动登记，由提交时的 after_commit 递增版本号
+        mark_tables_written(session.sync_session, cls.__table__.fullname)
+        return len(rows)
+    
+    @classmethod
+    async def paginate_keyset(
+        cls,
+        session: AsyncSession,
+        cursor: Optional[str] = None,
+        size: int = 10,
+        order_by: Sequence[str] = ("created_at", "id"),
+        descending: bool = True,
+        filters: Sequence[Any] = (),
+    ) -> Tuple[List[Any], Optional[str]]:
+        """游标分页，返回 (当前页记录, 下一页游标)
+        
+        以 order_by 列的行值比较代替 OFFSET，任意页的代价都等同于第一页；
+        order_by 最后一列必须唯一（通常为 id），且应有对应的组合索引。
+        没有下一页时游标为 None。
+        """
+        columns = [getattr(cls, name) for name in order_by]
+        stmt = select(cls)
+        for condition in filters:
+            stmt = stmt.where(condition)
+        
+        if cursor:
+            values = decode_cursor(cursor)
+            if len(values) != len(columns):
+                raise ValueError("Invalid pagination cursor")
+            key = tuple_(*columns)
+            stmt = stmt.where(key < tuple_(*values) if descending else key > tuple_(*values))
+        
+        stmt = stmt.order_by(
+            *(column.desc() if descending else column.asc() for column in columns)
+        ).limit(size + 1)
+        items = list((await session.execute(stmt)).scalars().all())
+        
+        next_cursor = None
+        if len(items) > size:
+            items = items[:size]
+            next_cursor = encode_cursor([getattr(items[-1], name) for name in order_by])
+        return items, next_cursor
+    
+    @classmethod
+    async def count_rows(
+        cls,
+        session: AsyncSession,
+        mode: str = "estimate",
+        filters: Sequence[Any] = (),
+        cache_ttl: int = 60,
+    ) -> Tuple[int, bool]:
+        """统计记录数，返回 (总数, 是否精确)
+        
+        mode 可选：
+        - estimate: PostgreSQL 上无过滤条件时读取 pg_class.reltuples，
+          否则退回 cached
+        - cached: 精确 COUNT(*) 的结果缓存 cache_ttl 秒
+        - exact: 每次执行 COUNT(*)
+        """
+        if mode not in ("estimate", "cached", "exact"):
+            raise ValueError(f"Unknown count mode: {mode}")
+        
+        if mode == "estimate" and not filters and session.get_bind().dialect.name == "postgresql":
+            result = await session.execute(
+                _ESTIMATE_COUNT_SQL, {"table": cls.__table__.fullname}
+            )
+            estimate = result.scalar()
+            if estimate is not None and estimate > 0:
+                return int(estimate), False
+        
+        stmt = select(func.count()).select_from(cls)
+        for condition in filters:
+            stmt = stmt.where(condition)
+        if mode == "exact":
+            return (await session.execute(stmt)).scalar_one(), True
+        
+        compiled = stmt.compile(dialect=session.get_bind().dialect)
+        digest = hashlib.blake2b(
+            f"{compiled}|{sorted(compiled.params.items())!r}".encode(), digest_size=16
+        ).hexdigest()
+        cache_key = f"count:{cls.__table__.fullname}:{digest}"
+        try:
+            total = await cache.get(cache_key)
+        except Exception as e:
+            logger.warning("Count cache unavailable", table=cls.__table__.fullname, error=str(e))
+            return (await session.execute(stmt)).scalar_one(), True
+        
+        if total is None:
+            total = (await session.execute(stmt)).scalar_one()
+            try:
+                await cache.set(cache_key, total, expire=cache_ttl)
+            except Exception as e:
+                logger.warning("Count cache unavailable", table=cls.__table__.fullname, error=str(e))
+            return total, True
+        return int(total), False
+    
+    @classmethod
+    def _with_timestamps(cls, rows: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """补齐 created_at/updated_at，同一批次使用同一时间戳"""
+        now = datetime.utcnow()
+        return [{"created_at": now, "updated_at": now, **row} for row in rows]
+
+
+def _chunks(rows: Sequence[Any], size: int) -> Iterable[Sequence[Any]]:
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    """将排序键的值编码为不透明游标"""
+    payload = [
+        {"$dt": value.isoformat()} if isinstance(value, datetime) else value
+        for value in values
+    ]
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def decode_cursor(cursor: str) -> List[Any]:
+    """解码游标，格式不正确时抛出 ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError("Invalid pagination cursor")
+    if not isinstance(payload, list):
+        raise ValueError("Invalid pagination cursor")
+    return [
+        datetime.fromisoformat(value["$dt"])
+        if isinstance(value, dict) and "$dt" in value else value
+        for value in payload
+    ]
 
 
 class TimestampMixin:
@@ -92,6 +353,16 @@ class PaginationSchema(BaseSchema):
     pages: Optional[int] = Field(None, description="总页数")
 
 
+class CursorPaginationSchema(BaseSchema):
+    """游标分页Pydantic模型"""
+    
+    cursor: Optional[str] = Field(None, description="当前页游标，为空时取第一页")
+    size: int = Field(10, ge=1, le=100, description="每页大小")
+    next_cursor: Optional[str] = Field(None, description="下一页游标，为空表示没有更多数据")
+    total: Optional[int] = Field(None, description="总记录数")
+    total_exact: bool = Field(False, description="总记录数是否为精确值")
+
+
 class ResponseSchema(BaseSchema):
     """响应Pydantic模型"""
     
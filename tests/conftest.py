@@ -0,0 +1,26 @@
+"""
+测试公共夹具
+"""
+
+import fakeredis
+import fakeredis.aioredis
+import pytest
+
+from src.core.cache import cache
+
+
+@pytest.fixture
+def fake_redis_server():
+    return fakeredis.FakeServer()
+
+
+@pytest.fixture
+def fake_redis(monkeypatch, fake_redis_server):
+    """全局 cache 改用 fakeredis，关闭L1、合并读取和二进制编码"""
+    client = fakeredis.aioredis.FakeRedis(server=fake_redis_server, decode_responses=True)
+    monkeypatch.setattr(cache, "redis", client)
+    monkeypatch.setattr(cache, "nodes", [client])
+    monkeypatch.setattr(cache, "local", None)
+    monkeypatch.setattr(cache, "auto_batch", False)
+    monkeypatch.setattr(cache, "serializer", None)
+    return client 
\ No newline at end of file
@@ -0,0 +1,75 @@
+"""
+准入控制测试
+
+测试并发上限随延迟收缩、排队超时返回503，以及critical路由不受控制。
+"""
+
+import asyncio
+
+import httpx
+
+from src.core.admission import (
+    PRIORITY_CRITICAL,
+    PRIORITY_NORMAL,
+    AdmissionControlMiddleware,
+    AdmissionController,
+    GradientLimiter,
+)
+
+
+def test_limit_shrinks_when_latency_rises():
+    """测试延迟明显高于基线时上限收缩，但不低于下限"""
+    limiter = GradientLimiter(initial_limit=100, min_limit=5, max_limit=1000)
+    for _ in range(50):
+        limiter.on_sample(0.01, inflight=100)
+    grown = limiter.limit
+    assert grown >= 100
+    
+    for _ in range(50):
+        limiter.on_sample(0.2, inflight=100)
+    assert limiter.limit < grown / 2
+    assert limiter.limit >= 5
+
+
+async def _slow_app(scope, receive, send):
+    await asyncio.sleep(0.2)
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+def test_queue_timeout_returns_503_and_critical_bypasses():
+    """测试满载时排队超时返回503，critical路由照常处理"""
+    controller = AdmissionController(
+        GradientLimiter(initial_limit=1, min_limit=1, max_limit=1),
+        max_queue=10,
+        max_queue_time=0.05,
+    )
+    app = AdmissionControlMiddleware(
+        _slow_app, controller=controller, priority_routes={"/health": "critical"}
+    )
+    
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await asyncio.gather(
+                client.get("/items"),
+                client.get("/items"),
+                client.get("/health"),
+            )
+    
+    first, shed, health = asyncio.run(run())
+    assert first.status_code == 200
+    assert shed.status_code == 503
+    assert int(shed.headers["retry-after"]) >= 1
+    assert health.status_code == 200
+    assert controller.inflight == 0
+    assert controller.queue_depth == 0
+
+
+def test_priority_routes_match_whole_segments():
+    """测试优先级规则按完整路径段匹配，/healthz 不会被当作 /health"""
+    app = AdmissionControlMiddleware(_slow_app, priority_routes={"/health": "critical"})
+    assert app._priority("/health") == PRIORITY_CRITICAL
+    assert app._priority("/health/live") == PRIORITY_CRITICAL
+    assert app._priority("/healthz") == PRIORITY_NORMAL
+    assert app._priority("/health-anything") == PRIORITY_NORMAL 
\ No newline at end of file
@@ -0,0 +1,179 @@
+"""
+批量写入测试
+
+基于 SQLite 测试 bulk_insert、bulk_upsert 与 bulk_update，
+提交后表版本号写入 fakeredis。
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import Column, String, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from src.core.cache import NAMESPACE_KEY_PREFIX
+from src.core.database import Base
+from src.core.query_cache import table_namespace
+from src.models.base import BaseModelMixin
+
+
+class BulkItem(Base, BaseModelMixin):
+    """批量写入测试用表"""
+    
+    __tablename__ = "bulk_item"
+    
+    name = Column(String(64), nullable=False)
+    payload = Column(String(64), nullable=True)
+
+
+VERSION_KEY = f"{NAMESPACE_KEY_PREFIX}{table_namespace('bulk_item')}"
+
+
+@pytest.fixture
+def run_with_session(tmp_path, fake_redis):
+    """在新建的 SQLite 库上以异步会话执行测试协程"""
+    url = f"sqlite+aiosqlite:///{tmp_path / 'bulk.db'}"
+    
+    def run(test):
+        async def main():
+            engine = create_async_engine(url)
+            try:
+                async with engine.begin() as conn:
+                    await conn.run_sync(BulkItem.__table__.create)
+                async with AsyncSession(engine, expire_on_commit=False) as session:
+                    return await test(session)
+            finally:
+                await engine.dispose()
+        return asyncio.run(main())
+    
+    return run
+
+
+async def _rows(session):
+    result = await session.execute(
+        select(BulkItem.id, BulkItem.name, BulkItem.payload).order_by(BulkItem.id)
+    )
+    return [tuple(row) for row in result]
+
+
+def test_bulk_insert_returns_ids_in_order(run_with_session):
+    """测试分块插入并按输入顺序返回主键，时间戳自动补齐"""
+    async def test(session):
+        rows = [{"name": f"item-{i}"} for i in range(7)]
+        ids = await BulkItem.bulk_insert(session, rows, return_ids=True, chunk_size=3)
+        await session.commit()
+        created = (await session.execute(select(BulkItem.created_at))).scalars().all()
+        return ids, await _rows(session), created
+    
+    ids, rows, created = run_with_session(test)
+    assert ids == [row[0] for row in rows]
+    assert [row[1] for row in rows] == [f"item-{i}" for i in range(7)]
+    assert len(created) == 7 and None not in created
+
+
+def test_bulk_upsert_updates_conflicting_rows(run_with_session):
+    """测试冲突行只更新指定列，新行正常插入"""
+    async def test(session):
+        await BulkItem.bulk_insert(session, [
+            {"id": 1, "name": "a", "payload": "old"},
+            {"id": 2, "name": "b", "payload": "old"},
+        ])
+        ids = await BulkItem.bulk_upsert(
+            session,
+            [
+                {"id": 2, "name": "b2", "payload": "new"},
+                {"id": 3, "name": "c", "payload": "new"},
+            ],
+            update_columns=["payload"],
+            return_ids=True,
+        )
+        await session.commit()
+        return ids, await _rows(session)
+    
+    ids, rows = run_with_session(test)
+    assert ids == [2, 3]
+    assert rows == [(1, "a", "old"), (2, "b", "new"), (3, "c", "new")]
+
+
+def test_bulk_update_by_primary_key(run_with_session):
+    """测试按主键批量更新并刷新 updated_at"""
+    async def test(session):
+        ids = await BulkItem.bulk_insert(
+            session, [{"name": "a"}, {"name": "b"}, {"name": "c"}], return_ids=True
+        )
+        before = (await session.execute(select(BulkItem.updated_at))).scalars().first()
+        await BulkItem.bulk_update(
+            session,
+            [{"id": ids[0], "payload": "x"}, {"id": ids[2], "payload": "z"}],
+            chunk_size=1,
+        )
+        await session.commit()
+        after = (
+            await session.execute(select(BulkItem.updated_at).where(BulkItem.id == ids[0]))
+        ).scalar_one()
+        return await _rows(session), before, after
+    
+    rows, before, after = run_with_session(test)
+    assert [row[2] for row in rows] == ["x", None, "z"]
+    assert after >= before
+
+
+def test_bulk_writes_bump_table_version(run_with_session, fake_redis):
+    """测试批量写入提交后递增表版本号"""
+    async def test(session):
+        await BulkItem.bulk_insert(session, [{"name": "a"}])
+        await session.commit()
+        return await fake_redis.get(VERSION_KEY)
+    
+    assert run_with_session(test) == "1"
+
+
+class _FakeCopyConnection:
+    """只记录 COPY 记录的 asyncpg 连接替身"""
+    
+    def __init__(self):
+        self.records = []
+    
+    async def copy_records_to_table(self, table_name, records, columns, schema_name):
+        self.records.extend(records)
+
+
+def test_copy_insert_bumps_table_version(run_with_session, fake_redis, monkeypatch):
+    """测试 COPY 绕过ORM事件，提交后仍递增表版本号"""
+    driver = _FakeCopyConnection()
+    
+    async def test(session):
+        async def get_raw_connection():
+            return SimpleNamespace(driver_connection=driver)
+        
+        async def connection():
+            return SimpleNamespace(get_raw_connection=get_raw_connection)
+        
+        monkeypatch.setattr(session, "connection", connection)
+        count = await BulkItem.copy_insert(session, [{"name": "a"}, {"name": "b"}])
+        await session.commit()
+        return count, await fake_redis.get(VERSION_KEY)
+    
+    assert run_with_session(test) == (2, "1")
+    assert len(driver.records) == 2
+
+
+def test_bulk_upsert_unsupported_dialect(run_with_session, monkeypatch):
+    """测试不支持的方言抛出 ValueError"""
+    async def test(session):
+        bind = SimpleNamespace(dialect=SimpleNamespace(name="mysql"))
+        monkeypatch.setattr(session, "get_bind", lambda *args, **kwargs: bind)
+        with pytest.raises(ValueError, match="not supported on mysql"):
+            await BulkItem.bulk_upsert(session, [{"id": 1, "name": "a"}])
+    
+    run_with_session(test)
+
+
+def test_copy_insert_requires_asyncpg(run_with_session):
+    """测试非 asyncpg 驱动时抛出 RuntimeError"""
+    async def test(session):
+        with pytest.raises(RuntimeError, match="asyncpg"):
+            await BulkItem.copy_insert(session, [{"name": "a"}])
+    
+    run_with_session(test) 
\ No newline at end of file
@@ -0,0 +1,444 @@
+"""
+缓存测试
+
+测试本地缓存、缓存键与分片，以及基于 fakeredis 的批量读写、
+跨进程L1失效和 @cached 防击穿逻辑。
+"""
+
+import asyncio
+import json
+import time
+from datetime import date, datetime
+
+import fakeredis.aioredis
+
+from src.core import cache as cache_module
+from src.core.cache import (
+    _MISSING, CacheManager, LocalCache, cache, cached, make_cache_key, shard_index,
+)
+
+
+def test_local_cache_lru_eviction():
+    """测试L1按条目数LRU淘汰"""
+    local = LocalCache(max_items=2)
+    local.set("a", 1, size=1)
+    local.set("b", 2, size=1)
+    assert local.get("a") == 1
+    local.set("c", 3, size=1)
+    assert local.get("b") is _MISSING
+    assert local.get("a") == 1
+    assert local.evictions == 1
+
+
+def test_local_cache_byte_bound():
+    """测试L1按字节数限界"""
+    local = LocalCache(max_bytes=10)
+    local.set("a", "x", size=6)
+    local.set("b", "y", size=6)
+    assert len(local) == 1
+    assert local.set("big", "z", size=11) is False
+
+
+def test_local_cache_ttl():
+    """测试L1条目过期"""
+    local = LocalCache(ttl=30)
+    local.set("a", 1, size=1, ttl=0)
+    assert local.get("a") is _MISSING
+    local.set("b", 1, size=1, ttl=-1)
+    assert local.get("b") is _MISSING
+
+
+def test_local_cache_stale_fill_rejected():
+    """测试读取期间发生失效时放弃回填"""
+    local = LocalCache()
+    epoch = local.epoch
+    local.invalidate("a")
+    assert local.set("a", 1, size=1, epoch=epoch) is False
+    assert local.get("a") is _MISSING
+
+
+def _sample(*args, **kwargs):
+    return None
+
+
+def test_cache_key_is_canonical():
+    """测试缓存键与参数顺序、集合顺序无关"""
+    key1 = make_cache_key("p", _sample, ({3, 1, 2},), {"a": 1, "b": date(2024, 1, 1)})
+    key2 = make_cache_key("p", _sample, ({2, 3, 1},), {"b": date(2024, 1, 1), "a": 1})
+    assert key1 == key2
+    assert key1.startswith("p:tests.test_cache._sample:")
+    assert key1 != make_cache_key("p", _sample, ({3, 1},), {"a": 1})
+
+
+def test_cache_key_includes_namespace_version():
+    """测试命名空间版本号变化后键随之变化"""
+    key_v1 = make_cache_key("p", _sample, (1,), {}, version=1)
+    key_v2 = make_cache_key("p", _sample, (1,), {}, version=2)
+    assert key_v1 != key_v2
+
+
+def test_shard_index_moves_about_one_nth():
+    """测试新增节点时只有约 1/N 的键迁移"""
+    keys = [f"key:{i}" for i in range(20000)]
+    moved = sum(shard_index(key, 4) != shard_index(key, 5) for key in keys)
+    assert 0.15 < moved / len(keys) < 0.25
+    assert all(shard_index(key, 1) == 0 for key in keys[:100])
+
+
+def test_shard_index_hash_tag():
+    """测试 {hash tag} 相同的键落在同一分片"""
+    assert shard_index("{user:1}:profile", 16) == shard_index("{user:1}:orders", 16)
+
+
+async def _drain_inflight():
+    """等待后台刷新任务完成"""
+    await asyncio.gather(*list(cache_module._inflight.values()))
+
+
+async def _age_entry(client, key: str, **changes) -> None:
+    """改写缓存信封中的字段，模拟条目临近或已经过期"""
+    envelope = json.loads(await client.get(key))
+    envelope.update(changes)
+    await client.set(key, json.dumps(envelope))
+
+
+def test_cached_single_flight(fake_redis):
+    """测试并发未命中只执行一次函数"""
+    calls = []
+    
+    @cached(expire=60, key_prefix="t")
+    async def load():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"n": 1}
+    
+    async def run():
+        return await asyncio.gather(*(load() for _ in range(10)))
+    
+    assert asyncio.run(run()) == [{"n": 1}] * 10
+    assert len(calls) == 1
+
+
+def test_cached_waits_for_lock_holder(fake_redis):
+    """测试其他进程持有锁时等待其写回，不重复计算"""
+    calls = []
+    
+    async def load():
+        calls.append(1)
+        return "mine"
+    
+    wrapped = cached(expire=60, key_prefix="t", lock_timeout=2)(load)
+    key = make_cache_key("t", load, (), {})
+    
+    async def other_process():
+        await asyncio.sleep(0.1)
+        envelope = {"value": "theirs", "delta": 0.1, "expires_at": time.time() + 60}
+        await fake_redis.set(key, json.dumps(envelope))
+    
+    async def run():
+        await fake_redis.set(f"{key}:lock", "other", px=2000)
+        result, _ = await asyncio.gather(wrapped(), other_process())
+        return result
+    
+    assert asyncio.run(run()) == "theirs"
+    assert calls == []
+
+
+def test_cached_stale_while_revalidate(fake_redis):
+    """测试过期后在 stale 窗口内返回旧值，并由后台任务刷新"""
+    calls = []
+    
+    async def load():
+        calls.append(1)
+        return len(calls)
+    
+    wrapped = cached(expire=60, key_prefix="t", stale_ttl=60, beta=0)(load)
+    key = make_cache_key("t", load, (), {})
+    
+    async def run():
+        assert await wrapped() == 1
+        await _age_entry(fake_redis, key, expires_at=time.time() - 1)
+        stale = await wrapped()
+        await _drain_inflight()
+        return stale, await wrapped()
+    
+    assert asyncio.run(run()) == (1, 2)
+    assert len(calls) == 2
+
+
+def test_cached_xfetch_early_recompute(fake_redis, monkeypatch):
+    """测试计算耗时相对剩余有效期较长时提前重算，beta=0 时不提前"""
+    calls = []
+    
+    async def load():
+        calls.append(1)
+        return len(calls)
+    
+    early = cached(expire=60, key_prefix="early")(load)
+    never = cached(expire=60, key_prefix="never", beta=0)(load)
+    # -log(1 - 0.999) ≈ 6.9，delta=10 时提前量约69秒，超过剩余的30秒
+    monkeypatch.setattr(cache_module.random, "random", lambda: 0.999)
+    
+    async def run():
+        results = []
+        for prefix, wrapped in (("early", early), ("never", never)):
+            first = await wrapped()
+            key = make_cache_key(prefix, load, (), {})
+            await _age_entry(fake_redis, key, delta=10, expires_at=time.time() + 30)
+            results.append((first, await wrapped()))
+            await _drain_inflight()
+            results.append(await wrapped())
+        return results
+    
+    assert asyncio.run(run()) == [(1, 1), 2, (3, 3), 3]
+    assert len(calls) == 3
+
+
+def test_cached_miss_during_refresh_returns_value(fake_redis):
+    """测试后台刷新进行中时，未命中的调用得到函数结果而不是 None"""
+    calls = []
+    
+    async def load():
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        return {"n": len(calls)}
+    
+    wrapped = cached(expire=60, key_prefix="t", stale_ttl=60, beta=0)(load)
+    key = make_cache_key("t", load, (), {})
+    
+    async def run():
+        await wrapped()
+        await _age_entry(fake_redis, key, expires_at=time.time() - 1)
+        await wrapped()
+        # 刷新尚未完成时条目被删除
+        await fake_redis.delete(key)
+        result = await wrapped()
+        await _drain_inflight()
+        return result
+    
+    assert asyncio.run(run()) == {"n": 2}
+
+
+def test_cached_non_json_values(fake_redis):
+    """测试无法JSON编码的返回值按 str() 保存而不是报错"""
+    moment = datetime(2024, 1, 1, 12, 30)
+    
+    @cached(expire=60, key_prefix="t")
+    async def load(kind):
+        return moment if kind == "scalar" else {"at": moment}
+    
+    async def run():
+        first = (await load("scalar"), await load("dict"))
+        return first, (await load("scalar"), await load("dict"))
+    
+    first, second = asyncio.run(run())
+    assert first == (moment, {"at": moment})
+    assert second == (str(moment), {"at": str(moment)}) 
+
+def _count_calls(monkeypatch, client, name: str) -> list:
+    """记录客户端方法的调用参数"""
+    calls = []
+    method = getattr(client, name)
+    
+    def spy(*args, **kwargs):
+        calls.append(args)
+        return method(*args, **kwargs)
+    
+    monkeypatch.setattr(client, name, spy)
+    return calls
+
+
+def test_get_many_single_mget(fake_redis, monkeypatch):
+    """测试批量读取只发一次 MGET，按输入顺序返回并保留未命中"""
+    mgets = _count_calls(monkeypatch, fake_redis, "mget")
+    
+    async def run():
+        await fake_redis.set("a", json.dumps({"v": 1}))
+        await fake_redis.set("c", "3")
+        return await cache.get_many(["c", "a", "b", "a"], default="miss")
+    
+    result = asyncio.run(run())
+    assert list(result.items()) == [("c", 3), ("a", {"v": 1}), ("b", "miss")]
+    assert len(mgets) == 1
+
+
+def test_set_many_and_delete_many_one_round_trip(fake_redis, monkeypatch):
+    """测试批量写入在一个管道内完成、支持按键过期时间，批量删除只发一次 DEL"""
+    pipelines = _count_calls(monkeypatch, fake_redis, "pipeline")
+    deletes = _count_calls(monkeypatch, fake_redis, "delete")
+    
+    async def run():
+        ok = await cache.set_many(
+            {"a": {"v": 1}, "b": [1, 2], "c": "x"}, expire={"a": 60}
+        )
+        ttls = [await fake_redis.ttl(key) for key in ("a", "b")]
+        values = await cache.get_many(["a", "b", "c"])
+        deleted = await cache.delete_many(["a", "b", "missing"])
+        return ok, ttls, values, deleted, await fake_redis.exists("a", "b", "c")
+    
+    ok, ttls, values, deleted, remaining = asyncio.run(run())
+    assert ok is True
+    assert 0 < ttls[0] <= 60 and ttls[1] == -1
+    assert values == {"a": {"v": 1}, "b": [1, 2], "c": "x"}
+    assert deleted == 2 and remaining == 1
+    assert len(pipelines) == 1
+    assert len(deletes) == 1
+
+
+def test_auto_batched_get_coalesces_into_one_mget(fake_redis, monkeypatch):
+    """测试同一轮事件循环内的并发 get 合并为一次 MGET，各自取得自己的结果"""
+    monkeypatch.setattr(cache, "auto_batch", True)
+    mgets = _count_calls(monkeypatch, fake_redis, "mget")
+    
+    async def run():
+        await fake_redis.set("a", "1")
+        await fake_redis.set("b", json.dumps(["x"]))
+        first = await asyncio.gather(
+            cache.get("a"), cache.get("b"), cache.get("missing", default=0), cache.get("a")
+        )
+        second = await cache.get("b")
+        return first, second
+    
+    first, second = asyncio.run(run())
+    assert first == [1, ["x"], 0, 1]
+    assert second == ["x"]
+    assert len(mgets) == 2
+    assert sorted(mgets[0][0]) == ["a", "b", "missing"] 
+
+def test_scan_iterators_page_through_cursors(fake_redis, monkeypatch):
+    """测试 scan_keys、hscan_iter、sscan_iter 跨多页游标返回全部成员"""
+    pages = {
+        name: _count_calls(monkeypatch, fake_redis, name)
+        for name in ("scan", "hscan", "sscan")
+    }
+    
+    async def run():
+        await fake_redis.mset({f"user:{i}": i for i in range(25)})
+        await fake_redis.set("other", 1)
+        await fake_redis.hset(
+            "h", mapping={f"f{i}": json.dumps({"i": i}) for i in range(25)}
+        )
+        await fake_redis.sadd("s", *(str(i) for i in range(25)))
+        keys = {key async for key in cache.scan_keys("user:*", count=10)}
+        fields = {key: value async for key, value in cache.hscan_iter("h", count=10)}
+        members = {member async for member in cache.sscan_iter("s", count=10)}
+        return keys, fields, members
+    
+    keys, fields, members = asyncio.run(run())
+    assert keys == {f"user:{i}" for i in range(25)}
+    assert fields == {f"f{i}": {"i": i} for i in range(25)}
+    assert members == set(range(25))
+    assert all(len(calls) > 1 for calls in pages.values())
+
+
+def test_delete_by_pattern_unlinks_in_batches(fake_redis, monkeypatch):
+    """测试按模式分批 UNLINK，不匹配的键保留"""
+    unlinks = _count_calls(monkeypatch, fake_redis, "unlink")
+    deletes = _count_calls(monkeypatch, fake_redis, "delete")
+    
+    async def run():
+        await fake_redis.mset({f"tmp:{i}": i for i in range(23)})
+        await fake_redis.set("keep", 1)
+        deleted = await cache.delete_by_pattern("tmp:*", batch_size=5)
+        return deleted, sorted(await fake_redis.keys("*"))
+    
+    deleted, remaining = asyncio.run(run())
+    assert deleted == 23
+    assert remaining == ["keep"]
+    assert len(unlinks) > 1
+    assert sum(len(keys) for keys in unlinks) == 23
+    assert deletes == []
+
+
+async def _wait_for(predicate, timeout: float = 2.0) -> None:
+    """轮询等待条件成立"""
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "condition not met in time"
+        await asyncio.sleep(0.01)
+
+
+def test_invalidation_listener_drops_peer_l1_entries(fake_redis_server):
+    """测试两个进程共用Redis时，一方写入后另一方的L1条目被失效消息清除"""
+    def manager() -> CacheManager:
+        client = fakeredis.aioredis.FakeRedis(server=fake_redis_server, decode_responses=True)
+        instance = CacheManager(local_cache=LocalCache())
+        instance.redis = client
+        instance.nodes = [client]
+        return instance
+    
+    writer, reader = manager(), manager()
+    
+    async def run():
+        await writer.start_invalidation_listener()
+        await reader.start_invalidation_listener()
+        try:
+            await _wait_for(lambda: writer._subscribed and reader._subscribed)
+            
+            await writer.set("k", {"v": 1})
+            assert await reader.get("k") == {"v": 1}
+            assert await reader.get("k") == {"v": 1}
+            assert len(reader.local) == 1
+            
+            await writer.set("k", {"v": 2})
+            await _wait_for(lambda: len(reader.local) == 0)
+            assert await reader.get("k") == {"v": 2}
+            assert await reader.get("k") == {"v": 2}
+            
+            await writer.expire("k", 100)
+            await _wait_for(lambda: len(reader.local) == 0)
+            assert await reader.get("k") == {"v": 2}
+            
+            await writer.delete("k")
+            await _wait_for(lambda: len(reader.local) == 0)
+            assert await reader.get("k") is None
+            return reader.stats()
+        finally:
+            await writer.stop_invalidation_listener()
+            await reader.stop_invalidation_listener()
+    
+    stats = asyncio.run(run())
+    assert stats["l1"]["subscribed"] is True
+    assert stats["l1"]["hits"] == 2
+    assert stats["l1"]["misses"] == 4
+    assert stats["l2"]["hits"] == 3
+    assert stats["l2"]["misses"] == 1
+    assert stats["overall_hit_ratio"] == 5 / 6
+
+
+def test_sharded_keys_route_to_one_node():
+    """测试两个节点时每个键只写入 shard_index 所指节点，批量操作按输入顺序合并结果"""
+    nodes = [
+        fakeredis.aioredis.FakeRedis(server=fakeredis.FakeServer(), decode_responses=True)
+        for _ in range(2)
+    ]
+    manager = CacheManager()
+    manager.redis = nodes[0]
+    manager.nodes = nodes
+    keys = [f"key-{i}" for i in range(20)]
+    assert {shard_index(key, 2) for key in keys} == {0, 1}
+    
+    async def run():
+        assert await manager.set_many({key: {"v": key} for key in keys}) is True
+        await manager.set("single", 1)
+        placement = {
+            key: [bool(await node.exists(key)) for node in nodes] for key in keys + ["single"]
+        }
+        lookup = list(reversed(keys)) + ["missing"]
+        values = await manager.get_many(lookup, default="miss")
+        single = await manager.get("single")
+        deleted = await manager.delete_many(keys[::2] + ["missing"])
+        remaining = await manager.get_many(keys)
+        return placement, lookup, values, single, deleted, remaining
+    
+    placement, lookup, values, single, deleted, remaining = asyncio.run(run())
+    for key, present in placement.items():
+        assert present == [shard_index(key, 2) == index for index in range(2)]
+    assert list(values) == lookup
+    assert values == {**{key: {"v": key} for key in keys}, "missing": "miss"}
+    assert single == 1
+    assert deleted == 10
+    assert list(remaining) == keys
+    assert remaining == {
+        key: None if i % 2 == 0 else {"v": key} for i, key in enumerate(keys)
+    } 
\ No newline at end of file
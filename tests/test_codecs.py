@@ -0,0 +1,59 @@
+"""
+编解码测试
+
+测试缓存值的格式头、压缩与签名pickle。
+"""
+
+import pytest
+
+from src.core.codecs import CacheSerializer, Codec
+
+
+def test_json_roundtrip_with_header():
+    """测试JSON编码带格式头并可还原"""
+    serializer = CacheSerializer(codec="json")
+    data = serializer.dumps({"a": [1, 2, 3]})
+    assert CacheSerializer.is_encoded(data)
+    assert serializer.loads(data) == {"a": [1, 2, 3]}
+
+
+def test_compression_above_threshold():
+    """测试超过阈值的负载被压缩"""
+    serializer = CacheSerializer(codec="json", compression="zlib", compress_threshold=64)
+    value = {"text": "x" * 4096}
+    data = serializer.dumps(value)
+    assert len(data) < 4096
+    assert serializer.loads(data) == value
+    assert serializer.loads(serializer.dumps({"a": 1})) == {"a": 1}
+
+
+def test_legacy_text_is_not_encoded():
+    """测试旧版本写入的文本值不会被误判为编码值"""
+    assert not CacheSerializer.is_encoded(b'{"a": 1}')
+    assert not CacheSerializer.is_encoded("ok")
+    assert not CacheSerializer.is_encoded("中文".encode("utf-8"))
+
+
+def test_pickle_requires_opt_in_and_signature():
+    """测试pickle需要显式允许且校验签名"""
+    with pytest.raises(ValueError):
+        CacheSerializer(codec="pickle")
+    
+    writer = CacheSerializer(codec="pickle", allow_pickle=True, secret_key="a")
+    reader = CacheSerializer(codec="pickle", allow_pickle=True, secret_key="b")
+    data = writer.dumps({1, 2})
+    assert writer.loads(data) == {1, 2}
+    with pytest.raises(ValueError):
+        reader.loads(data)
+
+
+def test_codec_requires_dumps_and_loads():
+    """测试编解码器基类及未实现全部方法的子类不能实例化"""
+    class DumpsOnly(Codec):
+        def dumps(self, value):
+            return b""
+    
+    with pytest.raises(TypeError):
+        Codec()
+    with pytest.raises(TypeError):
+        DumpsOnly() 
\ No newline at end of file
@@ -0,0 +1,45 @@
+"""
+配置测试
+
+测试列表型环境变量同时支持JSON列表和逗号分隔。
+"""
+
+import pytest
+
+from src.core.config import DatabaseSettings, MonitoringSettings, RedisSettings
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        "redis://cache-1:6379/0, redis://cache-2:6379/0",
+        '["redis://cache-1:6379/0","redis://cache-2:6379/0"]',
+    ],
+)
+def test_redis_nodes_from_env(monkeypatch, value):
+    """测试 REDIS_NODES 解析"""
+    monkeypatch.setenv("REDIS_NODES", value)
+    assert RedisSettings(url="redis://localhost:6379/0").nodes == [
+        "redis://cache-1:6379/0",
+        "redis://cache-2:6379/0",
+    ]
+
+
+@pytest.mark.parametrize(
+    "value",
+    ["postgresql://r1/db,postgresql://r2/db", '["postgresql://r1/db", "postgresql://r2/db"]'],
+)
+def test_database_replica_urls_from_env(monkeypatch, value):
+    """测试 DATABASE_REPLICA_URLS 解析"""
+    monkeypatch.setenv("DATABASE_REPLICA_URLS", value)
+    assert DatabaseSettings().replica_urls == ["postgresql://r1/db", "postgresql://r2/db"]
+
+
+@pytest.mark.parametrize("value", ["0.01, 0.1,1", "[0.01, 0.1, 1]"])
+def test_latency_buckets_from_env(monkeypatch, value):
+    """测试直方图桶解析"""
+    monkeypatch.setenv("MONITORING_HTTP_LATENCY_BUCKETS", value)
+    monkeypatch.setenv("MONITORING_DB_LATENCY_BUCKETS", value)
+    monitoring = MonitoringSettings()
+    assert monitoring.http_latency_buckets == [0.01, 0.1, 1.0]
+    assert monitoring.db_latency_buckets == [0.01, 0.1, 1.0] 
\ No newline at end of file
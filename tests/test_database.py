@@ -0,0 +1,178 @@
+"""
+数据库测试
+
+测试连接预算的计算，以及基于 SQLite 的读写分离路由和副本健康检查。
+"""
+
+import asyncio
+
+import pytest
+from sqlalchemy import (
+    Column, Integer, MetaData, String, Table, create_engine, insert, select, text,
+)
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import declarative_base
+
+from src.core import database
+from src.core.config import settings
+from src.core.database import ReplicaPool, connection_budget
+
+
+def test_connection_budget_split(monkeypatch):
+    """测试全局上限按进程数和同步/异步比例分配"""
+    monkeypatch.setattr(settings.database, "max_connections", 100)
+    monkeypatch.setattr(settings.database, "reserved_connections", 20)
+    monkeypatch.setattr(settings.database, "process_count", 4)
+    monkeypatch.setattr(settings.database, "sync_pool_share", 0.25)
+    monkeypatch.setattr(settings.database, "pool_size", 10)
+    monkeypatch.setattr(settings.database, "max_overflow", 30)
+    
+    assert connection_budget("sync") == (5, 0)
+    assert connection_budget("async") == (10, 5)
+    sync_limit = sum(connection_budget("sync"))
+    async_limit = sum(connection_budget("async"))
+    assert (sync_limit + async_limit) * 4 <= 100 - 20
+
+
+def test_connection_budget_disabled(monkeypatch):
+    """测试未设置上限时沿用连接池配置"""
+    monkeypatch.setattr(settings.database, "max_connections", 0)
+    monkeypatch.setattr(settings.database, "pool_size", 20)
+    monkeypatch.setattr(settings.database, "max_overflow", 30)
+    assert connection_budget("async") == (20, 30)
+
+
+metadata = MetaData()
+rows = Table(
+    "routing_rows",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("source", String(16)),
+)
+
+
+def _sqlite_db(path, source: str) -> str:
+    """建一个只含一行 source 数据的库，返回异步URL"""
+    engine = create_engine(f"sqlite:///{path}")
+    metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(rows).values(source=source))
+    engine.dispose()
+    return f"sqlite+aiosqlite:///{path}"
+
+
+class RoutingRow(declarative_base()):
+    __table__ = rows
+
+
+class _OneReplica:
+    """总是选中同一个副本的副本池"""
+    
+    def __init__(self, engine):
+        self.engine = engine
+    
+    def choose(self):
+        return self.engine
+
+
+@pytest.fixture
+def routing(tmp_path, monkeypatch, fake_redis):
+    """主库与副本各一个 SQLite 库，在 RoutingSession 上执行测试协程"""
+    primary_url = _sqlite_db(tmp_path / "primary.db", "primary")
+    replica_url = _sqlite_db(tmp_path / "replica.db", "replica")
+    
+    def run(test):
+        async def main():
+            primary = create_async_engine(primary_url)
+            replica = create_async_engine(replica_url)
+            monkeypatch.setattr(database, "_async_engine", primary)
+            monkeypatch.setattr(database, "replica_pool", _OneReplica(replica))
+            try:
+                async with database.AsyncSessionLocal() as session:
+                    return await test(session)
+            finally:
+                await primary.dispose()
+                await replica.dispose()
+        return asyncio.run(main())
+    
+    return run
+
+
+async def _sources(session, stmt=None):
+    stmt = stmt if stmt is not None else select(rows.c.source)
+    return sorted((await session.execute(stmt)).scalars().all())
+
+
+def test_select_routes_to_replica(routing):
+    """测试只读 SELECT 走副本，FOR UPDATE 走主库"""
+    async def test(session):
+        return (
+            await _sources(session),
+            await _sources(session, select(rows.c.source).with_for_update()),
+        )
+    
+    assert routing(test) == (["replica"], ["primary"])
+
+
+def test_write_makes_session_stick_to_primary(routing):
+    """测试写入后会话留在主库，读到自己的写入"""
+    async def test(session):
+        before = await _sources(session)
+        await session.execute(insert(rows).values(source="mine"))
+        after = await _sources(session)
+        return before, after, session.info.get("use_primary")
+    
+    assert routing(test) == (["replica"], ["mine", "primary"], True)
+
+
+def test_flush_routes_to_primary(routing):
+    """测试ORM flush 写入主库"""
+    async def test(session):
+        session.add(RoutingRow(source="orm"))
+        await session.flush()
+        return await _sources(session)
+    
+    assert routing(test) == ["orm", "primary"]
+
+
+def test_use_primary_forces_primary(routing):
+    """测试 use_primary 会话标记和单条语句的 bind_arguments 都强制走主库"""
+    async def test(session):
+        result = await session.execute(
+            select(rows.c.source), bind_arguments={"use_primary": True}
+        )
+        statement = result.scalars().all()
+        replica = await _sources(session)
+        session.info["use_primary"] = True
+        return statement, replica, await _sources(session)
+    
+    assert routing(test) == (["primary"], ["replica"], ["primary"])
+
+
+def test_replica_pool_excludes_lagging_replica(tmp_path, monkeypatch):
+    """测试复制滞后超过 max_lag 的副本被排除，恢复后重新启用"""
+    urls = [
+        _sqlite_db(tmp_path / "fresh.db", "fresh"),
+        _sqlite_db(tmp_path / "lagging.db", "lagging"),
+    ]
+    
+    async def run():
+        pool = ReplicaPool(urls, max_lag=5.0)
+        fresh, lagging = pool.engines
+        # 让第二个副本走 PostgreSQL 的滞后查询分支
+        monkeypatch.setattr(lagging.dialect, "name", "postgresql")
+        try:
+            monkeypatch.setattr(database, "_REPLICA_LAG_SQL", text("SELECT 30"))
+            await pool.check()
+            lagged = (pool.healthy[:], {pool.choose() for _ in range(4)} == {fresh})
+            
+            monkeypatch.setattr(database, "_REPLICA_LAG_SQL", text("SELECT 1"))
+            await pool.check()
+            recovered = (pool.healthy[:], {pool.choose() for _ in range(4)})
+            return lagged, recovered, fresh, lagging
+        finally:
+            await pool.close()
+    
+    lagged, recovered, fresh, lagging = asyncio.run(run())
+    assert lagged == ([True, False], True)
+    assert recovered == ([True, True], {fresh, lagging}) 
\ No newline at end of file
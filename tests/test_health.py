@@ -0,0 +1,61 @@
+"""
+健康检查测试
+
+测试组件探针的并发、超时与结果缓存。
+"""
+
+import asyncio
+
+from src.core.health import HealthChecker
+
+
+def test_probes_run_concurrently_with_timeout():
+    """测试探针并发执行，超时的组件标记为不健康"""
+    async def slow():
+        await asyncio.sleep(0.05)
+    
+    async def hang():
+        await asyncio.sleep(10)
+    
+    checker = HealthChecker(cache_ttl=60, timeout=0.2)
+    checker.register("a", slow)
+    checker.register("b", slow)
+    checker.register("hang", hang, timeout=0.1)
+    
+    async def run():
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        result = await checker.check()
+        return result, loop.time() - start
+    
+    result, elapsed = asyncio.run(run())
+    assert elapsed < 0.2
+    assert result["status"] == "degraded"
+    assert result["components"] == {"a": "healthy", "b": "healthy", "hang": "unhealthy"}
+    assert result["details"]["hang"]["error"] == "timed out after 0.1s"
+    assert "latency_ms" in result["details"]["a"]
+
+
+def test_results_cached_and_shared():
+    """测试并发请求共享一次探测，TTL内不再访问后端"""
+    calls = 0
+    
+    async def probe():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return {"version": "1"}
+    
+    checker = HealthChecker(cache_ttl=60)
+    checker.register("db", probe)
+    
+    async def run():
+        results = await asyncio.gather(*(checker.check() for _ in range(20)))
+        results.append(await checker.check())
+        return results
+    
+    results = asyncio.run(run())
+    assert calls == 1
+    assert all(result["status"] == "healthy" for result in results)
+    assert results[-1]["components"] == {"db": "healthy"}
+    assert results[-1]["details"]["db"]["version"] == "1" 
\ No newline at end of file
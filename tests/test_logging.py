@@ -0,0 +1,124 @@
+"""
+日志测试
+
+测试队列模式日志线程的批量写出、队列满时的丢弃计数和停止后的同步写出，
+以及请求日志采样与限速。
+"""
+
+import io
+import threading
+
+import orjson
+import pytest
+import structlog
+
+from src.core import logging as app_logging
+from src.core.logging import (
+    LogRateLimiter, LogSampler, LogWriter, QueueLogger, shutdown_logging,
+)
+
+
+class _RecordingLogger:
+    def __init__(self):
+        self.lines = []
+    
+    def info(self, *args, **kwargs):
+        self.lines.append(args or kwargs)
+
+
+def test_log_writer_flushes_batches_on_stop():
+    """测试停止时写出队列中剩余的全部日志"""
+    stream = io.BytesIO()
+    writer = LogWriter(stream, batch_size=2, flush_interval=0.05)
+    writer.start()
+    for i in range(5):
+        writer.put(0.0, {"event": "Request completed", "index": i})
+    writer.stop()
+    
+    lines = stream.getvalue().splitlines()
+    assert [orjson.loads(line)["index"] for line in lines] == [0, 1, 2, 3, 4]
+    assert orjson.loads(lines[0])["timestamp"].startswith("1970-01-01T00:00:00")
+    assert not writer.is_alive()
+
+
+def test_log_writer_drops_when_queue_full():
+    """测试 drop 策略下队列满时丢弃并计数"""
+    writer = LogWriter(io.BytesIO(), queue_size=2, overflow="drop")
+    for i in range(5):
+        writer.put(0.0, {"event": "x"})
+    assert writer.dropped == 3
+    assert writer.queue.qsize() == 2
+
+
+def test_shutdown_falls_back_to_synchronous_writes(monkeypatch):
+    """测试 shutdown_logging 之后的日志直接写出而不是丢失"""
+    stream = io.BytesIO()
+    writer = LogWriter(stream, flush_interval=0.05)
+    writer.start()
+    monkeypatch.setattr(app_logging, "_writer", writer)
+    monkeypatch.setattr(app_logging, "_stopped_writer", None)
+    
+    QueueLogger().msg({"event": "before", "_timestamp": 1.0})
+    shutdown_logging()
+    QueueLogger().msg({"event": "after", "_timestamp": 2.0})
+    
+    assert app_logging._writer is None
+    assert not writer.is_alive()
+    events = [orjson.loads(line)["event"] for line in stream.getvalue().splitlines()]
+    assert events == ["before", "after"]
+
+
+def test_blocked_put_released_on_stop():
+    """测试 block 策略下等待入队的调用在日志线程停止后直接写出，不会永久阻塞"""
+    stream = io.BytesIO()
+    writer = LogWriter(stream, queue_size=1, overflow="block", flush_interval=0.05)
+    writer.put(0.0, {"event": "queued"})
+    blocked = threading.Thread(target=writer.put, args=(0.0, {"event": "blocked"}))
+    blocked.start()
+    
+    writer.stop()
+    blocked.join(timeout=2)
+    
+    assert not blocked.is_alive()
+    events = sorted(orjson.loads(line)["event"] for line in stream.getvalue().splitlines())
+    assert events == ["blocked", "queued"] 
+
+
+def test_sampler_keeps_or_drops_request_lines_together():
+    """测试同一请求的日志整体保留或丢弃，5xx请求总是保留"""
+    sampler = LogSampler(rates={"Request completed": 0.0}, slow_threshold=1.0)
+    logger = _RecordingLogger()
+    
+    for status_code, kept in ((200, 0), (500, 2)):
+        token = sampler.begin_request()
+        for event in ("Handling", "Request completed"):
+            with pytest.raises(structlog.DropEvent):
+                sampler(logger, "info", {"event": event, "level": "info"})
+        sampler.end_request(token, status_code, duration=0.01)
+        assert len(logger.lines) == kept
+    
+    # 请求之外按事件逐条采样，warning 总是保留
+    with pytest.raises(structlog.DropEvent):
+        sampler(logger, "info", {"event": "Request completed", "level": "info"})
+    event_dict = {"event": "Request completed", "level": "warning"}
+    assert sampler(logger, "warning", event_dict) is event_dict
+
+
+def test_rate_limiter_suppresses_and_summarizes():
+    """测试超出窗口配额的重复事件被抑制，窗口结束后汇总"""
+    now = [0.0]
+    limiter = LogRateLimiter(burst=2, window=60, clock=lambda: now[0])
+    reports = []
+    limiter._report = reports.append
+    
+    dropped = 0
+    for _ in range(5):
+        try:
+            limiter(None, "warning", {"event": "Cache unavailable", "logger": "cache"})
+        except structlog.DropEvent:
+            dropped += 1
+    assert dropped == 3
+    
+    now[0] = 61.0
+    limiter(None, "warning", {"event": "Cache unavailable", "logger": "cache"})
+    assert reports == [{("cache", "Cache unavailable"): 3}] 
\ No newline at end of file
@@ -0,0 +1,103 @@
+"""
+请求指标测试
+
+测试纯ASGI指标中间件对普通与流式响应的记录。
+"""
+
+import os
+
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from src.core.config import settings
+from src.core.metrics import (
+    MULTIPROC_ENV, REQUEST_COUNT, REQUEST_TTFB, UNMATCHED_ENDPOINT,
+    RequestMetricsMiddleware, setup_multiprocess,
+)
+
+app = FastAPI()
+app.add_middleware(RequestMetricsMiddleware)
+
+
+@app.get("/metrics-test/stream")
+async def stream():
+    async def body():
+        for chunk in (b"a", b"b", b"c"):
+            yield chunk
+    return StreamingResponse(body())
+
+
+@app.get("/metrics-test/items/{item_id}")
+async def item(item_id: int):
+    return {"id": item_id}
+
+
+@app.get("/metrics-test/error")
+async def error():
+    raise RuntimeError("boom")
+
+
+def _sample(metric, name, **labels):
+    for family in metric.collect():
+        for sample in family.samples:
+            if sample.name == name and all(sample.labels.get(k) == v for k, v in labels.items()):
+                return sample.value
+    return 0
+
+
+def test_streaming_response_passes_through():
+    """测试流式响应不被缓冲且记录首字节时间"""
+    client = TestClient(app)
+    response = client.get("/metrics-test/stream")
+    assert response.content == b"abc"
+    assert _sample(
+        REQUEST_TTFB, "http_request_ttfb_seconds_count", endpoint="/metrics-test/stream"
+    ) == 1
+    assert _sample(
+        REQUEST_COUNT, "http_requests_total", endpoint="/metrics-test/stream", status="200"
+    ) == 1
+
+
+def test_exception_recorded_as_500():
+    """测试应用异常按500记录"""
+    client = TestClient(app, raise_server_exceptions=False)
+    assert client.get("/metrics-test/error").status_code == 500
+    assert _sample(
+        REQUEST_COUNT, "http_requests_total", endpoint="/metrics-test/error", status="500"
+    ) == 1 
+
+
+def test_endpoint_label_uses_route_template():
+    """测试按路由模板记录，未匹配的路径合并为一个标签"""
+    client = TestClient(app)
+    for item_id in range(3):
+        client.get(f"/metrics-test/items/{item_id}")
+    client.get("/metrics-test/unknown/1")
+    client.get("/metrics-test/unknown/2")
+    assert _sample(
+        REQUEST_COUNT,
+        "http_requests_total",
+        endpoint="/metrics-test/items/{item_id}",
+        status="200",
+    ) == 3
+    assert _sample(
+        REQUEST_COUNT, "http_requests_total", endpoint="/metrics-test/items/0"
+    ) == 0
+    assert _sample(
+        REQUEST_COUNT, "http_requests_total", endpoint=UNMATCHED_ENDPOINT, status="404"
+    ) >= 2
+
+
+def test_setup_multiprocess_only_removes_value_files(tmp_path, monkeypatch):
+    """测试只删除上次运行的 .db 值文件，配置目录中的其他文件保留"""
+    (tmp_path / "counter_123.db").write_bytes(b"stale")
+    (tmp_path / "keep.txt").write_text("keep")
+    # 置空而不是删除，测试结束后由 monkeypatch 还原
+    monkeypatch.setenv(MULTIPROC_ENV, "")
+    monkeypatch.setattr(settings.monitoring, "multiproc_dir", str(tmp_path))
+    
+    setup_multiprocess(workers=2)
+    
+    assert os.environ[MULTIPROC_ENV] == str(tmp_path)
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["keep.txt"] 
\ No newline at end of file
@@ -0,0 +1,142 @@
+"""
+分页测试
+
+测试游标的编码与解码，并基于 SQLite 测试游标分页与计数。
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import Column, String
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from src.core.database import Base
+from src.models.base import BaseModelMixin, decode_cursor, encode_cursor
+
+
+class PageItem(Base, BaseModelMixin):
+    """分页测试用表"""
+    
+    __tablename__ = "page_item"
+    
+    name = Column(String(64), nullable=False)
+
+
+@pytest.fixture
+def run_with_session(tmp_path, fake_redis):
+    """在新建的 SQLite 库上以异步会话执行测试协程"""
+    url = f"sqlite+aiosqlite:///{tmp_path / 'page.db'}"
+    
+    def run(test):
+        async def main():
+            engine = create_async_engine(url)
+            try:
+                async with engine.begin() as conn:
+                    await conn.run_sync(PageItem.__table__.create)
+                async with AsyncSession(engine, expire_on_commit=False) as session:
+                    return await test(session)
+            finally:
+                await engine.dispose()
+        return asyncio.run(main())
+    
+    return run
+
+
+async def _insert_items(session, count=11):
+    """插入记录，多数记录共用同一 created_at"""
+    shared = datetime(2024, 1, 1, 12, 0, 0)
+    rows = [
+        {"name": f"item-{i}", "created_at": shared if i < 8 else shared + timedelta(seconds=i)}
+        for i in range(count)
+    ]
+    await PageItem.bulk_insert(session, rows)
+    await session.commit()
+
+
+def test_cursor_round_trip():
+    """测试游标可还原日期和主键"""
+    values = [datetime(2024, 1, 1, 12, 30, 15, 123456), 42]
+    cursor = encode_cursor(values)
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == values
+
+
+@pytest.mark.parametrize("cursor", ["not-base64!", "e30", encode_cursor([1])[:-2]])
+def test_invalid_cursor(cursor):
+    """测试非法游标抛出 ValueError"""
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+@pytest.mark.parametrize("descending", [True, False])
+def test_paginate_keyset_walks_all_pages(run_with_session, descending):
+    """测试逐页翻完：created_at 相同的记录既不重复也不遗漏，最后一页游标为 None"""
+    async def test(session):
+        await _insert_items(session)
+        pages = []
+        cursor = None
+        while True:
+            items, cursor = await PageItem.paginate_keyset(
+                session, cursor=cursor, size=3, descending=descending
+            )
+            pages.append([item.id for item in items])
+            if cursor is None:
+                return pages
+    
+    pages = run_with_session(test)
+    assert [len(page) for page in pages] == [3, 3, 3, 2]
+    ids = [item_id for page in pages for item_id in page]
+    assert len(ids) == len(set(ids)) == 11
+    # 前8条 created_at 相同，按 id 决定先后
+    expected = list(range(11, 8, -1)) + list(range(8, 0, -1)) if descending else list(range(1, 12))
+    assert ids == expected
+
+
+def test_paginate_keyset_exact_page_boundary(run_with_session):
+    """测试记录数恰为页大小整数倍时，最后一页游标为 None"""
+    async def test(session):
+        await _insert_items(session, count=6)
+        first, cursor = await PageItem.paginate_keyset(session, size=3)
+        second, last_cursor = await PageItem.paginate_keyset(session, cursor=cursor, size=3)
+        return first, second, last_cursor
+    
+    first, second, last_cursor = run_with_session(test)
+    assert len(first) == len(second) == 3
+    assert last_cursor is None
+
+
+def test_count_rows_cached(run_with_session):
+    """测试 cached 模式首次精确计数，之后读取缓存"""
+    async def test(session):
+        await _insert_items(session)
+        first = await PageItem.count_rows(session, mode="cached")
+        await PageItem.bulk_insert(session, [{"name": "extra"}])
+        await session.commit()
+        second = await PageItem.count_rows(session, mode="cached")
+        filtered = await PageItem.count_rows(
+            session, mode="cached", filters=[PageItem.name == "extra"]
+        )
+        return first, second, filtered
+    
+    first, second, filtered = run_with_session(test)
+    assert first == (11, True)
+    # 缓存期内返回旧值并标记为非精确
+    assert second == (11, False)
+    assert filtered == (1, True)
+
+
+def test_count_rows_exact(run_with_session):
+    """测试 exact 模式每次执行 COUNT(*)"""
+    async def test(session):
+        await _insert_items(session)
+        first = await PageItem.count_rows(session, mode="exact")
+        await PageItem.bulk_insert(session, [{"name": "extra"}])
+        await session.commit()
+        second = await PageItem.count_rows(
+            session, mode="exact", filters=[PageItem.name != "extra"]
+        )
+        third = await PageItem.count_rows(session, mode="exact")
+        return first, second, third
+    
+    assert run_with_session(test) == ((11, True), (11, True), (12, True)) 
\ No newline at end of file
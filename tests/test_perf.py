@@ -0,0 +1,52 @@
+"""
+函数耗时直方图测试
+
+测试分桶精度、分位数计算，以及装饰器对同步/异步函数的自动识别。
+"""
+
+import asyncio
+
+import pytest
+
+from src.core.logging import log_performance
+from src.core.perf import LatencyHistogram, bucket_index, bucket_upper, perf_snapshot
+
+
+def test_bucket_relative_error():
+    """测试桶上界与实际值的相对误差不超过 1/16"""
+    for value in (0, 1, 15, 16, 17, 1000, 123456789, 2 ** 40 + 12345):
+        upper = bucket_upper(bucket_index(value))
+        assert value <= upper <= value + max(1, value // 16)
+
+
+def test_histogram_percentiles():
+    """测试分位数落在真实值的误差范围内"""
+    histogram = LatencyHistogram("test")
+    for ms in range(1, 101):
+        histogram.record(ms * 1_000_000)
+    
+    snapshot = histogram.snapshot()
+    assert snapshot["count"] == 100
+    assert 50 <= snapshot["p50_ms"] <= 50 * 17 / 16
+    assert 99 <= snapshot["p99_ms"] <= 100
+    assert snapshot["max_ms"] == 100
+
+
+def test_decorator_detects_async_and_counts_errors():
+    """测试同步和异步函数都计入直方图，异常调用计为错误"""
+    @log_performance()
+    def sync_work():
+        return 1
+    
+    @log_performance()
+    async def async_work():
+        raise ValueError("boom")
+    
+    assert sync_work() == 1
+    assert asyncio.iscoroutinefunction(async_work)
+    with pytest.raises(ValueError):
+        asyncio.run(async_work())
+    
+    snapshot = perf_snapshot()
+    assert snapshot[sync_work.__module__ + "." + sync_work.__qualname__]["count"] == 1
+    assert snapshot[async_work.__module__ + "." + async_work.__qualname__]["errors"] == 1 
\ No newline at end of file
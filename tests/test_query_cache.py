@@ -0,0 +1,141 @@
+"""
+查询结果缓存测试
+
+测试从语句中提取所涉及的表，以及基于 SQLite 和 fakeredis 的
+提交→版本号递增→重新回填流程。
+"""
+
+import asyncio
+
+import fakeredis
+import pytest
+from sqlalchemy import Column, Integer, MetaData, String, Table, create_engine, insert, select
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import Session
+
+from src.core import database, query_cache
+from src.core.cache import NAMESPACE_KEY_PREFIX
+from src.core.query_cache import _statement_tables, cached_query, table_namespace
+
+metadata = MetaData()
+users = Table("users", metadata, Column("id", Integer, primary_key=True))
+orders = Table(
+    "orders",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("user_id", Integer),
+)
+items = Table("items", metadata, Column("order_id", Integer))
+
+
+def test_statement_tables_include_joins_and_subqueries():
+    """测试JOIN和子查询中的表都会被计入"""
+    subquery = select(items.c.order_id).scalar_subquery()
+    stmt = (
+        select(users.c.id)
+        .join(orders, orders.c.user_id == users.c.id)
+        .where(orders.c.id.in_(subquery))
+    )
+    assert _statement_tables(stmt) == {"users", "orders", "items"}
+
+
+notes = Table(
+    "notes",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("body", String(32)),
+)
+
+NOTES_VERSION_KEY = f"{NAMESPACE_KEY_PREFIX}{table_namespace('notes')}"
+
+
+@pytest.fixture
+def primary(tmp_path, monkeypatch, fake_redis, fake_redis_server):
+    """SQLite 文件作为主库，同步会话的版本号写入同一个 fakeredis"""
+    url = f"sqlite:///{tmp_path / 'primary.db'}"
+    sync_engine = create_engine(url)
+    notes.create(sync_engine)
+    monkeypatch.setattr(
+        query_cache, "_sync_clients", [fakeredis.FakeRedis(server=fake_redis_server)]
+    )
+    yield url, sync_engine
+    sync_engine.dispose()
+
+
+async def _bodies(session) -> list:
+    return sorted(row["body"] for row in await cached_query(session, select(notes)))
+
+
+def test_commit_invalidates_and_refills(primary, monkeypatch, fake_redis):
+    """测试异步会话提交后版本号递增，下一次查询重新回填"""
+    url, sync_engine = primary
+    
+    async def run():
+        engine = create_async_engine(url.replace("sqlite://", "sqlite+aiosqlite://"))
+        monkeypatch.setattr(database, "_async_engine", engine)
+        try:
+            async with database.AsyncSessionLocal() as session:
+                await session.execute(insert(notes).values(body="a"))
+                await session.commit()
+                first = await _bodies(session)
+                
+                # 绕过会话直接写库：版本号不变，查询命中缓存
+                with sync_engine.begin() as conn:
+                    conn.execute(insert(notes).values(body="b"))
+                cached = await _bodies(session)
+                
+                await session.execute(insert(notes).values(body="c"))
+                await session.commit()
+                refilled = await _bodies(session)
+            return first, cached, refilled, await fake_redis.get(NOTES_VERSION_KEY)
+        finally:
+            await engine.dispose()
+    
+    assert asyncio.run(run()) == (["a"], ["a"], ["a", "b", "c"], "2")
+
+
+def test_sync_commit_outside_event_loop_bumps_versions(primary, fake_redis):
+    """测试脚本、Celery 等不在事件循环中的同步会话提交后也会递增版本号"""
+    _, sync_engine = primary
+    with Session(sync_engine) as session:
+        session.execute(insert(notes).values(body="a"))
+        session.commit()
+    
+    assert asyncio.run(fake_redis.get(NOTES_VERSION_KEY)) == "1"
+
+
+class _LaggingReplicas:
+    """总是选中同一个副本的副本池"""
+    
+    def __init__(self, engine):
+        self.engine = engine
+    
+    def choose(self):
+        return self.engine
+
+
+def test_fill_reads_primary_not_lagging_replica(primary, tmp_path, monkeypatch):
+    """测试未命中时的回填走主库，不会把滞后副本的旧数据写入新版本的缓存"""
+    url, sync_engine = primary
+    with sync_engine.begin() as conn:
+        conn.execute(insert(notes).values(body="a"))
+    # 副本尚未复制到这一行
+    replica_url = f"sqlite:///{tmp_path / 'replica.db'}"
+    replica_sync = create_engine(replica_url)
+    notes.create(replica_sync)
+    replica_sync.dispose()
+    
+    async def run():
+        engine = create_async_engine(url.replace("sqlite://", "sqlite+aiosqlite://"))
+        replica = create_async_engine(replica_url.replace("sqlite://", "sqlite+aiosqlite://"))
+        monkeypatch.setattr(database, "_async_engine", engine)
+        monkeypatch.setattr(database, "replica_pool", _LaggingReplicas(replica))
+        try:
+            async with database.AsyncSessionLocal() as session:
+                from_replica = (await session.execute(select(notes.c.body))).scalars().all()
+                return from_replica, await _bodies(session), await _bodies(session)
+        finally:
+            await engine.dispose()
+            await replica.dispose()
+    
+    assert asyncio.run(run()) == ([], ["a"], ["a"]) 
\ No newline at end of file
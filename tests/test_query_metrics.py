@@ -0,0 +1,31 @@
+"""
+查询监控测试
+
+测试SQL指纹归一化与请求级统计。
+"""
+
+from sqlalchemy import create_engine, text
+
+from src.core.query_metrics import begin_request, end_request, fingerprint, instrument_engine
+
+
+def test_fingerprint_normalizes_literals_and_params():
+    """测试不同参数与IN列表长度得到相同指纹"""
+    first = fingerprint("SELECT * FROM users WHERE id IN ($1, $2) AND name = 'a'")
+    second = fingerprint("SELECT  *  FROM users WHERE id IN ($1, $2, $3) AND name = 'b'")
+    assert first == second
+    assert first[1] == "SELECT * FROM users WHERE id IN (?+) AND name = ?"
+    assert first[2] == "select"
+
+
+def test_request_stats_counts_queries():
+    """测试请求内的查询次数与指纹计数"""
+    engine = create_engine("sqlite://")
+    instrument_engine(engine)
+    token = begin_request()
+    with engine.connect() as conn:
+        for i in range(3):
+            conn.execute(text("SELECT :value"), {"value": i})
+    stats = end_request(token, "GET", "/test")
+    assert stats.count == 3
+    assert list(stats.fingerprints.values()) == [3] 
\ No newline at end of file
@@ -0,0 +1,164 @@
+"""
+限流测试
+
+使用内存桩限流器测试中间件的规则匹配与响应头。
+"""
+
+from fastapi import FastAPI
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.testclient import TestClient
+
+from src.core.ratelimit import RateLimit, RateLimitMiddleware, RateLimitResult, path_matches
+
+
+class StubLimiter:
+    """按键计数的内存限流器"""
+    
+    def __init__(self):
+        self.counts = {}
+    
+    async def hit(self, key: str, limit: RateLimit) -> RateLimitResult:
+        count = self.counts.get(key, 0) + 1
+        self.counts[key] = count
+        allowed = count <= limit.requests
+        remaining = max(0, limit.requests - count)
+        retry_after = 0.0 if allowed else 3.2
+        return RateLimitResult(allowed, limit.requests, remaining, 10.0, retry_after)
+
+
+def _client(limiter: StubLimiter) -> TestClient:
+    app = FastAPI()
+    
+    @app.get("/api/items")
+    async def items():
+        return {"ok": True}
+    
+    @app.get("/api/login")
+    async def login():
+        return {"ok": True}
+    
+    @app.get("/api/login-history")
+    async def login_history():
+        return {"ok": True}
+    
+    @app.get("/health")
+    async def health():
+        return {"ok": True}
+    
+    @app.get("/health/live")
+    async def live():
+        return {"ok": True}
+    
+    @app.get("/healthz")
+    async def healthz():
+        return {"ok": True}
+    
+    app.add_middleware(
+        RateLimitMiddleware,
+        limiter=limiter,
+        default_limit=RateLimit(3, 60),
+        route_limits={"/api/login": "1/60"},
+        exempt_paths=["/health"],
+    )
+    return TestClient(app)
+
+
+def test_parse_rate_limit():
+    """测试规则解析"""
+    assert RateLimit.parse("100/60") == RateLimit(100, 60)
+    assert RateLimit.parse("5") == RateLimit(5, 60)
+
+
+def test_rate_limit_headers_and_429():
+    """测试响应头与超限响应"""
+    client = _client(StubLimiter())
+    for remaining in (2, 1, 0):
+        response = client.get("/api/items")
+        assert response.status_code == 200
+        assert response.headers["ratelimit-limit"] == "3"
+        assert response.headers["ratelimit-remaining"] == str(remaining)
+    
+    response = client.get("/api/items")
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == "4"
+
+
+def test_route_limits_and_exempt_paths():
+    """测试按路由规则限流与豁免路径"""
+    limiter = StubLimiter()
+    client = _client(limiter)
+    assert client.get("/api/login").status_code == 200
+    assert client.get("/api/login").status_code == 429
+    assert client.get("/api/items").status_code == 200
+    for _ in range(5):
+        assert client.get("/health").status_code == 200
+    assert set(limiter.counts) == {"/api/login:ip:testclient", "*:ip:testclient"}
+
+
+def test_exempt_paths_match_whole_segments():
+    """测试豁免路径按完整路径段匹配，相同前缀的其他路径照常限流"""
+    limiter = StubLimiter()
+    client = _client(limiter)
+    for _ in range(5):
+        assert client.get("/health/live").status_code == 200
+    assert client.get("/healthz").status_code == 200
+    assert limiter.counts == {"*:ip:testclient": 1}
+
+
+def test_path_matches():
+    """测试前缀按完整路径段匹配"""
+    assert path_matches("/health", "/health")
+    assert path_matches("/health/live", "/health")
+    assert path_matches("/health/live", "/health/")
+    assert not path_matches("/healthz", "/health")
+    assert path_matches("/anything", "/")
+
+
+def test_route_limits_match_whole_segments():
+    """测试路由规则按完整路径段匹配，相同前缀的其他路由使用全局规则"""
+    limiter = StubLimiter()
+    client = _client(limiter)
+    assert client.get("/api/login").status_code == 200
+    assert client.get("/api/login").status_code == 429
+    response = client.get("/api/login-history")
+    assert response.status_code == 200
+    assert response.headers["ratelimit-limit"] == "3"
+    assert limiter.counts == {"/api/login:ip:testclient": 2, "*:ip:testclient": 1}
+
+
+def test_options_requests_not_counted():
+    """测试OPTIONS请求不消耗配额"""
+    limiter = StubLimiter()
+    client = _client(limiter)
+    for _ in range(5):
+        client.options("/api/login")
+    assert limiter.counts == {}
+    assert client.get("/api/login").status_code == 200
+
+
+def test_rate_limit_inside_cors():
+    """测试限流挂在CORS之内时，429带CORS头且预检请求不受限"""
+    app = FastAPI()
+    
+    @app.get("/api/items")
+    async def items():
+        return {"ok": True}
+    
+    # 与 main.py 相同的顺序：后添加的在外层
+    app.add_middleware(RateLimitMiddleware, limiter=StubLimiter(), default_limit=RateLimit(1, 60))
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["http://example.com"],
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    client = TestClient(app)
+    origin = {"Origin": "http://example.com"}
+    preflight = {**origin, "Access-Control-Request-Method": "GET"}
+    
+    for _ in range(3):
+        assert client.options("/api/items", headers=preflight).status_code == 200
+    assert client.get("/api/items", headers=origin).status_code == 200
+    response = client.get("/api/items", headers=origin)
+    assert response.status_code == 429
+    assert response.headers["access-control-allow-origin"] == "http://example.com" 
\ No newline at end of file
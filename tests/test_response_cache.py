@@ -0,0 +1,133 @@
+"""
+响应缓存测试
+
+测试缓存键规范化、ETag比较和 Cache-Control 解析，以及基于 fakeredis 的
+中间件命中、304 和不可缓存响应。
+"""
+
+import asyncio
+
+import httpx
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+
+from src.core.response_cache import (
+    ResponseCacheMiddleware, _cache_control, _etag_matches, _max_age, cache_response,
+    make_etag, response_cache_key,
+)
+
+
+def _scope(query: bytes, headers=()):
+    return {"path": "/items", "query_string": query, "headers": list(headers)}
+
+
+def test_cache_key_normalizes_query_and_varies_by_headers():
+    """测试查询参数顺序不影响缓存键，vary 请求头参与缓存键"""
+    vary = ("authorization",)
+    assert response_cache_key(_scope(b"a=1&b=2"), vary) == response_cache_key(_scope(b"b=2&a=1"), vary)
+    assert response_cache_key(_scope(b"a=1"), vary) != response_cache_key(_scope(b"a=2"), vary)
+    
+    alice = _scope(b"", [(b"authorization", b"Bearer alice")])
+    bob = _scope(b"", [(b"authorization", b"Bearer bob")])
+    assert response_cache_key(alice, vary) != response_cache_key(bob, vary)
+    assert response_cache_key(alice, ()) == response_cache_key(bob, ())
+
+
+def test_etag_matching():
+    """测试 If-None-Match 列表、弱标记和通配符"""
+    etag = make_etag(b"body")
+    assert etag.startswith('"') and etag.endswith('"')
+    assert _etag_matches(etag.encode(), etag)
+    assert _etag_matches(f'"other", W/{etag}'.encode(), etag)
+    assert _etag_matches(b"*", etag)
+    assert not _etag_matches(b'"other"', etag)
+    assert not _etag_matches(None, etag)
+
+
+def test_cache_control_max_age():
+    """测试 s-maxage 优先于 max-age"""
+    directives = _cache_control(b"public, max-age=30, s-maxage=120")
+    assert _max_age(directives) == 120
+    assert "public" in directives
+    assert _max_age(_cache_control(b"no-store")) is None 
+
+def _app(calls):
+    app = FastAPI()
+    app.add_middleware(ResponseCacheMiddleware)
+    
+    @app.get("/items/special")
+    async def special():
+        calls.append("special")
+        return {"special": True}
+    
+    @app.get("/items/{item_id}")
+    @cache_response(expire=60)
+    async def item(item_id: int):
+        calls.append(item_id)
+        return {"id": item_id}
+    
+    @app.get("/no-store")
+    @cache_response(expire=60)
+    async def no_store():
+        calls.append("no-store")
+        return JSONResponse({}, headers={"cache-control": "no-store"})
+    
+    @app.get("/cookie")
+    @cache_response(expire=60)
+    async def cookie():
+        calls.append("cookie")
+        response = JSONResponse({})
+        response.set_cookie("session", "abc")
+        return response
+    
+    return app
+
+
+def _request_all(app, *requests):
+    """依次发出 (路径, 请求头) 请求"""
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return [await client.get(path, headers=headers) for path, headers in requests]
+    return asyncio.run(run())
+
+
+def test_hit_skips_handler(fake_redis):
+    """测试第二次请求命中缓存，不再执行处理函数"""
+    calls = []
+    miss, hit = _request_all(_app(calls), ("/items/1", {}), ("/items/1", {}))
+    assert calls == [1]
+    assert miss.headers["x-cache"] == "MISS"
+    assert hit.headers["x-cache"] == "HIT"
+    assert hit.json() == {"id": 1}
+    assert hit.headers["etag"] == miss.headers["etag"]
+
+
+def test_matching_if_none_match_returns_304(fake_redis):
+    """测试携带匹配的 If-None-Match 时返回304且不带响应体"""
+    calls = []
+    app = _app(calls)
+    (first,) = _request_all(app, ("/items/1", {}))
+    (revalidated,) = _request_all(app, ("/items/1", {"if-none-match": first.headers["etag"]}))
+    assert revalidated.status_code == 304
+    assert revalidated.content == b""
+    assert revalidated.headers["etag"] == first.headers["etag"]
+    assert calls == [1]
+
+
+def test_no_store_and_set_cookie_not_cached(fake_redis):
+    """测试 no-store 和设置 Cookie 的响应不写入缓存"""
+    calls = []
+    responses = _request_all(
+        _app(calls),
+        ("/no-store", {}), ("/no-store", {}), ("/cookie", {}), ("/cookie", {}),
+    )
+    assert calls == ["no-store", "no-store", "cookie", "cookie"]
+    assert all("x-cache" not in response.headers for response in responses)
+
+
+def test_earlier_uncached_route_takes_precedence(fake_redis):
+    """测试路由表中靠前的未缓存路由优先匹配"""
+    calls = []
+    _request_all(_app(calls), ("/items/special", {}), ("/items/special", {}))
+    assert calls == ["special", "special"] 
\ No newline at end of file
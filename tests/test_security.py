@@ -0,0 +1,82 @@
+"""
+密码哈希测试
+
+测试线程池版本的密码校验、成本参数变化后的重新哈希和排队上限，以及已验证令牌缓存。
+"""
+
+import asyncio
+import threading
+from datetime import timedelta
+
+import pytest
+from passlib.context import CryptContext
+
+from src.core import security
+from src.core.cache import LocalCache
+from src.core.security import (
+    PasswordHasher, PasswordHasherBusy, create_access_token, verify_token,
+)
+
+
+def test_verify_and_update_rehashes_when_rounds_change(monkeypatch):
+    """测试旧成本参数的哈希校验通过并返回新哈希，新哈希不再需要更新"""
+    old_hash = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash("secret")
+    monkeypatch.setattr(
+        security, "pwd_context",
+        CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=5),
+    )
+    
+    ok, new_hash = asyncio.run(security.verify_and_update_password_async("secret", old_hash))
+    assert ok and new_hash is not None and "$05$" in new_hash
+    assert asyncio.run(security.verify_and_update_password_async("secret", new_hash)) == (True, None)
+    assert asyncio.run(security.verify_password_async("wrong", new_hash)) is False
+
+
+def test_password_hasher_rejects_when_queue_full():
+    """测试排队数达到上限时立即拒绝"""
+    hasher = PasswordHasher(workers=1, max_pending=0)
+    with pytest.raises(PasswordHasherBusy):
+        asyncio.run(hasher.run("hash", lambda: None))
+
+
+def test_password_hasher_shutdown_cancels_queued_work():
+    """测试关闭时取消排队中的任务，不等待正在执行的任务"""
+    hasher = PasswordHasher(workers=1, max_pending=10)
+    release = threading.Event()
+    
+    async def run():
+        running = asyncio.ensure_future(hasher.run("hash", release.wait))
+        queued = asyncio.ensure_future(hasher.run("hash", lambda: "done"))
+        await asyncio.sleep(0.05)
+        hasher.shutdown()
+        release.set()
+        return await asyncio.gather(running, queued, return_exceptions=True)
+    
+    running, queued = asyncio.run(run())
+    assert running is True
+    assert isinstance(queued, asyncio.CancelledError)
+    assert hasher.pending == 0 
+
+
+def test_verify_token_caches_valid_and_malformed_tokens(monkeypatch):
+    """测试同一令牌只验签一次，格式错误的令牌也被缓存，过期令牌不返回声明"""
+    monkeypatch.setattr(security, "token_cache", LocalCache(max_items=100, ttl=60))
+    decoded = []
+    original = security._decode_token
+    
+    def counting_decode(token):
+        decoded.append(token)
+        return original(token)
+    
+    monkeypatch.setattr(security, "_decode_token", counting_decode)
+    
+    token = create_access_token({"sub": "user-1"})
+    first = verify_token(token)
+    first["sub"] = "mutated"
+    assert verify_token(token)["sub"] == "user-1"
+    assert verify_token("not-a-token") is None
+    assert verify_token("not-a-token") is None
+    assert decoded == [token, "not-a-token"]
+    
+    expired = create_access_token({"sub": "user-1"}, expires_delta=timedelta(seconds=-1))
+    assert verify_token(expired) is None 
\ No newline at end of file
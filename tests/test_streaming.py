@@ -0,0 +1,113 @@
+"""
+流式导出测试
+
+测试 NDJSON 与 CSV 的分批编码，以及基于 SQLite 的分批流式查询。
+"""
+
+import asyncio
+import json
+from datetime import datetime
+
+import pytest
+from sqlalchemy import Column, Integer, String, insert, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import declarative_base
+
+from src.core.streaming import CSVEncoder, encode_ndjson, iter_query, stream_query
+
+ExportBase = declarative_base()
+
+
+class ExportRow(ExportBase):
+    __tablename__ = "export_rows"
+    
+    id = Column(Integer, primary_key=True)
+    name = Column(String(16))
+
+
+def test_encode_ndjson():
+    """测试每行一个JSON对象"""
+    rows = [{"id": 1, "at": datetime(2024, 1, 1)}, {"id": 2, "at": None}]
+    lines = encode_ndjson(rows).decode().splitlines()
+    assert [json.loads(line)["id"] for line in lines] == [1, 2]
+    assert json.loads(lines[0])["at"].startswith("2024-01-01T00:00:00")
+
+
+def test_csv_header_written_once():
+    """测试表头只在首个批次输出"""
+    encoder = CSVEncoder(["id", "name"])
+    first = encoder.encode([{"id": 1, "name": "a,b"}])
+    second = encoder.encode([{"id": 2, "name": "c"}])
+    assert first.decode().splitlines() == ["id,name", '1,"a,b"']
+    assert second.decode().splitlines() == ["2,c"]
+
+
+@pytest.fixture
+def run_export(tmp_path):
+    """在含25行数据的 SQLite 库上执行测试协程，传入记录所建会话的会话工厂"""
+    url = f"sqlite+aiosqlite:///{tmp_path / 'export.db'}"
+    
+    def run(test):
+        async def main():
+            engine = create_async_engine(url)
+            async with engine.begin() as conn:
+                await conn.run_sync(ExportBase.metadata.create_all)
+                await conn.execute(
+                    insert(ExportRow), [{"id": i, "name": f"row-{i}"} for i in range(25)]
+                )
+            factory = async_sessionmaker(engine)
+            sessions = []
+            
+            def session_factory():
+                sessions.append(factory())
+                return sessions[-1]
+            
+            try:
+                return await test(session_factory, sessions)
+            finally:
+                await engine.dispose()
+        return asyncio.run(main())
+    
+    return run
+
+
+def test_iter_query_csv_header_first_then_batches(run_export):
+    """测试CSV先单独发出表头，再按批次产出，已编码的实体不留在会话中"""
+    async def test(session_factory, sessions):
+        chunks, identity_sizes = [], []
+        async for chunk in iter_query(
+            select(ExportRow).order_by(ExportRow.id),
+            format="csv",
+            batch_size=10,
+            session_factory=session_factory,
+        ):
+            chunks.append(chunk)
+            identity_sizes.append(len(sessions[0].identity_map))
+        return chunks, identity_sizes
+    
+    chunks, identity_sizes = run_export(test)
+    assert chunks[0] == b"id,name\r\n"
+    assert [len(chunk.decode().splitlines()) for chunk in chunks[1:]] == [10, 10, 5]
+    assert chunks[1].decode().splitlines()[0] == "0,row-0"
+    assert identity_sizes == [0, 0, 0, 0]
+
+
+def test_stream_query_is_lazy(run_export):
+    """测试流式响应逐批读取：只消费第一批后关闭，不会读完整个结果"""
+    async def test(session_factory, sessions):
+        response = stream_query(
+            select(ExportRow.id, ExportRow.name).order_by(ExportRow.id),
+            batch_size=10,
+            filename="rows.ndjson",
+            session_factory=session_factory,
+        )
+        assert sessions == []
+        body = response.body_iterator
+        first = await body.__anext__()
+        await body.aclose()
+        return response, first
+    
+    response, first = run_export(test)
+    assert response.media_type == "application/x-ndjson"
+    assert response.headers["content-disposition"] == 'attachment; filename="rows.ndjson"'
+    assert [json.loads(line)["id"] for line in first.decode().splitlines()] == list(range(10)) 
\ No newline at end of file